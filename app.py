@@ -4,10 +4,11 @@ Suivi de consommation pour Fablab (Loritz)
 """
 
 from flask import Flask, render_template, request, jsonify
-from models import get_db, init_db, DATA_DIR
+from models import get_db, init_db, release_thread_connections, DATA_DIR
 from fabsuite_core.security import load_secret_key
 from routes import register_blueprints
-from routes.api_admin import check_auto_backup
+from routes.api_admin import start_backup_scheduler
+import instrumentation
 import os, logging
 
 # ── App Flask ──
@@ -22,6 +23,9 @@ app.secret_key = load_secret_key(DATA_DIR)
 # ── Enregistrement des blueprints ──
 register_blueprints(app)
 
+# ── Mesures HTTP / SQL (FABTRACK_METRICS=1) ──
+instrumentation.init_app(app)
+
 
 # ── Init DB au premier request ──
 _db_initialized = False
@@ -31,15 +35,22 @@ def ensure_db():
     global _db_initialized
     if _db_initialized and not app.config.get('_DB_NEEDS_REINIT'):
         return
-    # Toujours appeler init_db() — CREATE TABLE IF NOT EXISTS est safe
-    # et garantit que les nouvelles tables (ex: stock_*) sont créées
-    # même sur une DB existante.
+    # init_db() ne lit que PRAGMA user_version sur une base à jour ; après un
+    # import, les migrations manquantes de la base importée sont appliquées.
     init_db()
-    check_auto_backup()
+    # Sauvegardes automatiques : thread de fond, jamais dans le chemin de la requête
+    start_backup_scheduler()
     _db_initialized = True
     app.config.pop('_DB_NEEDS_REINIT', None)
 
 
+# ── Connexions SQLite rendues au pool en fin de requête ──
+
+@app.teardown_appcontext
+def release_db(exc):
+    release_thread_connections()
+
+
 # ── Error handlers ──
 
 @app.errorhandler(404)
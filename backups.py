@@ -0,0 +1,194 @@
+"""
+backups.py — Formats des fichiers .fabtrack (complets, compressés, incrémentaux)
+Un .fabtrack est reconnu à ses premiers octets :
+  - base SQLite brute (ancien format, toujours accepté) ;
+  - flux gzip ou xz (lzma) contenant soit une base complète, soit un delta.
+
+Delta (incrémental) : en-tête ``FABTRACK-DELTA 1`` + ligne JSON
+{"base", "page_size", "page_count"} puis, pour chaque page modifiée depuis la
+sauvegarde ``base``, son numéro (4 octets, gros-boutiste) et son contenu. Les
+instantanés de l'API de sauvegarde SQLite reproduisent la base page pour page :
+deux instantanés successifs ne diffèrent que par les pages réellement écrites.
+La restauration décompresse la sauvegarde complète de la chaîne puis rejoue
+chaque delta dans l'ordre.
+
+Pour décider quelles pages ont changé sans relire la sauvegarde précédente
+(souvent sur un partage réseau), on garde localement une empreinte par page
+du dernier instantané.
+"""
+
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import struct
+
+COMPRESSIONS = ('none', 'gzip', 'lzma')
+DELTA_MAGIC = b'FABTRACK-DELTA 1\n'
+_GZIP_MAGIC = b'\x1f\x8b'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_CHUNK = 1024 * 1024
+_PAGE_NO = struct.Struct('>I')
+
+
+class BackupChainError(Exception):
+    """Sauvegarde incrémentale dont une sauvegarde de base est introuvable ou illisible."""
+
+
+def _open_write(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'lzma':
+        return lzma.open(path, 'wb', preset=6)
+    return open(path, 'wb')
+
+
+def open_read(path):
+    """Ouvre un .fabtrack en lecture, décompressé à la volée."""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    if head.startswith(_GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if head.startswith(_XZ_MAGIC):
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _page_size(snapshot_path):
+    with open(snapshot_path, 'rb') as f:
+        header = f.read(18)
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _digest(page):
+    return hashlib.blake2b(page, digest_size=16).digest()
+
+
+def write_backup(snapshot_path, dest, compression='lzma', base=None, previous=None):
+    """Écrit ``dest`` depuis l'instantané local ``snapshot_path``, en un seul passage.
+
+    Avec ``base`` (nom du fichier précédent) et ``previous`` (ses empreintes
+    de pages), seules les pages modifiées sont écrites ; sinon copie complète.
+    Retourne {"page_size", "hashes", "pages_written"} pour l'état suivant.
+    """
+    page_size = _page_size(snapshot_path)
+    delta = base is not None and previous is not None and previous.get('page_size') == page_size
+    old = previous['hashes'] if delta else b''
+    hashes = bytearray()
+    written = 0
+    with open(snapshot_path, 'rb') as src, _open_write(dest + '.part', compression) as out:
+        if delta:
+            page_count = os.path.getsize(snapshot_path) // page_size
+            out.write(DELTA_MAGIC)
+            out.write(json.dumps({'base': base, 'page_size': page_size,
+                                  'page_count': page_count}).encode() + b'\n')
+        page_no = 0
+        while True:
+            page = src.read(page_size)
+            if not page:
+                break
+            page_no += 1
+            digest = _digest(page)
+            hashes += digest
+            if not delta:
+                out.write(page)
+                written += 1
+            elif old[(page_no - 1) * 16:page_no * 16] != digest:
+                out.write(_PAGE_NO.pack(page_no))
+                out.write(page)
+                written += 1
+    os.replace(dest + '.part', dest)
+    return {'page_size': page_size, 'hashes': bytes(hashes), 'pages_written': written}
+
+
+def read_header(path):
+    """Description d'un .fabtrack : {"kind": "full"|"delta", "compression", "base"}."""
+    with open(path, 'rb') as f:
+        raw = f.read(6)
+    compression = 'gzip' if raw.startswith(_GZIP_MAGIC) else 'lzma' if raw.startswith(_XZ_MAGIC) else 'none'
+    try:
+        with open_read(path) as f:
+            head = f.read(len(DELTA_MAGIC))
+            if head != DELTA_MAGIC:
+                return {'kind': 'full', 'compression': compression, 'base': None}
+            meta = json.loads(f.readline())
+    except (OSError, EOFError, lzma.LZMAError, ValueError):
+        return {'kind': 'invalid', 'compression': compression, 'base': None}
+    return {'kind': 'delta', 'compression': compression, 'base': meta['base'], **meta}
+
+
+def resolve_chain(path, folder):
+    """Fichiers à rejouer pour restaurer ``path`` : [complet, delta…, path]."""
+    chain = [path]
+    header = read_header(path)
+    while header['kind'] == 'delta':
+        base = os.path.join(folder, os.path.basename(header['base']))
+        if not os.path.exists(base) or base in chain:
+            raise BackupChainError(f"Sauvegarde de base introuvable : {header['base']}")
+        chain.insert(0, base)
+        header = read_header(base)
+    if header['kind'] != 'full':
+        raise BackupChainError(f"Sauvegarde illisible : {os.path.basename(chain[0])}")
+    return chain
+
+
+def restore(path, folder, out_path):
+    """Reconstitue dans ``out_path`` la base SQLite décrite par ``path`` (chaîne rejouée)."""
+    chain = resolve_chain(path, folder)
+    with open_read(chain[0]) as src, open(out_path, 'wb') as out:
+        shutil.copyfileobj(src, out, _CHUNK)
+    for delta_path in chain[1:]:
+        with open_read(delta_path) as src, open(out_path, 'r+b') as out:
+            src.read(len(DELTA_MAGIC))
+            meta = json.loads(src.readline())
+            page_size = meta['page_size']
+            while True:
+                raw = src.read(_PAGE_NO.size)
+                if not raw:
+                    break
+                page = src.read(page_size)
+                if len(raw) != _PAGE_NO.size or len(page) != page_size:
+                    raise BackupChainError(f"Sauvegarde tronquée : {os.path.basename(delta_path)}")
+                out.seek((_PAGE_NO.unpack(raw)[0] - 1) * page_size)
+                out.write(page)
+            out.truncate(meta['page_count'] * page_size)
+    return out_path
+
+
+def prune(folder, max_backups, keep=None):
+    """Supprime les plus anciennes chaînes (complète + ses deltas) au-delà de ``max_backups`` fichiers.
+
+    Une chaîne n'est supprimée qu'entière : un delta n'est jamais privé de sa
+    base. La chaîne contenant ``keep`` (dernière sauvegarde) est conservée.
+    """
+    files = sorted((os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.fabtrack')),
+                   key=os.path.getmtime)
+    chains, chain_of = [], {}
+    for fp in files:
+        header = read_header(fp)
+        base = os.path.join(folder, header['base']) if header['kind'] == 'delta' else None
+        if base in chain_of:
+            chain = chain_of[base]
+        else:
+            chain = []
+            chains.append(chain)
+        chain.append(fp)
+        chain_of[fp] = chain
+    total = len(files)
+    for chain in chains:
+        if total <= max_backups:
+            break
+        if keep and any(os.path.basename(fp) == keep for fp in chain):
+            continue
+        for fp in chain:
+            os.remove(fp)
+        total -= len(chain)
+
+
+def dependents(folder, filename):
+    """Noms des sauvegardes incrémentales construites directement sur ``filename``."""
+    return [f for f in os.listdir(folder) if f.endswith('.fabtrack')
+            and read_header(os.path.join(folder, f)).get('base') == filename]
@@ -0,0 +1,172 @@
+"""Benchmark de POST /api/consommations/batch selon la taille du lot.
+
+Compare, sur une base temporaire (référentiels par défaut + un article de
+stock par matériau) :
+  - « boucle par action » : l'ancienne implémentation (3 SELECT nom, un
+    INSERT et _decrease_stock_from_action par action, ~7 instructions) ;
+  - « ensembliste » : l'endpoint actuel (noms en cache, executemany,
+    stock agrégé).
+Les deux sont mesurés via le client de test Flask (l'ancienne boucle est
+montée sur une route de banc) : même surcoût HTTP/JSON de part et d'autre.
+On compte aussi les appels SQL par requête (execute / executemany) ; les
+triggers (agrégat journalier…) restent exécutés ligne à ligne dans les deux cas.
+
+Usage :
+    python benchmarks/bench_consommations_batch.py [--sizes 10 50 200] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify, request  # noqa: E402
+
+import app as app_module  # noqa: E402
+import models  # noqa: E402
+import routes.api_consommations  # noqa: E402
+from routes.api_consommations import _decrease_stock_from_action  # noqa: E402
+
+
+def _resolve_nom(db, table, id_val):
+    """Ancienne résolution : une requête par nom."""
+    if not id_val:
+        return ''
+    row = db.execute(f'SELECT nom FROM {table} WHERE id=?', (id_val,)).fetchone()
+    return row['nom'] if row else ''
+
+
+def legacy_batch():
+    """Ancien traitement : une série d'instructions par action."""
+    payload = request.get_json()
+    db = models.get_db()
+    try:
+        date_saisie = datetime.now().strftime('%Y-%m-%d %H:%M')
+        nom_prep = _resolve_nom(db, 'preparateurs', payload['preparateur_id'])
+        for action in payload['actions']:
+            nom_type = _resolve_nom(db, 'types_activite', action.get('type_activite_id'))
+            nom_mach = _resolve_nom(db, 'machines', action.get('machine_id'))
+            nom_mat = _resolve_nom(db, 'materiaux', action.get('materiau_id'))
+            cur = db.execute('''
+                INSERT INTO consommations (date_saisie, preparateur_id, type_activite_id, machine_id,
+                    materiau_id, nom_preparateur, nom_type_activite, nom_machine, nom_materiau,
+                    poids_grammes, commentaire)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?)
+            ''', (date_saisie, payload['preparateur_id'], action['type_activite_id'], action['machine_id'],
+                  action['materiau_id'], nom_prep, nom_type, nom_mach, nom_mat,
+                  action['poids_grammes'], action['commentaire']))
+            _decrease_stock_from_action(db, cur.lastrowid, action)
+        db.commit()
+        return jsonify({'success': True}), 201
+    finally:
+        db.close()
+
+
+def setup():
+    """Un article de stock par matériau ; retourne le préparateur et les choix possibles."""
+    db = models.get_db()
+    try:
+        prep = db.execute("INSERT INTO preparateurs (nom) VALUES ('Bench')").lastrowid
+        machines = [tuple(r) for r in db.execute('SELECT id, type_activite_id FROM machines')]
+        materiaux = [r[0] for r in db.execute('SELECT id FROM materiaux')]
+        for mat in materiaux:
+            db.execute("INSERT INTO stock_articles (nom, unite, quantite_actuelle, materiau_id) "
+                       "VALUES (?, 'g', 1e9, ?)", (f'Stock {mat}', mat))
+        db.commit()
+    finally:
+        db.close()
+    return prep, machines, materiaux
+
+
+def make_payload(size, prep, machines, materiaux):
+    actions = []
+    for _ in range(size):
+        machine_id, type_id = random.choice(machines)
+        actions.append({'type_activite_id': type_id, 'machine_id': machine_id,
+                        'materiau_id': random.choice(materiaux),
+                        'poids_grammes': round(random.uniform(5, 300), 1), 'commentaire': ''})
+    return {'preparateur_id': prep, 'actions': actions}
+
+
+_statements = [0]
+
+
+class _CountedConnection:
+    """Compte les appels execute/executemany (un executemany = un appel)."""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def execute(self, *args):
+        _statements[0] += 1
+        return self._db.execute(*args)
+
+    def executemany(self, *args):
+        _statements[0] += 1
+        return self._db.executemany(*args)
+
+
+def counted_get_db():
+    return _CountedConnection(_get_db())
+
+
+_get_db = models.get_db
+
+
+def statements(fn):
+    _statements[0] = 0
+    fn()
+    return _statements[0]
+
+
+def timed(fn, repeat):
+    fn()  # échauffement (cache de pages SQLite)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(1234)
+    tmpdir = tempfile.mkdtemp(prefix='fabtrack-bench-')
+    models.DATA_DIR = tmpdir
+    models.DB_PATH = os.path.join(tmpdir, 'bench.db')
+    app_module._db_initialized = True
+    models.get_db = routes.api_consommations.get_db = counted_get_db
+    app_module.app.add_url_rule('/bench/legacy-batch', 'bench_legacy_batch', legacy_batch, methods=['POST'])
+    client = app_module.app.test_client()
+    try:
+        models.init_db()
+        choices = setup()
+        print(f"{'actions':>8} | {'boucle par action':>24} | {'ensembliste':>24} | {'gain':>6}")
+        print('-' * 74)
+        for size in sorted(args.sizes):
+            payload = make_payload(size, *choices)
+            legacy = lambda: client.post('/bench/legacy-batch', json=payload)  # noqa: E731
+            batch = lambda: client.post('/api/consommations/batch', json=payload)  # noqa: E731
+            n_before, n_after = statements(legacy), statements(batch)
+            before, after = timed(legacy, args.repeat), timed(batch, args.repeat)
+            print(f'{size:>8} | {before:>8.2f} ms {n_before:>6} SQL | {after:>8.2f} ms {n_after:>6} SQL '
+                  f'| {before / after:>5.1f}x')
+    finally:
+        models.close_all_connections()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark du client Raise3D : urlopen (une connexion par requête) vs keep-alive.
+
+Relève N fois trois fausses imprimantes locales (tests/fake_raise3d.py) et
+compare la latence moyenne d'un relevé et le nombre de connexions TCP
+ouvertes côté imprimante.
+
+Usage :
+    python benchmarks/bench_raise3d_keepalive.py [--polls 50] [--latency 0.005]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from unittest import mock
+from urllib import request as urllib_req
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import raise3d  # noqa: E402
+from fake_raise3d import FakePrinter  # noqa: E402
+
+
+def _urlopen_get_json(ip, path, timeout):
+    """Ancien transport : une connexion TCP neuve par requête."""
+    with urllib_req.urlopen(f"{raise3d._base_url(ip)}{path}", timeout=timeout) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def run(polls, latency, keepalive):
+    raise3d._TOKEN_CACHE.clear()
+    raise3d.close_connections()
+    with FakePrinter(latency) as a, FakePrinter(latency) as b, FakePrinter(latency) as c:
+        printers = [a.printer_config("a"), b.printer_config("b"), c.printer_config("c")]
+        patch = mock.patch.object(raise3d, "_http_get_json", _urlopen_get_json) if not keepalive else mock.MagicMock()
+        with patch:
+            t0 = time.perf_counter()
+            for _ in range(polls):
+                raise3d.get_all_status(timeout=5, printers=printers)
+            elapsed = time.perf_counter() - t0
+        raise3d.close_connections()
+        return elapsed / polls * 1000, a.connections + b.connections + c.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help='latence simulée par requête (s)')
+    args = parser.parse_args()
+
+    print(f"{'transport':>10} | {'ms / relevé':>12} | {'connexions TCP':>14}")
+    print('-' * 44)
+    for label, keepalive in (('urlopen', False), ('keep-alive', True)):
+        ms, conns = run(args.polls, args.latency, keepalive)
+        print(f'{label:>10} | {ms:>12.2f} | {conns:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark de /api/stats/summary selon le volume de consommations.
+
+Compare, sur une base temporaire remplie de N consommations synthétiques :
+  - « 7 requêtes / table brute » : l'ancienne implémentation (sept requêtes
+    sur `consommations`, chacune rejoignant `types_activite`) ;
+  - « 1 passe / agrégat » : l'endpoint actuel (une seule requête sur
+    `consommations_daily_agg`), mesuré via le client de test Flask.
+
+Usage :
+    python benchmarks/bench_stats_summary.py [--rows 1000 10000 100000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+import models  # noqa: E402
+
+
+def legacy_summary(db, dd, df):
+    """Ancienne synthèse : sept requêtes sur la table brute."""
+    w = '1=1'; p = []
+    if dd: w += ' AND c.date_saisie >= ?'; p.append(dd)
+    if df: w += ' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59')
+    db.execute(f'SELECT COUNT(*) FROM consommations c WHERE {w}', p).fetchone()
+    db.execute(f'''SELECT t.nom,COUNT(*) as count FROM consommations c JOIN types_activite t
+                   ON c.type_activite_id=t.id WHERE {w} GROUP BY t.id ORDER BY count DESC''', p).fetchall()
+    db.execute(f'''SELECT p.nom,COUNT(*) as count FROM consommations c JOIN preparateurs p
+                   ON c.preparateur_id=p.id WHERE {w} GROUP BY p.id ORDER BY count DESC''', p).fetchall()
+    for unite, col in (('g', 'poids_grammes'), ('m²', 'surface_m2'), ('feuilles', 'nb_feuilles')):
+        db.execute(f'''SELECT COALESCE(SUM(c.{col}),0) FROM consommations c JOIN types_activite t
+                       ON c.type_activite_id=t.id WHERE t.unite_defaut=? AND {w}''', [unite] + p).fetchone()
+    db.execute(f'''SELECT SUM(CASE WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%Couleur%' THEN c.nb_feuilles ELSE 0 END),
+                          SUM(CASE WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%N&B%' THEN c.nb_feuilles ELSE 0 END)
+                   FROM consommations c JOIN types_activite t ON c.type_activite_id=t.id
+                   LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+                   WHERE t.unite_defaut='feuilles' AND {w}''', p).fetchone()
+
+
+def fill(n_rows, start):
+    """Insère n_rows consommations réparties sur un an à partir de `start`."""
+    db = models.get_db()
+    try:
+        types = [r[0] for r in db.execute('SELECT id FROM types_activite')]
+        machines = [r[0] for r in db.execute('SELECT id FROM machines')]
+        materiaux = [r[0] for r in db.execute('SELECT id FROM materiaux')]
+        for nom in ('Préparateur A', 'Préparateur B', 'Préparateur C'):
+            db.execute('INSERT OR IGNORE INTO preparateurs (nom) VALUES (?)', (nom,))
+        preps = [r[0] for r in db.execute('SELECT id FROM preparateurs')]
+        rows = []
+        for _ in range(n_rows):
+            d = start + timedelta(minutes=random.randint(0, 365 * 24 * 60))
+            rows.append((d.strftime('%Y-%m-%d %H:%M'), random.choice(preps), random.choice(types),
+                         random.choice(machines), random.choice(materiaux),
+                         round(random.uniform(5, 300), 1), round(random.uniform(0.01, 0.5), 4),
+                         random.randint(1, 40)))
+        db.executemany('''INSERT INTO consommations (date_saisie, preparateur_id, type_activite_id, machine_id,
+                          materiau_id, poids_grammes, surface_m2, nb_feuilles) VALUES (?,?,?,?,?,?,?,?)''', rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def timed(fn, repeat):
+    fn()  # échauffement (cache de pages SQLite)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(1234)
+    tmpdir = tempfile.mkdtemp(prefix='fabtrack-bench-')
+    models.DATA_DIR = tmpdir
+    models.DB_PATH = os.path.join(tmpdir, 'bench.db')
+    app_module._db_initialized = True
+    client = app_module.app.test_client()
+    start = datetime(2025, 1, 1)
+    dd, df = '2025-03-01', '2025-10-31'
+    try:
+        models.init_db()
+        print(f"{'lignes':>8} | {'7 requêtes / brut':>18} | {'1 passe / agrégat':>18} | {'gain':>6}")
+        print('-' * 62)
+        loaded = 0
+        for n in sorted(args.rows):
+            fill(n - loaded, start)
+            loaded = n
+            db = models.get_db()
+            try:
+                before = timed(lambda: legacy_summary(db, dd, df), args.repeat)
+            finally:
+                db.close()
+            after = timed(lambda: client.get(f'/api/stats/summary?date_debut={dd}&date_fin={df}'), args.repeat)
+            print(f'{n:>8} | {before:>15.2f} ms | {after:>15.2f} ms | {before / after:>5.1f}x')
+    finally:
+        models.close_all_connections()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
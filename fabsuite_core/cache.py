@@ -0,0 +1,118 @@
+"""
+fabsuite_core.cache — Cache LRU de résultats invalidé par version de données.
+
+Chaque entrée est mémorisée avec la version des données au moment du calcul
+(compteur fourni par l'app, ex. une génération d'écriture incrémentée à chaque
+commit). Une lecture ne renvoie l'entrée que si la version n'a pas bougé :
+tant que rien n'est écrit, les lectures répétées ne touchent pas la base.
+
+Usage :
+    from fabsuite_core.cache import ResultCache
+
+    cache = ResultCache(max_entries=256, version_fn=lambda: generation)
+
+    data = cache.get_or_compute(("widget", "stock-summary"), compute_fn)
+
+    @bp.route('/api/stats/summary')
+    @cache.cached_view
+    def api_stats_summary(): ...
+"""
+
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+
+class ResultCache:
+    """Cache LRU borné, thread-safe, avec compteurs hits / misses / evictions.
+
+    ``max_entries`` à 0 désactive le cache (tout est recalculé).
+    """
+
+    def __init__(self, max_entries=256, version_fn=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._version_fn = version_fn or (lambda: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute_fn):
+        """Retourne la valeur en cache pour ``key`` ou la calcule et la mémorise.
+
+        La version est lue *avant* le calcul : une écriture concurrente pendant
+        le calcul rend donc l'entrée immédiatement périmée au lieu de la figer.
+        """
+        if self._max_entries <= 0:
+            return compute_fn()
+        version = self._version_fn()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = compute_fn()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def cached_view(self, view):
+        """Décorateur de vue Flask : met en cache les réponses 200.
+
+        Clé : (endpoint, paramètres de requête triés). Le corps est mémorisé avec
+        le statut et les en-têtes (Content-Type, ETag, Cache-Control…), restitués
+        tels quels. Les réponses d'erreur et celles qui posent un cookie ne sont
+        jamais mémorisées.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))))
+
+            def compute():
+                resp = view(*args, **kwargs)
+                if (not isinstance(resp, Response) or resp.status_code != 200
+                        or 'Set-Cookie' in resp.headers):
+                    raise _Uncacheable(resp)
+                return resp.get_data(), resp.status, resp.headers.to_wsgi_list()
+
+            try:
+                body, status, headers = self.get_or_compute(key, compute)
+            except _Uncacheable as u:
+                return u.response
+            return Response(body, status=status, headers=headers)
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Compteurs du cache (pour supervision)."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+class _Uncacheable(Exception):
+    """Transporte une réponse non mémorisable (erreur, tuple) hors du calcul."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
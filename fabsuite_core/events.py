@@ -0,0 +1,92 @@
+"""
+fabsuite_core.events — Diffusion d'événements pour les flux Server-Sent Events.
+
+Un seul journal d'événements numérotés (séquence croissante) est partagé par
+tous les abonnés : chaque flux ne retient que le dernier numéro envoyé et
+attend qu'un plus récent soit publié. La mémoire ne dépend donc pas du nombre
+d'abonnés, et un client qui se reconnecte avec ``Last-Event-ID`` reçoit
+exactement les événements manqués tant qu'ils sont encore dans l'historique.
+
+Usage :
+    from fabsuite_core.events import EventBroker
+
+    broker = EventBroker(history=256, max_subscribers=32)
+    broker.publish("widget", {"id": "stock-low", "data": {...}})
+
+    if broker.subscribe():
+        try:
+            events = broker.wait(last_id, timeout=15)   # [] = rien de neuf
+        finally:
+            broker.unsubscribe()
+"""
+
+import json
+import threading
+from collections import deque
+
+
+class EventBroker:
+    """Journal borné d'événements + compteur d'abonnés (thread-safe)."""
+
+    def __init__(self, history=256, max_subscribers=32):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)  # (id, événement, données JSON)
+        self._seq = 0
+        self._max_subscribers = max_subscribers
+        self.subscribers = 0
+
+    @property
+    def last_id(self):
+        return self._seq
+
+    def publish(self, event, data):
+        """Ajoute un événement et réveille les abonnés ; retourne son numéro."""
+        payload = encode(data)
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, payload))
+            self._cond.notify_all()
+            return self._seq
+
+    def subscribe(self):
+        """Réserve une place d'abonné ; False si la limite est atteinte."""
+        with self._cond:
+            if self.subscribers >= self._max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers = max(0, self.subscribers - 1)
+
+    def since(self, last_id):
+        """Événements postérieurs à ``last_id``, ou None s'ils ne sont plus
+        (ou pas) dans l'historique — le client doit alors repartir d'un état complet."""
+        with self._cond:
+            return self._since(last_id)
+
+    def _since(self, last_id):
+        if last_id > self._seq:
+            return None  # numéro d'une exécution précédente du serveur
+        if last_id == self._seq:
+            return []
+        if not self._events or self._events[0][0] > last_id + 1:
+            return None
+        return [e for e in self._events if e[0] > last_id]
+
+    def wait(self, last_id, timeout):
+        """Attend (au plus ``timeout`` s) un événement postérieur à ``last_id``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_id, timeout)
+            return self._since(last_id)
+
+
+def encode(data):
+    """JSON compact d'un événement."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def format_sse(event_id, event, payload):
+    """Sérialise un événement au format text/event-stream."""
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
@@ -24,8 +24,26 @@ Usage :
     app.register_blueprint(fabsuite_bp)
 """
 
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
+
+from .events import EventBroker, encode, format_sse
+
+# Intervalle de vérification de change_version_fn tant qu'un flux est ouvert (secondes)
+STREAM_CHECK_INTERVAL = 1.0
+# Délai de reconnexion suggéré aux clients EventSource (millisecondes)
+STREAM_RETRY_MS = 5000
+# Threads partagés par toutes les requêtes /api/fabsuite/widgets pour les widgets io_bound
+WIDGET_IO_WORKERS = 4
+
+# Créé une fois par processus (threads démarrés à la demande) : pas de pool
+# de threads monté puis démonté à chaque requête.
+_widget_io_pool = ThreadPoolExecutor(max_workers=WIDGET_IO_WORKERS,
+                                     thread_name_prefix='fabsuite-widget')
 
 
 def create_fabsuite_blueprint(
@@ -39,7 +57,14 @@ def create_fabsuite_blueprint(
     widgets=None,
     notifications_fn=None,
     notification_types=None,
+    notifications_since_fn=None,
     health_fn=None,
+    metrics_fn=None,
+    widget_cache=True,
+    batch_scope=None,
+    change_version_fn=None,
+    stream_heartbeat=15,
+    stream_max_subscribers=4,
 ):
     """Crée un Blueprint Flask qui expose tous les endpoints FabSuite.
 
@@ -58,9 +83,37 @@ def create_fabsuite_blueprint(
             - fn (callable) : Fonction retournant les données du widget
             - description (str, opt) : Description courte
             - refresh_interval (int, opt) : Intervalle rafraîchissement (sec, défaut 60)
+            - io_bound (bool, opt) : Calcul dominé par des E/S externes ; exécuté
+              en parallèle des autres dans /api/fabsuite/widgets
         notifications_fn (callable, opt) : Fonction retournant liste de notifications
         notification_types (list[str], opt) : Types de notifications émises
+        notifications_since_fn (callable, opt) : Fonction (curseur | None)
+            retournant (notifications, nouveau curseur). Active le paramètre
+            ?since= de /api/fabsuite/notifications : seuls les changements
+            postérieurs au curseur sont renvoyés (résolues incluses, avec
+            resolved_at)
         health_fn (callable, opt) : Fonction retournant True si l'app est saine
+        metrics_fn (callable, opt) : Fonction retournant les mesures au format
+            texte Prometheus, servies par /api/fabsuite/metrics
+        widget_cache (bool, opt) : Met en cache chaque widget pendant son
+            refresh_interval (défaut True). Les appels simultanés sur un widget
+            expiré ne déclenchent qu'un seul calcul ; les réponses portent
+            Cache-Control (max-age = refresh_interval) et Age.
+        batch_scope (callable, opt) : Fabrique de context manager entourant le
+            calcul groupé de /api/fabsuite/widgets (ex. connexion DB partagée
+            par les widgets exécutés dans le thread de la requête)
+        change_version_fn (callable, opt) : Retourne un jeton de version des
+            données (ex. compteur d'écritures). Tant qu'un flux
+            /api/fabsuite/stream est ouvert, un changement de jeton déclenche le
+            recalcul des widgets et notifications et l'envoi de leurs deltas.
+            Les autres sources (ex. relevé d'imprimantes) appellent
+            ``bp.notify_change()`` sur le blueprint retourné.
+        stream_heartbeat (int, opt) : Secondes entre deux commentaires de
+            maintien de connexion sur le flux (défaut 15)
+        stream_max_subscribers (int, opt) : Flux simultanés acceptés ; au-delà,
+            503 + Retry-After (défaut 4). Chaque flux ouvert occupe un thread du
+            serveur WSGI pendant toute sa durée : rester nettement sous le nombre
+            de threads (waitress : 4 par défaut, option --threads)
     """
     from . import SUITE_SPEC_VERSION
 
@@ -71,8 +124,131 @@ def create_fabsuite_blueprint(
 
     # ── Index des fonctions widgets par ID ──
     _widget_fns = {}
+    _widget_ttls = {}
+    _io_bound = set()
     for w in _widgets:
         _widget_fns[w["id"]] = w["fn"]
+        _widget_ttls[w["id"]] = w.get("refresh_interval") or 60
+        if w.get("io_bound"):
+            _io_bound.add(w["id"])
+
+    # ── Cache des widgets : id -> (calculé_à monotonic, données) ──
+    _widget_cache = {}
+    # Un verrou par widget : un seul calcul à la fois, les autres attendent son résultat
+    _widget_locks = {wid: threading.Lock() for wid in _widget_fns}
+
+    def _cached_widget_data(widget_id):
+        """Retourne (données, âge en secondes) en recalculant au plus une fois par TTL."""
+        ttl = _widget_ttls[widget_id]
+        entry = _widget_cache.get(widget_id)
+        if entry and time.monotonic() - entry[0] < ttl:
+            return entry[1], time.monotonic() - entry[0]
+        with _widget_locks[widget_id]:
+            entry = _widget_cache.get(widget_id)
+            if entry and time.monotonic() - entry[0] < ttl:
+                return entry[1], time.monotonic() - entry[0]
+            data = _widget_fns[widget_id]()
+            _widget_cache[widget_id] = (time.monotonic(), data)
+            return data, 0.0
+
+    def _widget_data(widget_id):
+        return _cached_widget_data(widget_id) if widget_cache else (_widget_fns[widget_id](), 0.0)
+
+    def _fresh_widget_data(widget_id):
+        """Recalcule un widget sans attendre son TTL et met le cache à jour."""
+        with _widget_locks[widget_id]:
+            data = _widget_fns[widget_id]()
+            if widget_cache:
+                _widget_cache[widget_id] = (time.monotonic(), data)
+            return data
+
+    def _timed_widget(widget_id):
+        """Résultat isolé d'un widget pour l'endpoint groupé (jamais d'exception)."""
+        t0 = time.perf_counter()
+        try:
+            data, age = _widget_data(widget_id)
+            result = {"data": data, "age": int(age)}
+        except Exception:
+            result = {"error": "Widget error"}
+        result["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    # ── Flux d'événements : état poussé + veilleur de changements ──
+    _broker = EventBroker(max_subscribers=stream_max_subscribers)
+    _pushed = {"widgets": {}, "notifications": None}
+    _push_lock = threading.Lock()
+    _changed = threading.Event()
+    _watch_lock = threading.Lock()
+    _watcher = [None]
+
+    def _refresh_stream(changed=True):
+        """Publie les widgets et notifications modifiés depuis le dernier envoi.
+
+        Sur changement signalé (``changed``), chaque widget est recalculé sans
+        attendre son TTL (et son entrée de cache remplacée) : le flux suit les
+        écritures à la seconde. Sinon, seuls les widgets expirés du cache sont
+        relus, et les notifications ne le sont pas.
+        """
+        with _push_lock:
+            if changed or widget_cache:
+                for wid in _widget_fns:
+                    try:
+                        data = _fresh_widget_data(wid) if changed else _widget_data(wid)[0]
+                    except Exception:
+                        continue
+                    if _pushed["widgets"].get(wid) != data:
+                        _pushed["widgets"][wid] = data
+                        _broker.publish("widget", {"id": wid, "data": data})
+            if changed and notifications_fn:
+                try:
+                    notifs = notifications_fn()
+                except Exception:
+                    notifs = _pushed["notifications"]
+                if notifs != _pushed["notifications"]:
+                    _pushed["notifications"] = notifs
+                    _broker.publish("notifications", {"notifications": notifs})
+
+    def _stream_snapshot():
+        """Événements reconstituant l'état complet, et le numéro qu'ils représentent."""
+        _refresh_stream()
+        with _push_lock:
+            events = [("widget", {"id": wid, "data": data})
+                      for wid, data in _pushed["widgets"].items()]
+            if _pushed["notifications"] is not None:
+                events.append(("notifications", {"notifications": _pushed["notifications"]}))
+            return _broker.last_id, events
+
+    def _watch():
+        version = object()
+        while True:
+            with _watch_lock:
+                if not _broker.subscribers:
+                    _watcher[0] = None
+                    return
+            current = change_version_fn() if change_version_fn else None
+            changed = _changed.is_set() or current != version
+            if changed:
+                _changed.clear()
+                version = current
+            try:
+                # Sans changement signalé, seuls les widgets arrivés à expiration sont relus ;
+                # avec, tous sont recalculés (le cache de résultats borne le coût SQL)
+                _refresh_stream(changed)
+            except Exception:
+                pass
+            _changed.wait(STREAM_CHECK_INTERVAL)
+
+    def _ensure_watcher():
+        with _watch_lock:
+            if _watcher[0] is None:
+                _watcher[0] = threading.Thread(target=_watch, name=f"{app_id}-stream", daemon=True)
+                _watcher[0].start()
+
+    def notify_change():
+        """Signale un changement hors base (ex. nouveau relevé) aux flux ouverts."""
+        _changed.set()
+
+    bp.notify_change = notify_change
 
     # ── Manifest ──
     @bp.route('/api/fabsuite/manifest')
@@ -112,7 +288,9 @@ def create_fabsuite_blueprint(
             "uptime": uptime_seconds,
         }
 
-        if notifications_fn:
+        manifest["stream"] = {"endpoint": "/api/fabsuite/stream"}
+
+        if notifications_fn or notifications_since_fn:
             manifest["notifications"] = {
                 "endpoint": "/api/fabsuite/notifications",
                 "types": notification_types or ["info", "warning", "error"],
@@ -135,6 +313,12 @@ def create_fabsuite_blueprint(
         except Exception:
             return jsonify({"status": "error"}), 503
 
+    # ── Mesures (Prometheus) ──
+    if metrics_fn:
+        @bp.route('/api/fabsuite/metrics')
+        def fabsuite_metrics():
+            return Response(metrics_fn(), mimetype='text/plain; version=0.0.4')
+
     # ── Widget dynamique ──
     @bp.route('/api/fabsuite/widget/<widget_id>')
     def fabsuite_widget(widget_id):
@@ -142,16 +326,95 @@ def create_fabsuite_blueprint(
         if not fn:
             return jsonify({"error": f"Widget '{widget_id}' not found"}), 404
         try:
-            data = fn()
-            return jsonify(data)
+            if not widget_cache:
+                return jsonify(fn())
+            data, age = _cached_widget_data(widget_id)
         except Exception:
             return jsonify({"error": "Widget error"}), 500
+        resp = jsonify(data)
+        resp.headers['Cache-Control'] = f"public, max-age={_widget_ttls[widget_id]}"
+        resp.headers['Age'] = str(int(age))
+        return resp
+
+    # ── Widgets groupés ──
+    @bp.route('/api/fabsuite/widgets')
+    def fabsuite_widgets():
+        """Plusieurs widgets en une requête : ?ids=a,b,c (défaut : tous).
+
+        Les widgets io_bound partent en parallèle dans le pool de threads du
+        module (``WIDGET_IO_WORKERS``) ; les autres s'exécutent dans le thread
+        de la requête, sous ``batch_scope``.
+        Retourne {"widgets": {id: {"data", "age", "duration_ms"} | {"error", ...}}}.
+        """
+        ids_param = request.args.get('ids', '')
+        ids = [i for i in ids_param.split(',') if i] if ids_param else list(_widget_fns)
+        results = {i: {"error": f"Widget '{i}' not found"} for i in ids if i not in _widget_fns}
+        known = [i for i in ids if i in _widget_fns]
+        parallel = [i for i in known if i in _io_bound]
+        local = [i for i in known if i not in _io_bound]
+
+        futures = {i: _widget_io_pool.submit(_timed_widget, i) for i in parallel}
+        with batch_scope() if batch_scope else contextlib.nullcontext():
+            for i in local:
+                results[i] = _timed_widget(i)
+        for i, f in futures.items():
+            results[i] = f.result()
+        return jsonify({"widgets": results})
+
+    # ── Flux Server-Sent Events ──
+    @bp.route('/api/fabsuite/stream')
+    def fabsuite_stream():
+        """Pousse les deltas de widgets et notifications (text/event-stream).
+
+        Événements : ``widget`` {"id", "data"} et ``notifications``
+        {"notifications"}. À la connexion, l'état complet est envoyé ; avec
+        Last-Event-ID (ou ?last_event_id=), seuls les événements manqués le
+        sont, tant qu'ils sont dans l'historique. Un commentaire est émis toutes
+        les ``stream_heartbeat`` secondes sans événement.
+        """
+        raw_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_id = int(raw_id) if raw_id else None
+        except ValueError:
+            last_id = None
+        if not _broker.subscribe():
+            resp = jsonify({"error": "Too many stream subscribers"})
+            resp.status_code = 503
+            resp.headers['Retry-After'] = str(stream_heartbeat)
+            return resp
+        _ensure_watcher()
+
+        def generate():
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            cursor = last_id
+            missed = _broker.since(cursor) if cursor is not None else None
+            while True:
+                if missed is None:
+                    cursor, snapshot = _stream_snapshot()
+                    for event, data in snapshot:
+                        yield format_sse(cursor, event, encode(data))
+                elif not missed:
+                    yield ": heartbeat\n\n"
+                for event_id, event, payload in missed or ():
+                    yield format_sse(event_id, event, payload)
+                    cursor = event_id
+                missed = _broker.wait(cursor, stream_heartbeat)
+
+        resp = Response(generate(), mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        resp.headers['X-Accel-Buffering'] = 'no'
+        resp.call_on_close(_broker.unsubscribe)
+        return resp
 
     # ── Notifications ──
-    if notifications_fn:
+    if notifications_fn or notifications_since_fn:
         @bp.route('/api/fabsuite/notifications')
         def fabsuite_notifications():
             try:
+                if notifications_since_fn:
+                    since = request.args.get('since', type=int)
+                    notifs, cursor = notifications_since_fn(since)
+                    return jsonify({"notifications": notifs, "cursor": cursor})
                 notifs = notifications_fn()
                 return jsonify({"notifications": notifs})
             except Exception:
@@ -0,0 +1,102 @@
+"""
+fabsuite_core.metrics — Compteurs et histogrammes au format texte Prometheus.
+
+Usage :
+    from fabsuite_core.metrics import MetricsRegistry
+
+    metrics = MetricsRegistry()
+    metrics.histogram("app_http_request_duration_seconds", "Durée des requêtes",
+                      buckets=(0.01, 0.05, 0.1, 0.5, 1))
+    metrics.counter("app_sql_statements_total", "Instructions SQL exécutées")
+
+    metrics.observe("app_http_request_duration_seconds", 0.042, {"endpoint": "index"})
+    metrics.inc("app_sql_statements_total", {"statement": "SELECT 1"})
+
+    text = metrics.render()   # servi par /api/fabsuite/metrics
+"""
+
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsRegistry:
+    """Séries étiquetées en mémoire (thread-safe). Les noms doivent être déclarés."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}    # nom -> (type, aide, bornes)
+        self._series = {}  # nom -> {étiquettes triées: valeur | [compteurs par borne, somme, effectif]}
+
+    def counter(self, name, help_text):
+        self._declare(name, "counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._declare(name, "histogram", help_text, tuple(sorted(buckets)))
+
+    def _declare(self, name, kind, help_text, buckets):
+        with self._lock:
+            self._meta[name] = (kind, help_text, buckets)
+            self._series.setdefault(name, {})
+
+    def inc(self, name, labels=None, value=1):
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = tuple(sorted(labels.items())) if labels else ()
+        buckets = self._meta[name][2]
+        with self._lock:
+            series = self._series[name]
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+
+    def render(self):
+        """Exposition texte Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in self._series[name].items():
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(key)} {_num(value)}")
+                        continue
+                    counts, total, n = value
+                    cumulative = 0
+                    for bound, c in zip(buckets, counts):
+                        cumulative += c
+                        lines.append(f"{name}_bucket{_labels(key, ('le', _num(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key, ('le', '+Inf'))} {n}")
+                    lines.append(f"{name}_sum{_labels(key)} {_num(total)}")
+                    lines.append(f"{name}_count{_labels(key)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,156 @@
+"""
+instrumentation.py — Mesures de latence HTTP et SQL (Prometheus)
+Activée par FABTRACK_METRICS=1 ; désactivée, rien n'est branché : ni hook
+Flask, ni curseur instrumenté (les connexions du pool gardent leur classe
+d'origine).
+
+Mesures :
+  - fabtrack_http_request_duration_seconds{endpoint,method,status} (histogramme)
+  - fabtrack_http_request_sql_statements / _sql_seconds : SQL par requête HTTP
+  - fabtrack_sql_statements_total / fabtrack_sql_seconds_total{statement}
+    (listes IN (?, ?, …) ramenées à IN (?), scripts sous le libellé « executescript »,
+    pour garder un nombre de séries borné)
+Les instructions plus lentes que FABTRACK_SLOW_QUERY_MS (défaut 250, 0 = jamais)
+sont journalisées avec l'endpoint en cours.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from fabsuite_core.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("FABTRACK_METRICS", "0").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("FABTRACK_SLOW_QUERY_MS", "250"))
+
+registry = MetricsRegistry()
+registry.histogram("fabtrack_http_request_duration_seconds", "Durée des requêtes HTTP par endpoint")
+registry.histogram("fabtrack_http_request_sql_statements", "Instructions SQL exécutées par requête HTTP",
+                   buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+registry.histogram("fabtrack_http_request_sql_seconds", "Temps passé en SQL par requête HTTP")
+registry.counter("fabtrack_sql_statements_total", "Exécutions par instruction SQL")
+registry.counter("fabtrack_sql_seconds_total", "Temps cumulé (exécution + lecture) par instruction SQL")
+
+_local = threading.local()
+
+SCRIPT_LABEL = "executescript"
+_IN_LIST = re.compile(r"\bIN\s*\(\s*(?:\?|-?\d+)(?:\s*,\s*(?:\?|-?\d+))*\s*\)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _normalize(sql):
+    return _IN_LIST.sub("IN (?)", " ".join(sql.split()))[:200]
+
+
+def _record(sql, elapsed, executed=True):
+    statement = _normalize(sql)
+    labels = {"statement": statement}
+    if executed:
+        registry.inc("fabtrack_sql_statements_total", labels)
+    registry.inc("fabtrack_sql_seconds_total", labels, elapsed)
+    current = getattr(_local, "request", None)
+    if current is not None:
+        current[0] += executed
+        current[1] += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        endpoint = getattr(_local, "endpoint", None) or "-"
+        phase = "exécution" if executed else "lecture"
+        logger.warning(f"Requête SQL lente ({elapsed * 1000:.0f} ms, {phase}, {endpoint}) : {statement}")
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Curseur qui chronomètre exécution et lecture (fetchone/fetchmany/fetchall,
+    itération directe ``for row in db.execute(...)``) de chaque instruction."""
+
+    _sql = ""
+
+    def execute(self, sql, *args):
+        self._sql = sql
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _record(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, *args):
+        self._sql = sql
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _record(sql, time.perf_counter() - t0)
+
+    def executescript(self, script):
+        self._sql = SCRIPT_LABEL
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            _record(SCRIPT_LABEL, time.perf_counter() - t0)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record(self._sql, time.perf_counter() - t0, executed=False)
+
+    def fetchmany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            _record(self._sql, time.perf_counter() - t0, executed=False)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record(self._sql, time.perf_counter() - t0, executed=False)
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record(self._sql, time.perf_counter() - t0, executed=False)
+
+
+def init_app(app):
+    """Branche les hooks de mesure sur ``app`` (sans effet si désactivé)."""
+    if not ENABLED:
+        return
+    from flask import request
+
+    @app.before_request
+    def _metrics_start():
+        _local.request = [0, 0.0, time.perf_counter()]
+        _local.endpoint = request.endpoint
+
+    @app.after_request
+    def _metrics_status(response):
+        _local.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_stop(exc):
+        current = getattr(_local, "request", None)
+        if current is None:
+            return
+        _local.request = None
+        status = 500 if exc is not None else (getattr(_local, "status", None) or 200)
+        _local.status = None
+        labels = {"endpoint": request.endpoint or "unmatched", "method": request.method,
+                  "status": str(status)}
+        registry.observe("fabtrack_http_request_duration_seconds",
+                         time.perf_counter() - current[2], labels)
+        endpoint = {"endpoint": labels["endpoint"]}
+        registry.observe("fabtrack_http_request_sql_statements", current[0], endpoint)
+        registry.observe("fabtrack_http_request_sql_seconds", current[1], endpoint)
@@ -6,30 +6,465 @@ Matériaux liés aux machines via table de jonction (pas de doublons).
 Consommations dénormalisées (noms en brut) pour résilience aux suppressions.
 """
 
+import logging
 import sqlite3
 import os
 import random
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from fabsuite_core.cache import ResultCache
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 DB_PATH = os.path.join(DATA_DIR, 'fabtrack.db')
 
+# Attente max (ms) quand la base est verrouillée par un autre écrivain
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('FABTRACK_DB_BUSY_TIMEOUT_MS', '5000'))
+# Nombre max de connexions inactives conservées dans le pool
+DB_POOL_SIZE = int(os.environ.get('FABTRACK_DB_POOL_SIZE', '8'))
+# Nombre max de résultats mémorisés par le cache de lecture (0 = désactivé)
+RESULT_CACHE_SIZE = int(os.environ.get('FABTRACK_RESULT_CACHE_SIZE', '256'))
+# Pages copiées par étape de sauvegarde (entre deux étapes, la base n'est pas verrouillée)
+BACKUP_PAGES_PER_STEP = int(os.environ.get('FABTRACK_BACKUP_PAGES_PER_STEP', '256'))
+# Relances (écritures concurrentes) tolérées avant de copier la base en une seule étape
+BACKUP_MAX_RESTARTS = int(os.environ.get('FABTRACK_BACKUP_MAX_RESTARTS', '3'))
+
+
+# ============================================================
+# CONNEXIONS (pool)
+# ============================================================
+
+class PooledConnection(sqlite3.Connection):
+    """Connexion SQLite pré-configurée dont close() la rend au pool.
+
+    Les appelants gardent le schéma habituel ``db = get_db() ... db.close()`` :
+    la connexion n'est réellement fermée que si le pool la rejette.
+    """
+
+    _pool = None
+    _owner = None
+    _changes_mark = 0
+    _shared = False
+
+    def commit(self):
+        super().commit()
+        self._note_writes()
+
+    def commit_untracked(self):
+        """Valide sans avancer la génération d'écriture (données dérivées, ex. notifications)."""
+        super().commit()
+        self._changes_mark = self.total_changes
+
+    def close(self):
+        if self._shared:
+            return  # rendue par end_shared()
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def _note_writes(self):
+        """Incrémente la génération d'écriture si des lignes ont changé depuis le dernier relevé."""
+        changes = self.total_changes
+        if changes != self._changes_mark:
+            self._changes_mark = changes
+            _bump_write_generation()
+
+    def really_close(self):
+        self._pool = None
+        self._owner = None
+        try:
+            super().close()
+        except sqlite3.Error:
+            pass
+
+
+class InstrumentedConnection(PooledConnection):
+    """PooledConnection dont les curseurs chronomètrent chaque instruction (FABTRACK_METRICS=1)."""
+
+    def cursor(self, factory=instrumentation.TimedCursor):
+        return super().cursor(factory)
+
+    # Les raccourcis de sqlite3.Connection créent leur curseur en C, sans passer par cursor()
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+class ConnectionPool:
+    """Pool LIFO de connexions SQLite partagé entre les threads waitress.
+
+    - PRAGMA (WAL, foreign_keys, busy_timeout) appliqués une seule fois à l'ouverture
+    - vérification de santé à chaque emprunt (SELECT 1)
+    - transaction en cours annulée au retour dans le pool
+    - nombre de connexions inactives borné par ``max_idle``
+    """
+
+    def __init__(self, max_idle=DB_POOL_SIZE):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._max_idle = max_idle
+        self._epoch = 0
+        self._local = threading.local()
+
+    def _open(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False,
+                               factory=InstrumentedConnection if instrumentation.ENABLED else PooledConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn._pool = self
+        conn._db_path = path
+        conn._epoch = self._epoch
+        return conn
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checked_out(self):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = []
+        return conns
+
+    def acquire(self, path):
+        """Emprunte une connexion saine vers ``path`` (réutilisée ou neuve)."""
+        shared = getattr(self._local, 'shared', None)
+        if shared is not None and shared._db_path == path:
+            return shared
+        conn = None
+        while conn is None:
+            with self._lock:
+                candidate = self._idle.pop() if self._idle else None
+            if candidate is None:
+                conn = self._open(path)
+            elif (candidate._db_path == path and candidate._epoch == self._epoch
+                  and self._healthy(candidate)):
+                conn = candidate
+            else:
+                candidate.really_close()
+        conn._changes_mark = conn.total_changes
+        conn._owner = self._checked_out()
+        conn._owner.append(conn)
+        if getattr(self._local, 'sharing', False) and shared is None:
+            conn._shared = True
+            self._local.shared = conn
+        return conn
+
+    def release(self, conn):
+        """Rend une connexion au pool (idempotent : un second close() est ignoré)."""
+        owner = conn._owner
+        if owner is None:
+            return
+        conn._owner = None
+        if conn in owner:
+            owner.remove(conn)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.really_close()
+            _bump_write_generation()
+            return
+        # Écritures validées hors commit() explicite (executescript, DDL…)
+        conn._note_writes()
+        with self._lock:
+            if conn._epoch == self._epoch and len(self._idle) < self._max_idle:
+                self._idle.append(conn)
+                return
+        conn.really_close()
+
+    def begin_shared(self):
+        """Les prochains acquire() du thread courant renverront une seule et même connexion."""
+        self._local.sharing = True
+        self._local.shared = None
+
+    def end_shared(self):
+        conn = getattr(self._local, 'shared', None)
+        self._local.sharing = False
+        self._local.shared = None
+        if conn is not None:
+            conn._shared = False
+            self.release(conn)
+
+    def release_thread_connections(self):
+        """Rend au pool les connexions empruntées par le thread courant et non fermées."""
+        for conn in list(self._checked_out()):
+            self.release(conn)
+
+    def close_all(self):
+        """Ferme les connexions inactives et invalide celles en cours d'emprunt.
+
+        À appeler quand le fichier de base est remplacé (import de sauvegarde).
+        """
+        with self._lock:
+            self._epoch += 1
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.really_close()
+        _bump_write_generation()
+
+
+# Génération d'écriture : incrémentée à chaque commit qui modifie des lignes
+# (via une connexion du pool) et au remplacement du fichier de base. Les
+# résultats mis en cache sont datés par elle, sans requête SQLite.
+_write_generation = 0
+_generation_lock = threading.Lock()
+
+
+def _bump_write_generation():
+    global _write_generation
+    with _generation_lock:
+        _write_generation += 1
+
+
+def data_generation():
+    """Génération d'écriture courante (change dès qu'une écriture est validée)."""
+    return _write_generation
+
+
+_pool = ConnectionPool()
+
 
 def get_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    return conn
+    """Retourne une connexion du pool (à rendre avec ``close()``)."""
+    return _pool.acquire(DB_PATH)
+
+
+@contextmanager
+def shared_connection():
+    """Fait partager une connexion (empruntée au premier get_db()) à tout le thread courant.
+
+    Pour les lectures groupées : les ``close()`` intermédiaires sont ignorés,
+    la connexion est rendue au pool à la sortie du bloc.
+    """
+    _pool.begin_shared()
+    try:
+        yield
+    finally:
+        _pool.end_shared()
+
+
+def begin_immediate(db):
+    """Ouvre une transaction d'écriture immédiate (BEGIN IMMEDIATE) si aucune n'est en cours.
+
+    Le verrou d'écriture est pris tout de suite (attente bornée par busy_timeout) :
+    les lectures suivantes voient la dernière version validée et aucun autre
+    écrivain ne s'intercale avant le commit. À utiliser pour les
+    lecture-modification-écriture (stock).
+    """
+    if not db.in_transaction:
+        db.execute('BEGIN IMMEDIATE')
+
+
+def release_thread_connections():
+    """Hook de fin de requête : rend les connexions oubliées par le handler."""
+    _pool.release_thread_connections()
+
+
+def close_all_connections():
+    """Ferme toutes les connexions du pool (remplacement du fichier de base)."""
+    _pool.close_all()
+    _database_replaced()
+
+
+_replaced_hooks = []
+
+
+def on_database_replaced(fn):
+    """Enregistre ``fn()``, appelée après un import ou une réinitialisation de la base.
+
+    Pour les caches en mémoire qui ne se déduisent pas de la génération d'écriture.
+    """
+    _replaced_hooks.append(fn)
+    return fn
+
+
+def _database_replaced():
+    reference_names.clear()
+    for fn in _replaced_hooks:
+        fn()
+
+
+class _BackupRestarting(Exception):
+    """Trop de relances de la copie par étapes : interrompt sqlite3.Connection.backup()."""
+
+
+def backup_database(dest, progress=None, pause=0.0):
+    """Instantané cohérent de la base vers ``dest`` (API de sauvegarde SQLite).
+
+    Contrairement à une copie de fichier, le contenu du journal WAL est inclus.
+    La copie se fait par étapes de BACKUP_PAGES_PER_STEP pages ; les écrivains
+    ne sont jamais bloqués longtemps (une écriture concurrente relance la copie
+    à l'étape suivante). ``progress(pages_copiées, pages_totales)`` est appelé
+    après chaque étape ; ``pause`` (secondes) espace les étapes pour limiter le
+    débit disque des sauvegardes de fond. Sur une base très sollicitée, la copie
+    pourrait être relancée indéfiniment : après BACKUP_MAX_RESTARTS relances
+    (pages restantes qui remontent), elle est refaite en une seule étape, sous
+    une seule transaction de lecture (WAL : les écrivains ne sont pas bloqués).
+    Le fichier produit est autonome (journal DELETE), vérifié
+    par PRAGMA integrity_check, puis renommé en ``dest`` ; sinon DatabaseError.
+    """
+    tmp = dest + '.part'
+    src = get_db()
+    try:
+        target = sqlite3.connect(tmp)
+        try:
+            restarts = 0
+            last = [None]
+
+            def _step(status, remaining, total):
+                nonlocal restarts
+                if last[0] is not None and remaining >= last[0]:
+                    restarts += 1
+                    if restarts > BACKUP_MAX_RESTARTS:
+                        raise _BackupRestarting()
+                last[0] = remaining
+                if progress:
+                    progress(total - remaining, total)
+                if pause and remaining:
+                    time.sleep(pause)
+            try:
+                src.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=_step)
+            except _BackupRestarting:
+                logger.warning(f'Sauvegarde relancée {restarts - 1} fois par des écritures : '
+                               f'copie en une seule étape')
+                src.backup(target, pages=-1)
+                if progress:
+                    total = target.execute('PRAGMA page_count').fetchone()[0]
+                    progress(total, total)
+            target.execute('PRAGMA journal_mode=DELETE')
+            check = target.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            target.close()
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        src.close()
+    if check != 'ok':
+        os.remove(tmp)
+        raise sqlite3.DatabaseError(f'Sauvegarde invalide (integrity_check : {check})')
+    os.replace(tmp, dest)
+    return dest
+
+
+# Cache des résultats de lecture (stats, référentiels, widgets FabSuite)
+result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE, version_fn=data_generation)
+
+
+# Tables de référence dont le nom est recopié dans les consommations
+REFERENCE_TABLES = ('preparateurs', 'types_activite', 'machines', 'classes', 'referents', 'materiaux')
+
+
+class ReferenceNameCache:
+    """Noms des référentiels par id, en mémoire, partagés entre les threads waitress.
+
+    Chaque table de référence a un numéro de version (table ``reference_versions``,
+    migration 7) incrémenté par trigger à chaque insertion, suppression ou
+    renommage. La génération d'écriture sert de garde : sans écriture validée
+    depuis le dernier contrôle, aucune requête ; sinon une lecture des versions,
+    et seules les tables modifiées sont rechargées (en une seule requête). Une
+    connexion en cours de transaction peut voir des renommages non validés :
+    elle n'alimente pas le cache.
+
+    Invalidation propre au processus, comme ``result_cache`` : la génération
+    n'avance qu'avec les commits passés par le pool de ce processus. Une écriture
+    faite par un autre processus (script, second serveur) n'est vue qu'à la
+    prochaine écriture locale ou après close_all_connections().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None  # (chemin de la base, génération contrôlée, {table: (version, {id: nom})})
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+
+    def names(self, db, table):
+        """{id: nom} de ``table`` (dictionnaire partagé : lecture seule)."""
+        path = getattr(db, '_db_path', None)
+        state = self._state
+        if (state is not None and state[0] == path and state[1] == data_generation()
+                and not db.in_transaction):
+            return state[2][table][1]
+        with self._lock:
+            generation = data_generation()
+            versions = dict(db.execute('SELECT tbl, version FROM reference_versions').fetchall())
+            tables = dict(self._state[2]) if self._state is not None and self._state[0] == path else {}
+            stale = [t for t in REFERENCE_TABLES if t not in tables or tables[t][0] != versions.get(t)]
+            if stale:
+                loaded = {t: {} for t in stale}
+                for t, row_id, nom in db.execute(' UNION ALL '.join(
+                        f"SELECT '{t}', id, nom FROM {t}" for t in stale)):
+                    loaded[t][row_id] = nom
+                if db.in_transaction:
+                    return loaded[table] if table in loaded else tables[table][1]
+                for t in stale:
+                    tables[t] = (versions.get(t), loaded[t])
+            self._state = (path, generation, tables)
+            return tables[table][1]
+
+
+reference_names = ReferenceNameCache()
 
 
 # ============================================================
 # INITIALISATION & MIGRATION
 # ============================================================
 
-def init_db():
+# Les migrations sont numérotées et appliquées dans l'ordre ; la dernière
+# version appliquée est mémorisée dans PRAGMA user_version. Une base à jour
+# ne coûte donc qu'une lecture de PRAGMA au démarrage.
+_init_lock = threading.Lock()
+
+
+def init_db(force=False):
+    """Applique les migrations manquantes (``force`` : rejoue tout depuis 0)."""
     conn = get_db()
+    try:
+        current = 0 if force else conn.execute('PRAGMA user_version').fetchone()[0]
+        if current >= SCHEMA_VERSION:
+            return
+        with _init_lock:
+            if not force:
+                current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, step in _MIGRATIONS:
+                if version <= current:
+                    continue
+                step(conn)
+                conn.execute(f'PRAGMA user_version={version}')
+                conn.commit()
+        print(f"[FabTrack] Base de données initialisée (schéma v{SCHEMA_VERSION}).")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _migration_001_schema_initial(conn):
+    """Schéma de base + rattrapage des anciennes bases (colonnes, noms dénormalisés)."""
     c = conn.cursor()
 
     c.executescript('''
@@ -269,15 +704,340 @@ def init_db():
     _insert_reference_data(c)
     _insert_stock_reference_data(c)
     conn.commit()
-    conn.close()
 
     # Table parametres (fabsuite_core)
     from fabsuite_core.config import ensure_parametres_table
-    conn2 = get_db()
-    ensure_parametres_table(conn2)
-    conn2.close()
+    ensure_parametres_table(conn)
+
+
+def _migration_002_index_pagination(conn):
+    """Index (date_saisie, id) pour la pagination par curseur de l'historique.
+
+    Remplace idx_conso_date : même préfixe, donc les filtres par date restent servis.
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conso_date_id ON consommations(date_saisie, id)')
+    conn.execute('DROP INDEX IF EXISTS idx_conso_date')
+
+
+# ── Agrégat journalier des consommations (statistiques) ──
+# Une ligne par jour × heure × type × machine × matériau × préparateur × classe
+# × catégorie d'impression papier, tenue à jour par triggers. Les clés NULL
+# sont stockées à 0 (et l'heure inconnue à -1) pour que l'UPSERT fonctionne.
+
+_DAILY_AGG_KEY = ('jour', 'heure', 'type_activite_id', 'machine_id', 'materiau_id',
+                  'preparateur_id', 'classe_id', 'impression')
+
+
+def _daily_agg_key_exprs(ref):
+    """Expressions SQL des clés d'agrégat pour une ligne ``ref`` (NEW, OLD ou c)."""
+    nom_mat = (f"COALESCE((SELECT nom FROM materiaux WHERE id={ref}.materiau_id), "
+               f"{ref}.nom_materiau)")
+    return (
+        f"substr({ref}.date_saisie, 1, 10)",
+        f"COALESCE(CAST(strftime('%H', {ref}.date_saisie) AS INTEGER), -1)",
+        f"COALESCE({ref}.type_activite_id, 0)",
+        f"COALESCE({ref}.machine_id, 0)",
+        f"COALESCE({ref}.materiau_id, 0)",
+        f"COALESCE({ref}.preparateur_id, 0)",
+        f"COALESCE({ref}.classe_id, 0)",
+        f"CASE WHEN {nom_mat} LIKE '%Couleur%' THEN 'Couleur' "
+        f"WHEN {nom_mat} LIKE '%N&B%' THEN 'N&B' ELSE '' END",
+    )
+
+
+def _daily_agg_add_sql(ref):
+    keys = _daily_agg_key_exprs(ref)
+    return f'''
+        INSERT INTO consommations_daily_agg
+            ({', '.join(_DAILY_AGG_KEY)}, nb, poids_grammes, surface_m2, nb_feuilles)
+        VALUES ({', '.join(keys)}, 1, COALESCE({ref}.poids_grammes, 0),
+                COALESCE({ref}.surface_m2, 0), COALESCE({ref}.nb_feuilles, 0))
+        ON CONFLICT({', '.join(_DAILY_AGG_KEY)}) DO UPDATE SET
+            nb = nb + 1,
+            poids_grammes = poids_grammes + excluded.poids_grammes,
+            surface_m2 = surface_m2 + excluded.surface_m2,
+            nb_feuilles = nb_feuilles + excluded.nb_feuilles;
+    '''
+
+
+def _daily_agg_remove_sql(ref):
+    keys = _daily_agg_key_exprs(ref)
+    match = ' AND '.join(f'{col} = {expr}' for col, expr in zip(_DAILY_AGG_KEY, keys))
+    return f'''
+        UPDATE consommations_daily_agg SET
+            nb = nb - 1,
+            poids_grammes = poids_grammes - COALESCE({ref}.poids_grammes, 0),
+            surface_m2 = surface_m2 - COALESCE({ref}.surface_m2, 0),
+            nb_feuilles = nb_feuilles - COALESCE({ref}.nb_feuilles, 0)
+        WHERE {match};
+        DELETE FROM consommations_daily_agg WHERE nb <= 0 AND {match};
+    '''
+
+
+def _daily_agg_rebuild_sql(where='1=1'):
+    keys = _daily_agg_key_exprs('c')
+    return f'''
+        INSERT INTO consommations_daily_agg
+            ({', '.join(_DAILY_AGG_KEY)}, nb, poids_grammes, surface_m2, nb_feuilles)
+        SELECT {', '.join(f'{e} AS k{i}' for i, e in enumerate(keys))},
+               COUNT(*), COALESCE(SUM(c.poids_grammes), 0),
+               COALESCE(SUM(c.surface_m2), 0), COALESCE(SUM(c.nb_feuilles), 0)
+        FROM consommations c WHERE {where}
+        GROUP BY {', '.join(f'k{i}' for i in range(len(keys)))};
+    '''
+
+
+def rebuild_daily_agg(conn):
+    """Recalcule entièrement consommations_daily_agg depuis consommations."""
+    conn.execute('DELETE FROM consommations_daily_agg')
+    conn.execute(_daily_agg_rebuild_sql())
+
+
+def _migration_003_daily_agg(conn):
+    """Table d'agrégat journalier + triggers de maintenance incrémentale."""
+    conn.executescript(f'''
+        CREATE TABLE IF NOT EXISTS consommations_daily_agg (
+            jour TEXT NOT NULL,
+            heure INTEGER NOT NULL,
+            type_activite_id INTEGER NOT NULL,
+            machine_id INTEGER NOT NULL,
+            materiau_id INTEGER NOT NULL,
+            preparateur_id INTEGER NOT NULL,
+            classe_id INTEGER NOT NULL,
+            impression TEXT NOT NULL,
+            nb INTEGER NOT NULL DEFAULT 0,
+            poids_grammes REAL NOT NULL DEFAULT 0,
+            surface_m2 REAL NOT NULL DEFAULT 0,
+            nb_feuilles INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({', '.join(_DAILY_AGG_KEY)})
+        ) WITHOUT ROWID;
+
+        DROP TRIGGER IF EXISTS trg_conso_agg_insert;
+        CREATE TRIGGER trg_conso_agg_insert AFTER INSERT ON consommations
+        BEGIN
+            {_daily_agg_add_sql('NEW')}
+        END;
+
+        DROP TRIGGER IF EXISTS trg_conso_agg_delete;
+        CREATE TRIGGER trg_conso_agg_delete AFTER DELETE ON consommations
+        BEGIN
+            {_daily_agg_remove_sql('OLD')}
+        END;
+
+        DROP TRIGGER IF EXISTS trg_conso_agg_update;
+        CREATE TRIGGER trg_conso_agg_update AFTER UPDATE OF
+            date_saisie, type_activite_id, machine_id, materiau_id, preparateur_id,
+            classe_id, nom_materiau, poids_grammes, surface_m2, nb_feuilles
+        ON consommations
+        BEGIN
+            {_daily_agg_remove_sql('OLD')}
+            {_daily_agg_add_sql('NEW')}
+        END;
+
+        -- Renommer un matériau peut changer la catégorie d'impression (Couleur / N&B)
+        DROP TRIGGER IF EXISTS trg_materiau_agg_rename;
+        CREATE TRIGGER trg_materiau_agg_rename AFTER UPDATE OF nom ON materiaux
+        BEGIN
+            DELETE FROM consommations_daily_agg WHERE materiau_id = NEW.id;
+            {_daily_agg_rebuild_sql('c.materiau_id = NEW.id')}
+        END;
+    ''')
+    rebuild_daily_agg(conn)
+
+
+def _migration_004_agg_buckets(conn):
+    """Colonnes de regroupement (mois, semaine, jour de semaine) + index couvrants.
+
+    Colonnes générées VIRTUAL (seule forme permise par ALTER TABLE) : leurs
+    valeurs sont matérialisées dans les index, que les regroupements des
+    statistiques parcourent sans recalculer strftime() ligne à ligne.
+    """
+    cols = {r[1] for r in conn.execute('PRAGMA table_xinfo(consommations_daily_agg)').fetchall()}
+    buckets = [
+        ('mois', "TEXT GENERATED ALWAYS AS (strftime('%Y-%m', jour)) VIRTUAL"),
+        ('semaine', "TEXT GENERATED ALWAYS AS (strftime('%Y-W%W', jour)) VIRTUAL"),
+        ('dow', "INTEGER GENERATED ALWAYS AS (CAST(strftime('%w', jour) AS INTEGER)) VIRTUAL"),
+    ]
+    for col, ddl in buckets:
+        if col not in cols:
+            conn.execute(f'ALTER TABLE consommations_daily_agg ADD COLUMN {col} {ddl}')
+    # Un index par mode de regroupement. Timeline : la clé de regroupement
+    # (période, type) en tête, puis le reste des colonnes lues (index couvrant).
+    # Activité : jour juste après l'heure / le jour de semaine, pour un
+    # skip-scan borné par la période.
+    timeline_cols = 'type_activite_id, materiau_id, impression, jour, nb, poids_grammes, surface_m2, nb_feuilles'
+    activity_cols = 'jour, preparateur_id, machine_id, nb'
+    conn.executescript(f'''
+        CREATE INDEX IF NOT EXISTS idx_agg_mois ON consommations_daily_agg(mois, {timeline_cols});
+        CREATE INDEX IF NOT EXISTS idx_agg_semaine ON consommations_daily_agg(semaine, {timeline_cols});
+        CREATE INDEX IF NOT EXISTS idx_agg_heure ON consommations_daily_agg(heure, {activity_cols});
+        CREATE INDEX IF NOT EXISTS idx_agg_dow ON consommations_daily_agg(dow, {activity_cols});
+    ''')
+
+
+# Sources de notifications suivies par trigger : source -> (table, colonnes observées)
+_NOTIFICATION_SOURCES = {
+    'machines': ('machines', 'nom, statut, actif, notes, raison_reparation, date_reparation'),
+    'stock': ('stock_articles', 'nom, quantite_actuelle, quantite_minimum, unite, actif'),
+    'missions': ('missions', 'titre, statut, priorite, date_echeance'),
+}
+
+
+def _migration_005_notifications(conn):
+    """Magasin de notifications + drapeaux « source modifiée » posés par triggers.
+
+    Les triggers ne font que marquer la source ; les notifications sont
+    recalculées pour cette seule source à la lecture suivante (notifications.py).
+    """
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL DEFAULT '',
+            link TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            resolved_at TEXT,
+            seq INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_notifications_seq ON notifications(seq);
+        CREATE INDEX IF NOT EXISTS idx_notifications_source ON notifications(source);
+
+        CREATE TABLE IF NOT EXISTS notification_sources (
+            source TEXT PRIMARY KEY,
+            dirty INTEGER NOT NULL DEFAULT 1
+        );
+    ''')
+    for source, (table, columns) in _NOTIFICATION_SOURCES.items():
+        mark = f"UPDATE notification_sources SET dirty = 1 WHERE source = '{source}' AND dirty = 0;"
+        conn.execute('INSERT OR IGNORE INTO notification_sources (source) VALUES (?)', (source,))
+        conn.executescript(f'''
+            DROP TRIGGER IF EXISTS trg_notif_{table}_insert;
+            CREATE TRIGGER trg_notif_{table}_insert AFTER INSERT ON {table}
+            BEGIN {mark} END;
+
+            DROP TRIGGER IF EXISTS trg_notif_{table}_delete;
+            CREATE TRIGGER trg_notif_{table}_delete AFTER DELETE ON {table}
+            BEGIN {mark} END;
+
+            DROP TRIGGER IF EXISTS trg_notif_{table}_update;
+            CREATE TRIGGER trg_notif_{table}_update AFTER UPDATE OF {columns} ON {table}
+            BEGIN {mark} END;
+        ''')
+
+
+def _migration_006_jobs(conn):
+    """État persistant des tâches de fond (scheduler.py) : bail d'exécution + dernier résultat."""
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            name TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'idle' CHECK(status IN ('idle','running','ok','error')),
+            owner TEXT,
+            lease_until TEXT,
+            last_started_at TEXT,
+            last_finished_at TEXT,
+            last_duration_ms INTEGER,
+            last_result TEXT,
+            last_error TEXT,
+            runs INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0
+        );
+    ''')
+
+
+def _migration_007_reference_versions(conn):
+    """Version par table de référence, incrémentée par trigger (cache des noms, ReferenceNameCache)."""
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS reference_versions (
+            tbl TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+    ''')
+    for table in REFERENCE_TABLES:
+        bump = f"UPDATE reference_versions SET version = version + 1 WHERE tbl = '{table}';"
+        conn.execute('INSERT OR IGNORE INTO reference_versions (tbl) VALUES (?)', (table,))
+        conn.executescript(f'''
+            DROP TRIGGER IF EXISTS trg_refver_{table}_insert;
+            CREATE TRIGGER trg_refver_{table}_insert AFTER INSERT ON {table}
+            BEGIN {bump} END;
+
+            DROP TRIGGER IF EXISTS trg_refver_{table}_delete;
+            CREATE TRIGGER trg_refver_{table}_delete AFTER DELETE ON {table}
+            BEGIN {bump} END;
+
+            DROP TRIGGER IF EXISTS trg_refver_{table}_update;
+            CREATE TRIGGER trg_refver_{table}_update AFTER UPDATE OF id, nom ON {table}
+            BEGIN {bump} END;
+        ''')
+
+
+# Données servies par /api/reference (synchronisation par version) : table -> clé de ligne (SQL)
+REFERENCE_SYNC_TABLES = {
+    'preparateurs': '{row}.id', 'types_activite': '{row}.id', 'machines': '{row}.id',
+    'materiaux': '{row}.id', 'classes': '{row}.id', 'referents': '{row}.id',
+    'materiau_machine': "{row}.materiau_id || ':' || {row}.machine_id",
+}
+
+
+def _migration_008_reference_sync(conn):
+    """Version globale des données de référence + journal des lignes modifiées.
+
+    Chaque insertion, modification ou suppression incrémente ``reference_sync.version``
+    et note la ligne (table, clé) avec cette version dans ``reference_changes`` ;
+    une ligne supprimée y reste (pierre tombale). ``epoch`` (aléatoire) identifie
+    l'historique : il change à la recréation de la base et à l'import d'une sauvegarde.
+    """
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS reference_sync (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO reference_sync (id, epoch) VALUES (1, lower(hex(randomblob(6))));
+
+        CREATE TABLE IF NOT EXISTS reference_changes (
+            tbl TEXT NOT NULL,
+            row_key NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (tbl, row_key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_reference_changes_version ON reference_changes(version);
+    ''')
+    for table, key in REFERENCE_SYNC_TABLES.items():
+        def note(row):
+            return f'''
+                INSERT INTO reference_changes (tbl, row_key, version)
+                VALUES ('{table}', {key.format(row=row)}, (SELECT version FROM reference_sync WHERE id = 1))
+                ON CONFLICT (tbl, row_key) DO UPDATE SET version = excluded.version;'''
+        bump = 'UPDATE reference_sync SET version = version + 1 WHERE id = 1;'
+        conn.executescript(f'''
+            DROP TRIGGER IF EXISTS trg_refsync_{table}_insert;
+            CREATE TRIGGER trg_refsync_{table}_insert AFTER INSERT ON {table}
+            BEGIN {bump} {note('NEW')} END;
+
+            DROP TRIGGER IF EXISTS trg_refsync_{table}_delete;
+            CREATE TRIGGER trg_refsync_{table}_delete AFTER DELETE ON {table}
+            BEGIN {bump} {note('OLD')} END;
+
+            DROP TRIGGER IF EXISTS trg_refsync_{table}_update;
+            CREATE TRIGGER trg_refsync_{table}_update AFTER UPDATE ON {table}
+            BEGIN {bump} {note('OLD')} {note('NEW')} END;
+        ''')
+
 
-    print("[FabTrack] Base de données initialisée.")
+_MIGRATIONS = [
+    (1, _migration_001_schema_initial),
+    (2, _migration_002_index_pagination),
+    (3, _migration_003_daily_agg),
+    (4, _migration_004_agg_buckets),
+    (5, _migration_005_notifications),
+    (6, _migration_006_jobs),
+    (7, _migration_007_reference_versions),
+    (8, _migration_008_reference_sync),
+]
+SCHEMA_VERSION = _MIGRATIONS[-1][0]
 
 
 def _migrate_db(c):
@@ -589,6 +1349,7 @@ def reset_db():
         conn.execute('PRAGMA foreign_keys=OFF')
         conn.executescript('''
             DROP TABLE IF EXISTS custom_field_values; DROP TABLE IF EXISTS custom_fields;
+            DROP TABLE IF EXISTS consommations_daily_agg;
             DROP TABLE IF EXISTS consommations; DROP TABLE IF EXISTS materiau_machine;
             DROP TABLE IF EXISTS machines;
             DROP TABLE IF EXISTS materiaux; DROP TABLE IF EXISTS classes;
@@ -599,10 +1360,16 @@ def reset_db():
             DROP TABLE IF EXISTS stock_fournisseurs;
             DROP TABLE IF EXISTS stock_unites;
             DROP TABLE IF EXISTS missions;
+            DROP TABLE IF EXISTS notifications; DROP TABLE IF EXISTS notification_sources;
+            DROP TABLE IF EXISTS jobs; DROP TABLE IF EXISTS reference_versions;
+            DROP TABLE IF EXISTS reference_sync; DROP TABLE IF EXISTS reference_changes;
         ''')
+        conn.execute('PRAGMA user_version=0')
         conn.commit()
+        conn.execute('PRAGMA foreign_keys=ON')
     finally:
         conn.close()
+    _database_replaced()
     init_db()
     print("[FabTrack] Base RÉINITIALISÉE (machines & matériaux par défaut).")
 
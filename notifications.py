@@ -0,0 +1,167 @@
+"""
+notifications.py — Notifications FabSuite matérialisées en base
+Chaque source (machines, stock, missions, imprimantes Raise3D) fournit une
+fonction qui calcule ses notifications actives. Le magasin ne la rappelle que
+lorsque la source a changé :
+  - machines / stock / missions : drapeau posé par trigger (migration 5) ;
+  - raise3d : mark_dirty() appelé à chaque relevé du thread de fond ;
+  - sources « journalières » (échéances) : aussi au changement de date.
+
+Une notification garde son id et sa date de création tant qu'elle reste
+active ; chaque création, modification ou résolution reçoit un numéro ``seq``
+croissant, qui sert de curseur ``since`` aux clients.
+"""
+
+import logging
+import threading
+from datetime import date, datetime
+
+from models import get_db, on_database_replaced
+
+logger = logging.getLogger(__name__)
+
+_CONTENT = ("type", "title", "message", "link")
+
+
+class NotificationStore:
+    """Registre des sources + synchronisation incrémentale (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}       # source -> (fonction(db) -> [notification], journalière)
+        self._dirty = set()      # sources hors base signalées par mark_dirty()
+        self._synced_day = {}
+
+    def register(self, source, build_fn, daily=False):
+        """Déclare une source ; ``build_fn(db)`` retourne ses notifications actives."""
+        self._sources[source] = (build_fn, daily)
+        self._dirty.add(source)
+
+    def mark_dirty(self, source):
+        self._dirty.add(source)
+
+    def invalidate(self):
+        """Base importée ou réinitialisée : toutes les sources sont à recalculer."""
+        with self._lock:
+            self._dirty.update(self._sources)
+            self._synced_day.clear()
+
+    def refresh(self):
+        """Resynchronise les sources modifiées depuis le dernier appel."""
+        today = date.today().isoformat()
+        with self._lock:
+            db = get_db()
+            try:
+                flagged = {r[0] for r in db.execute(
+                    "SELECT source FROM notification_sources WHERE dirty = 1")}
+                for source, (build_fn, daily) in self._sources.items():
+                    if not (source in flagged or source in self._dirty
+                            or (daily and self._synced_day.get(source) != today)):
+                        continue
+                    self._dirty.discard(source)
+                    try:
+                        if source in flagged:
+                            # Le drapeau est levé dans la transaction du recalcul : une
+                            # écriture concurrente attend le commit, puis le repose.
+                            db.execute("UPDATE notification_sources SET dirty = 0 WHERE source = ?",
+                                       (source,))
+                        self._apply(db, source, build_fn(db))
+                        # Commit seulement si une ligne a changé ; notifications
+                        # dérivées des données : pas de nouvelle génération
+                        # d'écriture (result_cache, flux SSE).
+                        if db.in_transaction:
+                            db.commit_untracked()
+                        self._synced_day[source] = today
+                    except Exception as e:
+                        db.rollback()
+                        self._dirty.add(source)
+                        logger.warning(f"Notifications '{source}' check failed: {e}")
+            finally:
+                db.close()
+
+    def _apply(self, db, source, items):
+        """Enregistre les notifications nouvelles ou modifiées, résout les disparues."""
+        now = datetime.now().isoformat(timespec='seconds')
+        current = {r['id']: r for r in db.execute(
+            "SELECT id, type, title, message, link, resolved_at FROM notifications WHERE source = ?",
+            (source,))}
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM notifications").fetchone()[0]
+        seen = set()
+        for n in items:
+            seen.add(n['id'])
+            row = current.get(n['id'])
+            if row is not None and row['resolved_at'] is None:
+                if all(row[k] == n[k] for k in _CONTENT):
+                    continue
+                seq += 1
+                db.execute('''
+                    UPDATE notifications SET type = ?, title = ?, message = ?, link = ?,
+                        updated_at = ?, seq = ?
+                    WHERE id = ?
+                ''', (*(n[k] for k in _CONTENT), now, seq, n['id']))
+                continue
+            seq += 1
+            db.execute('''
+                INSERT INTO notifications
+                    (id, source, type, title, message, link, created_at, updated_at, resolved_at, seq)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    source = excluded.source, type = excluded.type, title = excluded.title,
+                    message = excluded.message, link = excluded.link,
+                    created_at = excluded.created_at, updated_at = excluded.updated_at,
+                    resolved_at = NULL, seq = excluded.seq
+            ''', (n['id'], source, *(n[k] for k in _CONTENT), n.get('created_at') or now, now, seq))
+        for nid, row in current.items():
+            if nid not in seen and row['resolved_at'] is None:
+                seq += 1
+                db.execute("UPDATE notifications SET resolved_at = ?, updated_at = ?, seq = ? WHERE id = ?",
+                           (now, now, seq, nid))
+
+    def active(self):
+        """Notifications actives, dans l'ordre de leur dernière modification."""
+        self.refresh()
+        db = get_db()
+        try:
+            rows = db.execute(
+                "SELECT * FROM notifications WHERE resolved_at IS NULL ORDER BY seq").fetchall()
+            return [_to_dict(r) for r in rows]
+        finally:
+            db.close()
+
+    def since(self, cursor=None):
+        """(notifications, curseur) : changements postérieurs à ``cursor``.
+
+        Les notifications résolues y figurent avec ``resolved_at`` renseigné.
+        Sans curseur (ou curseur inconnu, ex. après réinitialisation de la
+        base) : toutes les notifications actives.
+        """
+        self.refresh()
+        db = get_db()
+        try:
+            last = db.execute("SELECT COALESCE(MAX(seq), 0) FROM notifications").fetchone()[0]
+            if cursor is None or cursor > last:
+                rows = db.execute(
+                    "SELECT * FROM notifications WHERE resolved_at IS NULL ORDER BY seq").fetchall()
+            else:
+                rows = db.execute(
+                    "SELECT * FROM notifications WHERE seq > ? ORDER BY seq", (cursor,)).fetchall()
+            return [_to_dict(r) for r in rows], last
+        finally:
+            db.close()
+
+
+def _to_dict(row):
+    return {
+        "id": row['id'],
+        "type": row['type'],
+        "title": row['title'],
+        "message": row['message'],
+        "created_at": row['created_at'],
+        "updated_at": row['updated_at'],
+        "resolved_at": row['resolved_at'],
+        "link": row['link'],
+    }
+
+
+store = NotificationStore()
+on_database_replaced(store.invalidate)
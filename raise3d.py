@@ -7,9 +7,15 @@ Auth    : GET /v1/login?sign=md5(sha1("password={pwd}&timestamp={ms}"))&timestam
 """
 
 import hashlib
+import http.client
 import json
+import logging
+import os
+import random
+import threading
 import time
-from urllib import request as urllib_req
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 from urllib.error import URLError, HTTPError
 
 # ---------------------------------------------------------------------------
@@ -36,10 +42,139 @@ RAISE3D_PRINTERS = [
     },
 ]
 
+logger = logging.getLogger(__name__)
+
+RAISE3D_PORT = 10800
+# Threads max pour les requêtes HTTP simultanées vers les imprimantes
+MAX_WORKERS = int(os.environ.get("FABTRACK_RAISE3D_WORKERS", "16"))
+
+# Connexions HTTP keep-alive conservées par imprimante, et leur durée de vie max
+CONN_PER_PRINTER = int(os.environ.get("FABTRACK_RAISE3D_CONN_PER_PRINTER", "5"))
+CONN_MAX_AGE = float(os.environ.get("FABTRACK_RAISE3D_CONN_MAX_AGE", "300"))  # secondes
+
+# Disjoncteur : échecs consécutifs avant ouverture, puis attente entre deux
+# sondes doublée à chaque échec (bornée), avec gigue aléatoire.
+BREAKER_THRESHOLD = int(os.environ.get("FABTRACK_RAISE3D_BREAKER_THRESHOLD", "2"))
+BREAKER_BACKOFF_BASE = float(os.environ.get("FABTRACK_RAISE3D_BACKOFF_BASE", "5"))   # secondes
+BREAKER_BACKOFF_MAX = float(os.environ.get("FABTRACK_RAISE3D_BACKOFF_MAX", "60"))    # secondes
+
 # Cache des tokens : ip -> {"token": str, "expires": float}
 _TOKEN_CACHE: dict = {}
 _TOKEN_TTL = 1700  # secondes (< 30 min pour rester dans la validité serveur)
 
+# ---------------------------------------------------------------------------
+# Connexions HTTP persistantes
+# ---------------------------------------------------------------------------
+# Les serveurs web embarqués des imprimantes supportent mal une nouvelle
+# connexion TCP par requête : chaque imprimante garde quelques connexions
+# keep-alive, réutilisées d'un relevé à l'autre.
+
+class _HostPool:
+    """Connexions HTTP inactives vers une imprimante (LIFO, thread-safe)."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._lock = threading.Lock()
+        self._idle: list = []  # [(HTTPConnection, créée_à)]
+
+    def acquire(self, timeout: float, fresh: bool = False) -> tuple:
+        """Retourne (connexion, créée_à, réutilisée) ; ``fresh`` force une connexion neuve."""
+        now = time.monotonic()
+        while True:
+            item = None
+            if not fresh:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+            if item is None:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+                return conn, now, False
+            conn, created = item
+            if now - created > CONN_MAX_AGE:
+                conn.close()
+                continue
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, created, True
+
+    def release(self, conn, created: float) -> None:
+        with self._lock:
+            if len(self._idle) < CONN_PER_PRINTER:
+                self._idle.append((conn, created))
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+_HOST_POOLS: dict = {}
+_host_pools_lock = threading.Lock()
+
+# Erreurs typiques d'une connexion keep-alive fermée côté imprimante
+_STALE_CONN_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                      ConnectionResetError, BrokenPipeError)
+
+
+def _host_pool(ip: str) -> _HostPool:
+    host, _, port = ip.partition(":")
+    with _host_pools_lock:
+        pool = _HOST_POOLS.get(ip)
+        if pool is None:
+            pool = _HOST_POOLS[ip] = _HostPool(host, int(port or RAISE3D_PORT))
+        return pool
+
+
+def _http_get_json(ip: str, path: str, timeout: float) -> dict:
+    """GET JSON via une connexion persistante de l'imprimante.
+
+    Une connexion réutilisée que l'imprimante a fermée entre-temps est
+    remplacée par une neuve, ouverte hors du pool (une seule nouvelle
+    tentative, jamais sur une autre connexion inactive). Les erreurs
+    gardent la forme de urlopen : HTTPError (statut ≠ 200), URLError
+    (réseau), TimeoutError.
+    """
+    pool = _host_pool(ip)
+    retried = False
+    while True:
+        conn, created, reused = pool.acquire(timeout, fresh=retried)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            body = resp.read()
+        except _STALE_CONN_ERRORS as e:
+            conn.close()
+            if reused and not retried:
+                retried = True
+                continue
+            raise URLError(e)
+        except TimeoutError:
+            conn.close()
+            raise
+        except OSError as e:
+            conn.close()
+            raise URLError(e)
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.release(conn, created)
+        if resp.status != 200:
+            raise HTTPError(f"{_base_url(ip)}{path}", resp.status, resp.reason, resp.headers, None)
+        return json.loads(body.decode("utf-8"))
+
+
+def close_connections() -> None:
+    """Ferme toutes les connexions persistantes (elles seront rouvertes à la demande)."""
+    with _host_pools_lock:
+        pools = list(_HOST_POOLS.values())
+    for pool in pools:
+        pool.close()
+
+
 # ---------------------------------------------------------------------------
 # Authentification
 # ---------------------------------------------------------------------------
@@ -64,10 +199,8 @@ def get_token(ip: str, password: str, timeout: int = 5) -> str | None:
         return cached["token"]
 
     sign, ts = _make_sign(password)
-    url = f"http://{ip}:10800/v1/login?sign={sign}&timestamp={ts}"
     try:
-        with urllib_req.urlopen(url, timeout=timeout) as r:
-            data = json.loads(r.read().decode("utf-8"))
+        data = _http_get_json(ip, f"/v1/login?sign={sign}&timestamp={ts}", timeout)
         if data.get("status") == 1:
             token = data["data"]["token"]
             _TOKEN_CACHE[ip] = {"token": token, "expires": now + _TOKEN_TTL}
@@ -86,22 +219,158 @@ def invalidate_token(ip: str) -> None:
 # Appels API
 # ---------------------------------------------------------------------------
 
+def _base_url(ip: str) -> str:
+    """http://ip:10800 (ou http://ip:port si l'adresse précise déjà un port)."""
+    return f"http://{ip}" if ":" in ip else f"http://{ip}:{RAISE3D_PORT}"
+
+
 def _api_get(ip: str, path: str, token: str, timeout: int = 5) -> dict:
-    url = f"http://{ip}:10800/v1{path}?token={token}"
-    with urllib_req.urlopen(url, timeout=timeout) as r:
-        return json.loads(r.read().decode("utf-8"))
+    return _http_get_json(ip, f"/v1{path}?token={token}", timeout)
+
+
+# Sous-endpoints lus pour chaque imprimante (clé -> chemin)
+_STATUS_ENDPOINTS = {
+    "run":   "/printer/runningstatus",
+    "basic": "/printer/basic",
+    "n1":    "/printer/nozzle1",
+    "n2":    "/printer/nozzle2",
+    "job":   "/job/currentjob",
+}
+
+# Deux pools distincts : une tâche « imprimante » attend ses sous-requêtes,
+# qui ne doivent donc pas dépendre des mêmes threads (pas d'interblocage).
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(kind: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = _pools[kind] = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                                     thread_name_prefix=f"raise3d-{kind}")
+        return pool
+
+
+def _remaining(deadline: float | None, timeout: float) -> float:
+    """Timeout effectif : ``timeout`` borné par le temps restant avant ``deadline``."""
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError
+    return min(timeout, left)
+
+
+def _fetch_endpoints(ip: str, token: str, timeout: int, deadline: float | None,
+                     concurrent: bool) -> dict:
+    """Lit les sous-endpoints de statut, en série ou en parallèle."""
+    if not concurrent:
+        return {k: _api_get(ip, path, token, _remaining(deadline, timeout)).get("data", {})
+                for k, path in _STATUS_ENDPOINTS.items()}
+    t = _remaining(deadline, timeout)
+    futures = {k: _pool("requests").submit(_api_get, ip, path, token, t)
+               for k, path in _STATUS_ENDPOINTS.items()}
+    _, pending = wait(futures.values(), timeout=t)
+    if pending:
+        raise TimeoutError
+    # result() relance l'éventuelle erreur réseau de la sous-requête
+    return {k: f.result().get("data", {}) for k, f in futures.items()}
+
+
+# ---------------------------------------------------------------------------
+# Disjoncteur par imprimante
+# ---------------------------------------------------------------------------
+
+class CircuitBreaker:
+    """Disjoncteur closed / open / half_open d'une imprimante.
+
+    - closed    : requêtes normales ; BREAKER_THRESHOLD échecs consécutifs l'ouvrent
+    - open      : aucune requête jusqu'à la prochaine sonde (coût nul)
+    - half_open : une seule sonde en cours ; succès → closed, échec → open
+                  avec une attente doublée (gigue ±25 %, plafond BREAKER_BACKOFF_MAX)
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, base: float = BREAKER_BACKOFF_BASE,
+                 max_backoff: float = BREAKER_BACKOFF_MAX, clock=time.monotonic):
+        self.threshold = threshold
+        self.base = base
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error: str | None = None
+        self._opens = 0
+        self._retry_at = 0.0
+
+    def allow(self) -> bool:
+        """True si une requête peut partir (en half_open : la sonde seulement)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() >= self._retry_at:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._opens = 0
+            self.last_error = None
+
+    def record_failure(self, error: str | None = None) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                backoff = min(self.max_backoff, self.base * (2 ** self._opens))
+                self._opens += 1
+                self._retry_at = self._clock() + backoff * random.uniform(0.75, 1.25)
+                self.state = self.OPEN
+
+    def snapshot(self) -> dict:
+        """État exposé dans le statut : {"state", "failures", "retry_in"}."""
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._retry_at - self._clock()), 1)
+            return {"state": self.state, "failures": self.failures, "retry_in": retry_in}
+
+
+_BREAKERS: dict = {}
+_breakers_lock = threading.Lock()
+
+
+def _breaker(ip: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _BREAKERS.get(ip)
+        if breaker is None:
+            breaker = _BREAKERS[ip] = CircuitBreaker()
+        return breaker
 
 
 # ---------------------------------------------------------------------------
 # Statut imprimante
 # ---------------------------------------------------------------------------
 
-def get_printer_status(ip: str, password: str, timeout: int = 5) -> dict:
+def get_printer_status(ip: str, password: str, timeout: int = 5,
+                       deadline: float | None = None, concurrent: bool = True) -> dict:
     """Retourne le statut complet d'une imprimante.
 
+    Les cinq sous-endpoints sont interrogés en parallèle (``concurrent``) :
+    environ un aller-retour au lieu de cinq. ``deadline`` (time.monotonic())
+    borne la durée totale, login compris. Tant que le disjoncteur de
+    l'imprimante est ouvert, aucune requête n'est émise.
+
     Champs retournés :
       online (bool)           — imprimante joignable
       error (str|None)        — message d'erreur si offline
+      circuit (dict)          — disjoncteur : state / failures / retry_in (s)
       running_status (str)    — idle / busy / running / completed / error
       heatbed_cur/tar (float) — température plateau (°C)
       nozzle1_cur/tar (float) — température buse gauche (°C)
@@ -114,16 +383,28 @@ def get_printer_status(ip: str, password: str, timeout: int = 5) -> dict:
       printed_time (int)      — temps imprimé (secondes)
       total_time (int)        — temps total estimé (secondes)
     """
+    breaker = _breaker(ip)
+    if not breaker.allow():
+        status = {"online": False, "error": breaker.last_error or "Hors ligne"}
+    else:
+        status = _query_printer(ip, password, timeout, deadline, concurrent)
+        if status["online"]:
+            breaker.record_success()
+        else:
+            breaker.record_failure(status["error"])
+    status["circuit"] = breaker.snapshot()
+    return status
+
+
+def _query_printer(ip: str, password: str, timeout: int, deadline: float | None,
+                   concurrent: bool) -> dict:
     try:
-        token = get_token(ip, password, timeout)
+        token = get_token(ip, password, _remaining(deadline, timeout))
         if not token:
             return {"online": False, "error": "Authentification échouée"}
 
-        run   = _api_get(ip, "/printer/runningstatus", token, timeout).get("data", {})
-        basic = _api_get(ip, "/printer/basic",         token, timeout).get("data", {})
-        n1    = _api_get(ip, "/printer/nozzle1",       token, timeout).get("data", {})
-        n2    = _api_get(ip, "/printer/nozzle2",       token, timeout).get("data", {})
-        job   = _api_get(ip, "/job/currentjob",        token, timeout).get("data", {})
+        data  = _fetch_endpoints(ip, token, timeout, deadline, concurrent)
+        run, basic, n1, n2, job = (data[k] for k in ("run", "basic", "n1", "n2", "job"))
 
         # L'API retourne print_progress entre 0.0 et 1.0
         raw_progress = job.get("print_progress") or 0
@@ -158,11 +439,33 @@ def get_printer_status(ip: str, password: str, timeout: int = 5) -> dict:
         return {"online": False, "error": str(e)}
 
 
-def get_all_status(timeout: int = 5) -> list:
-    """Retourne le statut de toutes les imprimantes configurées."""
+def get_all_status(timeout: int = 5, budget: float | None = None,
+                   concurrent: bool = True, printers: list | None = None) -> list:
+    """Retourne le statut de toutes les imprimantes configurées.
+
+    En mode ``concurrent``, les imprimantes sont interrogées en parallèle
+    sous une échéance commune, ``budget`` secondes après l'appel (défaut :
+    2 × timeout, soit login + lecture). Une imprimante qui ne répond pas à
+    temps est rapportée hors ligne (« Timeout ») sans retarder les autres.
+    """
+    printers = RAISE3D_PRINTERS if printers is None else printers
+    end = time.monotonic() + (budget if budget is not None else 2 * timeout)
+
+    def one(p):
+        return get_printer_status(p["ip"], p["password"], timeout, deadline=end,
+                                  concurrent=concurrent)
+
+    if concurrent:
+        futures = [_pool("printers").submit(one, p) for p in printers]
+        wait(futures, timeout=max(0.0, end - time.monotonic()))
+        statuses = [f.result() if f.done() else
+                    {"online": False, "error": "Timeout", "circuit": _breaker(p["ip"]).snapshot()}
+                    for f, p in zip(futures, printers)]
+    else:
+        statuses = [one(p) for p in printers]
+
     result = []
-    for p in RAISE3D_PRINTERS:
-        s = get_printer_status(p["ip"], p["password"], timeout)
+    for p, s in zip(printers, statuses):
         s["id"]   = p["id"]
         s["name"] = p["name"]
         s["ip"]   = p["ip"]
@@ -170,6 +473,105 @@ def get_all_status(timeout: int = 5) -> list:
     return result
 
 
+# ---------------------------------------------------------------------------
+# Relevé en tâche de fond
+# ---------------------------------------------------------------------------
+# Les endpoints ne contactent plus les imprimantes : ils lisent le dernier
+# relevé, rafraîchi par un thread dédié. Une imprimante hors ligne ne ralentit
+# donc que ce thread.
+POLL_INTERVAL = float(os.environ.get("FABTRACK_RAISE3D_POLL_INTERVAL", "15"))  # secondes
+POLL_TIMEOUT = int(os.environ.get("FABTRACK_RAISE3D_POLL_TIMEOUT", "5"))        # par requête HTTP
+# Au-delà de cet âge (secondes), le relevé est signalé comme périmé
+STALE_AFTER = float(os.environ.get("FABTRACK_RAISE3D_STALE_AFTER", str(POLL_INTERVAL * 3)))
+
+
+class StatusPoller:
+    """Thread de relevé périodique + dernier instantané (thread-safe)."""
+
+    def __init__(self, interval: float = POLL_INTERVAL, timeout: int = POLL_TIMEOUT,
+                 stale_after: float = STALE_AFTER):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self._printers: list = []
+        self._updated_at: float | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._listeners: list = []
+
+    def add_listener(self, fn) -> None:
+        """Appelle ``fn(printers, updated_at)`` après chaque relevé (depuis le thread de relevé)."""
+        self._listeners.append(fn)
+
+    def start(self) -> None:
+        """Démarre le thread s'il ne tourne pas déjà (idempotent, sans effet après stop())."""
+        with self._lock:
+            if self._stop.is_set() or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="raise3d-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Arrête définitivement le relevé (l'instantané reste lisible)."""
+        self._stop.set()
+
+    def poll_once(self) -> None:
+        """Relève toutes les imprimantes et remplace l'instantané."""
+        printers = get_all_status(timeout=self.timeout)
+        updated_at = time.time()
+        with self._lock:
+            self._printers = printers
+            self._updated_at = updated_at
+        for fn in self._listeners:
+            try:
+                fn(printers, updated_at)
+            except Exception as e:
+                logger.error(f"Raise3D poll listener error: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Raise3D poller error: {e}")
+            self._stop.wait(self.interval)
+
+    def snapshot(self) -> dict:
+        """Dernier relevé, sans attendre le réseau.
+
+        Retourne : {"printers": [...], "updated_at": ISO8601|None,
+                    "age_seconds": float|None, "stale": bool}
+        Avant le premier relevé, "printers" est vide et "updated_at" vaut None.
+        """
+        self.start()
+        with self._lock:
+            printers = [dict(p) for p in self._printers]
+            updated_at = self._updated_at
+        if updated_at is None:
+            return {"printers": printers, "updated_at": None, "age_seconds": None, "stale": True}
+        age = time.time() - updated_at
+        return {
+            "printers": printers,
+            "updated_at": datetime.fromtimestamp(updated_at).isoformat(timespec="seconds"),
+            "age_seconds": round(age, 1),
+            "stale": age > self.stale_after,
+        }
+
+
+_poller = StatusPoller()
+
+
+def get_status_snapshot() -> dict:
+    """Instantané partagé du statut des imprimantes (démarre le relevé au premier appel)."""
+    return _poller.snapshot()
+
+
+def add_poll_listener(fn) -> None:
+    """Abonne ``fn(printers, updated_at)`` aux relevés du thread de fond."""
+    _poller.add_listener(fn)
+
+
 # ---------------------------------------------------------------------------
 # Utilitaires
 # ---------------------------------------------------------------------------
@@ -1,14 +1,24 @@
 """Enregistrement des blueprints Fabtrack + configuration FabSuite."""
 
+import os
 from datetime import datetime
-from models import get_db
+from models import get_db, data_generation, result_cache, shared_connection
 from fabsuite_core.manifest import create_fabsuite_blueprint
 from fabsuite_core import widgets
+import instrumentation
+import notifications
 import raise3d
+import telemetry
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Threads du serveur waitress (--threads, cf. Dockerfile / lancer.bat). Un flux
+# /api/fabsuite/stream en occupe un tant qu'il est ouvert : la moitié au plus
+# leur est accordée, le reste sert les requêtes ordinaires.
+SERVER_THREADS = int(os.environ.get('FABTRACK_THREADS', '16'))
+STREAM_MAX_SUBSCRIBERS = max(1, SERVER_THREADS // 2)
+
 
 def register_blueprints(app):
     """Enregistre tous les blueprints sur l'app Flask."""
@@ -31,6 +41,12 @@ def register_blueprints(app):
     # Filtre Jinja pour le module stock
     app.jinja_env.filters['fmt_qte'] = _fmt_qte
 
+    # ── Notifications : une source par domaine, recalculée quand elle change ──
+    notifications.store.register('machines', _notifs_machines)
+    notifications.store.register('raise3d', _notifs_raise3d)
+    notifications.store.register('stock', _notifs_stock)
+    notifications.store.register('missions', _notifs_missions, daily=True)
+
     # ── FabSuite blueprint via fabsuite_core ──
     fabsuite_bp = create_fabsuite_blueprint(
         app_id='fabtrack',
@@ -45,7 +61,7 @@ def register_blueprints(app):
                 'description': 'Nombre total de consommations enregistrées ce mois-ci',
                 'type': 'counter',
                 'refresh_interval': 300,
-                'fn': _widget_monthly_consumptions,
+                'fn': _cached_widget(_widget_monthly_consumptions, period='%Y-%m'),
             },
             {
                 'id': 'machine-status',
@@ -53,7 +69,7 @@ def register_blueprints(app):
                 'description': 'Disponibilité des machines du FabLab',
                 'type': 'status',
                 'refresh_interval': 60,
-                'fn': _widget_machine_status,
+                'fn': _cached_widget(_widget_machine_status),
             },
             {
                 'id': 'top-machines',
@@ -61,7 +77,7 @@ def register_blueprints(app):
                 'description': 'Machines les plus utilisées ce mois-ci',
                 'type': 'chart',
                 'refresh_interval': 600,
-                'fn': _widget_top_machines,
+                'fn': _cached_widget(_widget_top_machines, period='%Y-%m'),
             },
             {
                 'id': 'recent-activity',
@@ -69,7 +85,7 @@ def register_blueprints(app):
                 'description': 'Dernières consommations enregistrées',
                 'type': 'list',
                 'refresh_interval': 120,
-                'fn': _widget_recent_activity,
+                'fn': _cached_widget(_widget_recent_activity),
             },
             {
                 'id': 'raise3d-status',
@@ -77,6 +93,7 @@ def register_blueprints(app):
                 'description': 'Statut temps-réel des imprimantes 3D Raise3D du FabLab',
                 'type': 'status',
                 'refresh_interval': 30,
+                'io_bound': True,
                 'fn': _widget_raise3d_status,
             },
             {
@@ -85,7 +102,7 @@ def register_blueprints(app):
                 'description': 'Articles sous le seuil de réapprovisionnement',
                 'type': 'list',
                 'refresh_interval': 300,
-                'fn': _widget_stock_low,
+                'fn': _cached_widget(_widget_stock_low),
             },
             {
                 'id': 'stock-summary',
@@ -93,7 +110,7 @@ def register_blueprints(app):
                 'description': 'Nombre de références en stock',
                 'type': 'counter',
                 'refresh_interval': 300,
-                'fn': _widget_stock_summary,
+                'fn': _cached_widget(_widget_stock_summary),
             },
             {
                 'id': 'pending-tasks',
@@ -101,7 +118,7 @@ def register_blueprints(app):
                 'description': 'Nombre de missions non terminées',
                 'type': 'counter',
                 'refresh_interval': 120,
-                'fn': _widget_pending_tasks,
+                'fn': _cached_widget(_widget_pending_tasks),
             },
             {
                 'id': 'missions-board',
@@ -109,19 +126,42 @@ def register_blueprints(app):
                 'description': 'Aperçu des missions actives par statut',
                 'type': 'table',
                 'refresh_interval': 120,
-                'fn': _widget_missions_board,
+                'fn': _cached_widget(_widget_missions_board),
             },
         ],
-        notifications_fn=_get_notifications,
+        notifications_fn=notifications.store.active,
+        notifications_since_fn=notifications.store.since,
         health_fn=_health_check,
+        metrics_fn=instrumentation.registry.render if instrumentation.ENABLED else None,
+        batch_scope=shared_connection,
+        change_version_fn=data_generation,
+        stream_max_subscribers=STREAM_MAX_SUBSCRIBERS,
         icon='bi-printer',
         color='#198754',
     )
     app.register_blueprint(fabsuite_bp)
 
+    # Historique télémétrie alimenté par le relevé Raise3D en tâche de fond
+    raise3d.add_poll_listener(telemetry.store.record)
+    # Chaque relevé peut changer le widget Raise3D et les notifications : flux SSE à jour
+    raise3d.add_poll_listener(lambda printers, updated_at: notifications.store.mark_dirty('raise3d'))
+    raise3d.add_poll_listener(lambda printers, updated_at: fabsuite_bp.notify_change())
+
 
 # ── Widget callbacks ──
 
+def _cached_widget(fn, period=None):
+    """Mémorise un widget lu en base jusqu'à la prochaine écriture.
+
+    ``period`` (format strftime) ajoute la période courante à la clé pour les
+    widgets relatifs à la date (ex. '%Y-%m' : recalcul au changement de mois).
+    """
+    def cached():
+        key = ('widget', fn.__name__, datetime.now().strftime(period) if period else None)
+        return result_cache.get_or_compute(key, fn)
+    return cached
+
+
 def _widget_monthly_consumptions():
     db = get_db()
     try:
@@ -200,9 +240,9 @@ def _widget_recent_activity():
 
 def _widget_raise3d_status():
     try:
-        statuses = raise3d.get_all_status(timeout=5)
+        snap = raise3d.get_status_snapshot()
         items = []
-        for p in statuses:
+        for p in snap["printers"]:
             if not p.get("online"):
                 status_level = "error"
                 label_detail = p.get("error") or "Hors ligne"
@@ -227,6 +267,8 @@ def _widget_raise3d_status():
                 "value": label_detail,
                 "status": status_level
             })
+        if snap["stale"] and snap["updated_at"]:
+            items.append({"label": f"Relevé Raise3D ancien ({int(snap['age_seconds'])} s)", "status": "warning"})
         return widgets.status_list(items)
     except Exception as e:
         logger.error(f"Raise3D widget error: {e}")
@@ -322,142 +364,135 @@ def _fmt_qte(val):
 
 # ── Notifications ──
 
-def _get_notifications():
-    db = get_db()
-    try:
-        machines = db.execute(
-            "SELECT id, nom, statut, notes, raison_reparation, date_reparation "
-            "FROM machines WHERE actif = 1 AND statut != 'disponible'"
-        ).fetchall()
-        notifs = []
-        for m in machines:
-            ntype = "error" if m['statut'] == 'hors_service' else "warning"
-            title = f"{'Hors service' if m['statut'] == 'hors_service' else 'En réparation'} : {m['nom']}"
-            message = m['raison_reparation'] or m['notes'] or ""
+def _notifs_machines(db):
+    """Machines en réparation ou hors service."""
+    machines = db.execute(
+        "SELECT id, nom, statut, notes, raison_reparation, date_reparation "
+        "FROM machines WHERE actif = 1 AND statut != 'disponible'"
+    ).fetchall()
+    notifs = []
+    for m in machines:
+        ntype = "error" if m['statut'] == 'hors_service' else "warning"
+        title = f"{'Hors service' if m['statut'] == 'hors_service' else 'En réparation'} : {m['nom']}"
+        message = m['raison_reparation'] or m['notes'] or ""
+        notifs.append(widgets.notification(
+            id=f"machine-{m['id']}-{m['statut']}",
+            type=ntype,
+            title=title,
+            message=message,
+            link="/etat-machines",
+            created_at=m['date_reparation'] or None,
+        ))
+    return notifs
+
+
+def _notifs_raise3d(db):
+    """Imprimantes Raise3D en erreur ou hors ligne (dernier relevé du thread de fond)."""
+    notifs = []
+    for p in raise3d.get_status_snapshot()["printers"]:
+        if not p.get("online"):
             notifs.append(widgets.notification(
-                id=f"machine-{m['id']}-{m['statut']}",
-                type=ntype,
-                title=title,
-                message=message,
-                link="/etat-machines",
-                created_at=m['date_reparation'] or datetime.now().isoformat(),
+                id=f"raise3d-{p['id']}-offline",
+                type="error",
+                title=f"Hors ligne : {p['name']}",
+                message=p.get("error") or "Imprimante injoignable",
+                link="/api/raise3d/status",
             ))
-
-        # Imprimantes Raise3D en erreur ou hors ligne
-        try:
-            r3d_statuses = raise3d.get_all_status(timeout=3)
-            for p in r3d_statuses:
-                if not p.get("online"):
-                    notifs.append(widgets.notification(
-                        id=f"raise3d-{p['id']}-offline",
-                        type="error",
-                        title=f"Hors ligne : {p['name']}",
-                        message=p.get("error") or "Imprimante injoignable",
-                        link="/api/raise3d/status",
-                        created_at=datetime.now().isoformat(),
-                    ))
-                elif p.get("running_status") == "error":
-                    notifs.append(widgets.notification(
-                        id=f"raise3d-{p['id']}-error",
-                        type="error",
-                        title=f"Erreur imprimante : {p['name']}",
-                        message="L'imprimante signale une erreur",
-                        link="/api/raise3d/status",
-                        created_at=datetime.now().isoformat(),
-                    ))
-        except Exception as e:
-            logger.warning(f"Raise3D notifications check failed: {e}")
-
-        # Articles de stock sous le seuil minimum
-        try:
-            stock_alertes = db.execute('''
-                SELECT id, nom, quantite_actuelle, quantite_minimum, unite
-                FROM stock_articles
-                WHERE actif = 1
-                  AND quantite_minimum IS NOT NULL
-                  AND quantite_actuelle < quantite_minimum
-                ORDER BY (quantite_minimum - quantite_actuelle) DESC
-                LIMIT 10
-            ''').fetchall()
-            for a in stock_alertes:
-                qte = _fmt_qte(a['quantite_actuelle'])
-                mini = _fmt_qte(a['quantite_minimum'])
-                notifs.append(widgets.notification(
-                    id=f"stock-low-{a['id']}",
-                    type="warning",
-                    title=f"Stock faible — {a['nom']}",
-                    message=f"Stock : {qte} {a['unite']} (min : {mini} {a['unite']})",
-                    link="/stock/articles",
-                    created_at=datetime.now().isoformat(),
-                ))
-        except Exception as e:
-            logger.warning(f"Stock notifications check failed: {e}")
-
-        # Missions en retard
-        try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            # Résumé global des missions ouvertes
-            row_open = db.execute('''
-                SELECT COUNT(*) AS cnt
-                FROM missions
-                WHERE statut != 'termine'
-            ''').fetchone()
-            open_count = int(row_open['cnt']) if row_open else 0
-            if open_count > 0:
-                notifs.append(widgets.notification(
-                    id="missions-open-count",
-                    type="info",
-                    title=f"Missions ouvertes : {open_count}",
-                    message="Des missions sont encore à traiter dans le tableau Fabtrack",
-                    link="/missions/",
-                    created_at=datetime.now().isoformat(),
-                ))
-
-            # Missions à échéance aujourd'hui
-            missions_today = db.execute('''
-                SELECT id, titre, priorite
-                FROM missions
-                WHERE statut != 'termine'
-                  AND date_echeance = ?
-                ORDER BY priorite DESC, id ASC
-                LIMIT 10
-            ''', (today,)).fetchall()
-            prio_labels = {0: 'Normale', 1: 'Haute', 2: 'Urgente'}
-            for m in missions_today:
-                notifs.append(widgets.notification(
-                    id=f"mission-due-today-{m['id']}",
-                    type="warning" if m['priorite'] >= 1 else "info",
-                    title=f"Échéance aujourd'hui — {m['titre']}",
-                    message=f"Priorité : {prio_labels.get(m['priorite'], '?')}",
-                    link="/missions/",
-                    created_at=datetime.now().isoformat(),
-                ))
-
-            missions_retard = db.execute('''
-                SELECT id, titre, date_echeance, priorite
-                FROM missions
-                WHERE statut != 'termine'
-                  AND date_echeance IS NOT NULL
-                  AND date_echeance < ?
-                ORDER BY date_echeance ASC
-                LIMIT 10
-            ''', (today,)).fetchall()
-            for m in missions_retard:
-                ntype = "error" if m['priorite'] >= 2 else "warning"
-                notifs.append(widgets.notification(
-                    id=f"mission-overdue-{m['id']}",
-                    type=ntype,
-                    title=f"Mission en retard — {m['titre']}",
-                    message=f"Échéance dépassée : {m['date_echeance']} (priorité : {prio_labels.get(m['priorite'], '?')})",
-                    link="/missions/",
-                    created_at=m['date_echeance'],
-                ))
-        except Exception as e:
-            logger.warning(f"Missions notifications check failed: {e}")
-
-        return notifs
-    finally:
-        db.close()
+        elif p.get("running_status") == "error":
+            notifs.append(widgets.notification(
+                id=f"raise3d-{p['id']}-error",
+                type="error",
+                title=f"Erreur imprimante : {p['name']}",
+                message="L'imprimante signale une erreur",
+                link="/api/raise3d/status",
+            ))
+    return notifs
+
+
+def _notifs_stock(db):
+    """Articles de stock sous le seuil minimum."""
+    stock_alertes = db.execute('''
+        SELECT id, nom, quantite_actuelle, quantite_minimum, unite
+        FROM stock_articles
+        WHERE actif = 1
+          AND quantite_minimum IS NOT NULL
+          AND quantite_actuelle < quantite_minimum
+        ORDER BY (quantite_minimum - quantite_actuelle) DESC
+        LIMIT 10
+    ''').fetchall()
+    notifs = []
+    for a in stock_alertes:
+        qte = _fmt_qte(a['quantite_actuelle'])
+        mini = _fmt_qte(a['quantite_minimum'])
+        notifs.append(widgets.notification(
+            id=f"stock-low-{a['id']}",
+            type="warning",
+            title=f"Stock faible — {a['nom']}",
+            message=f"Stock : {qte} {a['unite']} (min : {mini} {a['unite']})",
+            link="/stock/articles",
+        ))
+    return notifs
+
+
+def _notifs_missions(db):
+    """Missions ouvertes, à échéance aujourd'hui et en retard."""
+    notifs = []
+    today = datetime.now().strftime('%Y-%m-%d')
+    # Résumé global des missions ouvertes
+    row_open = db.execute('''
+        SELECT COUNT(*) AS cnt
+        FROM missions
+        WHERE statut != 'termine'
+    ''').fetchone()
+    open_count = int(row_open['cnt']) if row_open else 0
+    if open_count > 0:
+        notifs.append(widgets.notification(
+            id="missions-open-count",
+            type="info",
+            title=f"Missions ouvertes : {open_count}",
+            message="Des missions sont encore à traiter dans le tableau Fabtrack",
+            link="/missions/",
+        ))
+
+    # Missions à échéance aujourd'hui
+    missions_today = db.execute('''
+        SELECT id, titre, priorite
+        FROM missions
+        WHERE statut != 'termine'
+          AND date_echeance = ?
+        ORDER BY priorite DESC, id ASC
+        LIMIT 10
+    ''', (today,)).fetchall()
+    prio_labels = {0: 'Normale', 1: 'Haute', 2: 'Urgente'}
+    for m in missions_today:
+        notifs.append(widgets.notification(
+            id=f"mission-due-today-{m['id']}",
+            type="warning" if m['priorite'] >= 1 else "info",
+            title=f"Échéance aujourd'hui — {m['titre']}",
+            message=f"Priorité : {prio_labels.get(m['priorite'], '?')}",
+            link="/missions/",
+        ))
+
+    missions_retard = db.execute('''
+        SELECT id, titre, date_echeance, priorite
+        FROM missions
+        WHERE statut != 'termine'
+          AND date_echeance IS NOT NULL
+          AND date_echeance < ?
+        ORDER BY date_echeance ASC
+        LIMIT 10
+    ''', (today,)).fetchall()
+    for m in missions_retard:
+        ntype = "error" if m['priorite'] >= 2 else "warning"
+        notifs.append(widgets.notification(
+            id=f"mission-overdue-{m['id']}",
+            type=ntype,
+            title=f"Mission en retard — {m['titre']}",
+            message=f"Échéance dépassée : {m['date_echeance']} (priorité : {prio_labels.get(m['priorite'], '?')})",
+            link="/missions/",
+            created_at=m['date_echeance'],
+        ))
+    return notifs
 
 
 # ── Health check ──
@@ -1,10 +1,13 @@
 """Routes API admin — backup/restore, demo, reset, custom fields, upload, machine statut."""
 
 from flask import Blueprint, request, jsonify, send_file
-from models import get_db, init_db, reset_db, generate_demo_data, DATA_DIR
+from models import (get_db, init_db, reset_db, generate_demo_data, close_all_connections, result_cache,
+                    backup_database, DATA_DIR)
 from werkzeug.utils import secure_filename
-from datetime import datetime
-import json, os, shutil, glob, logging
+import backups
+from scheduler import scheduler, JobBusy
+from datetime import datetime, timedelta
+import base64, io, json, lzma, os, shutil, glob, logging, threading
 
 bp = Blueprint('api_admin', __name__)
 logger = logging.getLogger(__name__)
@@ -18,6 +21,12 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # ── Config backup ──
 BACKUP_FOLDER = os.path.join(DATA_DIR, 'backups')
 BACKUP_CONFIG_PATH = os.path.join(DATA_DIR, 'backup_config.json')
+# Empreintes des pages de la dernière sauvegarde (base des sauvegardes incrémentales)
+BACKUP_STATE_PATH = os.path.join(DATA_DIR, 'backup_state.json')
+# Pause entre deux étapes de copie des sauvegardes de fond (limite leur débit disque)
+BACKUP_STEP_PAUSE = float(os.environ.get('FABTRACK_BACKUP_STEP_PAUSE', '0.02'))
+# Intervalle entre deux sauvegardes automatiques, selon la fréquence configurée
+_BACKUP_PERIODS = {'daily': timedelta(days=1), 'weekly': timedelta(days=7)}
 os.makedirs(BACKUP_FOLDER, exist_ok=True)
 
 
@@ -27,7 +36,8 @@ def allowed_file(filename):
 
 def _load_backup_config():
     """Charge la configuration de sauvegarde depuis le fichier JSON."""
-    defaults = {'frequency': 'off', 'last_backup': '', 'max_backups': 30, 'backup_path': ''}
+    defaults = {'frequency': 'off', 'last_backup': '', 'max_backups': 30, 'backup_path': '',
+                'compression': 'lzma', 'incremental': True, 'full_every': 7}
     if os.path.exists(BACKUP_CONFIG_PATH):
         try:
             with open(BACKUP_CONFIG_PATH, 'r', encoding='utf-8') as f:
@@ -44,6 +54,22 @@ def _save_backup_config(cfg):
         json.dump(cfg, f, ensure_ascii=False, indent=2)
 
 
+def _load_backup_state():
+    """État de la dernière sauvegarde ({last, page_size, hashes, deltas}) ou None."""
+    try:
+        with open(BACKUP_STATE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        state['hashes'] = base64.b64decode(state['hashes'])
+        return state
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_backup_state(state):
+    with open(BACKUP_STATE_PATH, 'w', encoding='utf-8') as f:
+        json.dump({**state, 'hashes': base64.b64encode(state['hashes']).decode()}, f)
+
+
 def _get_backup_folder():
     """Retourne le dossier de sauvegarde : chemin personnalisé ou dossier par défaut."""
     cfg = _load_backup_config()
@@ -53,51 +79,97 @@ def _get_backup_folder():
     return BACKUP_FOLDER
 
 
-def _create_backup(label='auto'):
-    """Crée une copie .fabtrack de la base de données."""
+# Avancement de la sauvegarde en cours (lu par /api/backup/progress)
+_backup_progress = {'running': False, 'filename': '', 'pages_done': 0, 'pages_total': 0, 'started_at': ''}
+_backup_lock = threading.Lock()
+
+
+def _report_progress(done, total):
+    _backup_progress['pages_done'] = done
+    _backup_progress['pages_total'] = total
+
+
+def _create_backup(label='auto', pause=0.0):
+    """Crée une sauvegarde .fabtrack cohérente (API de sauvegarde SQLite), compressée.
+
+    Les sauvegardes automatiques sont incrémentales (pages modifiées depuis la
+    précédente) si la configuration le permet, avec une sauvegarde complète
+    toutes les ``full_every`` sauvegardes ; les manuelles sont toujours complètes.
+    """
     from models import DB_PATH
     if not os.path.exists(DB_PATH):
         return None
+    cfg = _load_backup_config()
     folder = _get_backup_folder()
     os.makedirs(folder, exist_ok=True)
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f'fabtrack_{label}_{ts}.fabtrack'
     dest = os.path.join(folder, filename)
-    shutil.copy2(DB_PATH, dest)
-    cfg = _load_backup_config()
-    max_b = cfg.get('max_backups', 30)
-    backups = sorted(glob.glob(os.path.join(folder, '*.fabtrack')), key=os.path.getmtime)
-    while len(backups) > max_b:
-        os.remove(backups.pop(0))
+    state = _load_backup_state()
+    incremental = bool(label.startswith('auto') and cfg.get('incremental') and state
+                       and state.get('deltas', 0) + 1 < cfg.get('full_every', 7)
+                       and os.path.exists(os.path.join(folder, state.get('last', ''))))
+    # Instantané local (disque de la base), puis écriture compressée vers le dossier cible
+    snapshot = os.path.join(os.path.dirname(DB_PATH), f'.{filename}.snapshot')
+    with _backup_lock:
+        _backup_progress.update(running=True, filename=filename, pages_done=0, pages_total=0,
+                                started_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        try:
+            backup_database(snapshot, progress=_report_progress, pause=pause)
+            result = backups.write_backup(snapshot, dest, cfg.get('compression', 'lzma'),
+                                          base=state['last'] if incremental else None,
+                                          previous=state if incremental else None)
+        finally:
+            _backup_progress['running'] = False
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+    _save_backup_state({'last': filename, 'page_size': result['page_size'], 'hashes': result['hashes'],
+                        'deltas': state['deltas'] + 1 if incremental else 0})
+    backups.prune(folder, cfg.get('max_backups', 30), keep=filename)
     return filename
 
 
-def check_auto_backup():
-    """Vérifie si une sauvegarde automatique est nécessaire selon la fréquence configurée."""
+def _next_auto_backup(cfg):
+    """Date de la prochaine sauvegarde automatique (None si désactivée)."""
+    period = _BACKUP_PERIODS.get(cfg.get('frequency', 'off'))
+    if period is None:
+        return None
+    try:
+        return datetime.strptime(cfg.get('last_backup', ''), '%Y-%m-%d %H:%M:%S') + period
+    except ValueError:
+        return datetime.now()
+
+
+def _auto_backup_due():
+    next_run = _next_auto_backup(_load_backup_config())
+    return next_run is not None and next_run <= datetime.now()
+
+
+def _backup_job(label=None, pause=None):
+    """Tâche planifiée 'backup' : crée la sauvegarde et retourne le nom du fichier.
+
+    Sans ``label`` : sauvegarde automatique (auto_<fréquence>). Les sauvegardes
+    automatiques et manuelles mettent à jour la date de dernière sauvegarde.
+    """
     cfg = _load_backup_config()
-    freq = cfg.get('frequency', 'off')
-    if freq == 'off':
-        return
-    last = cfg.get('last_backup', '')
-    now = datetime.now()
-    needs_backup = False
-    if not last:
-        needs_backup = True
-    else:
-        try:
-            last_dt = datetime.strptime(last, '%Y-%m-%d %H:%M:%S')
-            if freq == 'daily' and (now - last_dt).total_seconds() >= 86400:
-                needs_backup = True
-            elif freq == 'weekly' and (now - last_dt).total_seconds() >= 604800:
-                needs_backup = True
-        except ValueError:
-            needs_backup = True
-    if needs_backup:
-        fname = _create_backup(f'auto_{freq}')
-        if fname:
-            cfg['last_backup'] = now.strftime('%Y-%m-%d %H:%M:%S')
-            _save_backup_config(cfg)
-            print(f'[FabTrack] Sauvegarde automatique ({freq}): {fname}')
+    label = label or f"auto_{cfg.get('frequency', 'off')}"
+    fname = _create_backup(label, pause=BACKUP_STEP_PAUSE if pause is None else pause)
+    if not fname:
+        raise FileNotFoundError('Base de données introuvable')
+    if label != 'avant_import':
+        cfg = _load_backup_config()
+        cfg['last_backup'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _save_backup_config(cfg)
+    logger.info(f'Sauvegarde {label} : {fname}')
+    return fname
+
+
+scheduler.register('backup', _backup_job, due_fn=_auto_backup_due)
+
+
+def start_backup_scheduler():
+    """Démarre (une fois) le thread des sauvegardes automatiques ; ne bloque jamais."""
+    scheduler.start()
 
 
 def _human_size(nbytes):
@@ -243,6 +315,14 @@ def api_save_custom_values(entity_type, entity_id):
         db.close()
 
 
+# ── Cache de lecture ──
+
+@bp.route('/api/cache/stats')
+def api_cache_stats():
+    """Compteurs du cache de résultats (hits, misses, évictions, taille)."""
+    return jsonify(result_cache.stats())
+
+
 # ── Démonstration & Réinitialisation ──
 
 @bp.route('/api/demo/generate', methods=['POST'])
@@ -315,36 +395,63 @@ def api_backup_settings_put():
             except OSError:
                 return jsonify({'success': False, 'error': f'Le dossier n\'est pas accessible en écriture : {new_path}'}), 400
         cfg['backup_path'] = new_path
+    if 'compression' in data:
+        if data['compression'] not in backups.COMPRESSIONS:
+            return jsonify({'success': False, 'error': 'Compression invalide (none, gzip, lzma)'}), 400
+        cfg['compression'] = data['compression']
+    if 'incremental' in data:
+        cfg['incremental'] = bool(data['incremental'])
+    if 'full_every' in data:
+        cfg['full_every'] = max(1, min(int(data['full_every']), 100))
     _save_backup_config(cfg)
     return jsonify({'success': True, **cfg})
 
 @bp.route('/api/backup/create', methods=['POST'])
 def api_backup_create():
-    try:
-        fname = _create_backup('manuel')
-        if fname:
-            cfg = _load_backup_config()
-            cfg['last_backup'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            _save_backup_config(cfg)
-            return jsonify({'success': True, 'filename': fname, 'message': f'Sauvegarde créée : {fname}'})
+    """Lance une sauvegarde manuelle en arrière-plan (suivi : /api/backup/status)."""
+    from models import DB_PATH
+    if not os.path.exists(DB_PATH):
         return jsonify({'success': False, 'error': 'Base de données introuvable'}), 404
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    try:
+        scheduler.trigger('backup', label='manuel')
+    except JobBusy:
+        return jsonify({'success': False, 'error': 'Une sauvegarde est déjà en cours'}), 409
+    return jsonify({'success': True, 'message': 'Sauvegarde lancée en arrière-plan'}), 202
+
+@bp.route('/api/backup/status')
+def api_backup_status():
+    """État de la tâche de sauvegarde : dernière exécution, avancement, prochaine échéance."""
+    cfg = _load_backup_config()
+    next_run = _next_auto_backup(cfg)
+    return jsonify({
+        'job': scheduler.status('backup'),
+        'progress': dict(_backup_progress),
+        'frequency': cfg.get('frequency', 'off'),
+        'next_run': next_run.strftime('%Y-%m-%d %H:%M:%S') if next_run else None,
+    })
+
+@bp.route('/api/backup/progress')
+def api_backup_progress():
+    return jsonify(dict(_backup_progress))
 
 @bp.route('/api/backup/list')
 def api_backup_list():
     folder = _get_backup_folder()
-    backups = []
+    items = []
     for fp in sorted(glob.glob(os.path.join(folder, '*.fabtrack')), key=os.path.getmtime, reverse=True):
         fname = os.path.basename(fp)
         stat = os.stat(fp)
-        backups.append({
+        header = backups.read_header(fp)
+        items.append({
             'filename': fname,
             'size_bytes': stat.st_size,
             'size_human': _human_size(stat.st_size),
             'created': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'kind': header['kind'],
+            'compression': header['compression'],
+            'base': header['base'],
         })
-    return jsonify(backups)
+    return jsonify(items)
 
 @bp.route('/api/backup/export/<filename>')
 def api_backup_export(filename):
@@ -358,15 +465,48 @@ def api_backup_export(filename):
     return send_file(fp, as_attachment=True, download_name=safe,
                      mimetype='application/octet-stream')
 
+class _SelfDeletingFile(io.FileIO):
+    """Instantané temporaire supprimé dès sa fermeture, c.-à-d. en fin d'envoi.
+
+    send_file() transmet le fichier tel quel au serveur WSGI (direct_passthrough) :
+    c'est le serveur qui ferme l'itérable, pas forcément la réponse Flask, donc
+    la suppression est portée par le fichier lui-même.
+    """
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+
 @bp.route('/api/backup/export-current')
 def api_backup_export_current():
     from models import DB_PATH
+    import tempfile
     if not os.path.exists(DB_PATH):
         return jsonify({'error': 'Base introuvable'}), 404
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(DB_PATH, as_attachment=True,
-                     download_name=f'fabtrack_export_{ts}.fabtrack',
-                     mimetype='application/octet-stream')
+    # Instantané cohérent (journal WAL inclus) plutôt que le fichier brut,
+    # envoyé depuis le disque par blocs au lieu d'être chargé en mémoire
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix='.fabtrack', dir=os.path.dirname(DB_PATH))
+    os.close(tmp_fd)
+    try:
+        backup_database(tmp_path)
+        snap = _SelfDeletingFile(tmp_path, 'rb')
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return jsonify({'error': str(e)}), 500
+    response = send_file(snap, as_attachment=True,
+                         download_name=f'fabtrack_export_{ts}.fabtrack',
+                         mimetype='application/octet-stream')
+    response.content_length = os.fstat(snap.fileno()).st_size
+    response.call_on_close(snap.close)
+    return response
 
 @bp.route('/api/backup/import', methods=['POST'])
 def api_backup_import():
@@ -380,15 +520,41 @@ def api_backup_import():
     import tempfile
     try:
         if os.path.exists(DB_PATH):
-            _create_backup('avant_import')
-        tmp_fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=BASE_DIR)
+            # Attend une éventuelle sauvegarde de fond, puis copie de sécurité à pleine vitesse
+            scheduler.run('backup', wait=600, label='avant_import', pause=0)
+        tmp_fd, upload_path = tempfile.mkstemp(suffix='.fabtrack', dir=BASE_DIR)
         os.close(tmp_fd)
-        f.save(tmp_path)
+        f.save(upload_path)
+        tmp_path = upload_path + '.db'
+        # Décompression + rejeu de la chaîne incrémentale (bases dans le dossier de sauvegarde)
+        try:
+            backups.restore(upload_path, _get_backup_folder(), tmp_path)
+        except (backups.BackupChainError, OSError, EOFError, lzma.LZMAError, ValueError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if isinstance(e, backups.BackupChainError):
+                return jsonify({'success': False, 'error': str(e)}), 400
+            return jsonify({'success': False, 'error': 'Le fichier n\'est pas une sauvegarde .fabtrack lisible'}), 400
+        finally:
+            os.remove(upload_path)
         try:
             test_conn = sqlite3.connect(tmp_path)
             tables = [r[0] for r in test_conn.execute(
                 "SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+            check = test_conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if 'jobs' in tables:
+                # La copie contient le bail de la sauvegarde qui l'a produite : on le libère
+                test_conn.execute("UPDATE jobs SET status = 'idle', owner = NULL, lease_until = NULL "
+                                  "WHERE status = 'running'")
+                test_conn.commit()
+            if 'reference_sync' in tables:
+                # Nouvel historique : les clients resynchronisent /api/reference en entier
+                test_conn.execute("UPDATE reference_sync SET epoch = lower(hex(randomblob(6)))")
+                test_conn.commit()
             test_conn.close()
+            if check != 'ok':
+                os.remove(tmp_path)
+                return jsonify({'success': False, 'error': f'Base corrompue (integrity_check : {check})'}), 400
             required = {'consommations', 'machines', 'materiaux', 'types_activite'}
             if not required.issubset(set(tables)):
                 os.remove(tmp_path)
@@ -397,8 +563,12 @@ def api_backup_import():
         except sqlite3.DatabaseError:
             os.remove(tmp_path)
             return jsonify({'success': False, 'error': 'Le fichier n\'est pas une base SQLite valide'}), 400
-        if os.path.exists(DB_PATH):
-            os.remove(DB_PATH)
+        # Les connexions du pool pointent sur l'ancien fichier : on les ferme
+        close_all_connections()
+        # Un -wal resté à côté serait rejoué sur la base importée
+        for path in (DB_PATH, DB_PATH + '-wal', DB_PATH + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
         shutil.move(tmp_path, DB_PATH)
         # Signaler qu'il faut réinitialiser la DB au prochain request
         from flask import current_app
@@ -419,6 +589,10 @@ def api_backup_delete(filename):
     fp = os.path.join(folder, safe)
     if not os.path.exists(fp):
         return jsonify({'success': False, 'error': 'Fichier introuvable'}), 404
+    needed_by = backups.dependents(folder, safe)
+    if needed_by:
+        return jsonify({'success': False,
+                        'error': f'Sauvegarde nécessaire à : {", ".join(sorted(needed_by))}'}), 409
     os.remove(fp)
     return jsonify({'success': True})
 
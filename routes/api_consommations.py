@@ -1,10 +1,11 @@
 """Routes API consommations — CRUD, batch, statistiques, export/import CSV."""
 
-from flask import Blueprint, request, jsonify, Response
-from models import get_db
-from routes.api_reference import rows_to_list, _resolve_nom
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from models import get_db, result_cache, begin_immediate
+from routes.api_reference import rows_to_list, _resolve_nom, _resolve_noms
+from routes.api_stock import _apply_stock_mouvement
 from datetime import datetime
-import csv, io
+import base64, csv, io, json
 
 bp = Blueprint('api_consommations', __name__)
 
@@ -69,7 +70,10 @@ def _consumed_qty_for_unit(action, stock_unit):
 
 
 def _decrease_stock_from_action(db, consommation_id, action):
-    """Décrémente le stock lié au matériau consommé; ne bloque jamais la saisie."""
+    """Décrémente le stock lié au matériau consommé; ne bloque jamais la saisie.
+
+    À appeler dans une transaction ouverte par begin_immediate() (voir _apply_stock_mouvement).
+    """
     materiau_id = action.get('materiau_id')
     try:
         materiau_id = int(materiau_id)
@@ -90,30 +94,108 @@ def _decrease_stock_from_action(db, consommation_id, action):
     if qty <= 0:
         return False
 
-    avant = float(article['quantite_actuelle'] or 0)
-    apres = avant - qty
+    return _apply_stock_mouvement(db, article['id'], 'sortie', qty, 'consommation',
+                                  notes=_stock_note(consommation_id, action)) is not None
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _stock_note(consommation_id, action):
     note = f"Consommation #{consommation_id}"
     commentaire = (action.get('commentaire') or '').strip()
     if commentaire:
         note += f" — {commentaire[:120]}"
+    return note
+
+
+def _decrease_stock_batch(db, conso_ids, actions):
+    """Version ensembliste de _decrease_stock_from_action pour un lot.
+
+    Une requête charge les articles actifs de tous les matériaux du lot ;
+    l'article choisi pour chaque action reste celui qu'aurait retenu la
+    boucle action par action (plus grande quantité courante, puis plus petit
+    id), les quantités étant suivies en mémoire. Les mouvements sont insérés
+    par executemany et chaque article n'est mis à jour qu'une fois. Lecture
+    et écriture se font sous le verrou pris par begin_immediate() : aucune
+    écriture concurrente ne peut s'intercaler entre les deux.
+    Retourne, par action, {article_id, article_nom, quantite, quantite_apres} ou None.
+    """
+    materiau_ids = sorted({m for m in (_int_or_none(a.get('materiau_id')) for a in actions) if m is not None})
+    candidats = {}
+    for i in range(0, len(materiau_ids), 500):
+        chunk = materiau_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        for r in db.execute(f'''
+            SELECT id, nom, unite, quantite_actuelle, materiau_id
+            FROM stock_articles
+            WHERE actif=1 AND materiau_id IN ({marks})
+        ''', chunk):
+            candidats.setdefault(r['materiau_id'], []).append(dict(r, quantite_actuelle=float(r['quantite_actuelle'] or 0)))
+
+    mouvements, touched, results = [], {}, []
+    for conso_id, action in zip(conso_ids, actions):
+        articles = candidats.get(_int_or_none(action.get('materiau_id')))
+        if not articles:
+            results.append(None)
+            continue
+        article = min(articles, key=lambda a: (-a['quantite_actuelle'], a['id']))
+        qty = _consumed_qty_for_unit(action, article['unite'])
+        if qty <= 0:
+            results.append(None)
+            continue
+        avant = article['quantite_actuelle']
+        apres = article['quantite_actuelle'] = avant - qty
+        touched[article['id']] = apres
+        mouvements.append((article['id'], qty, avant, apres, _stock_note(conso_id, action)))
+        results.append({'article_id': article['id'], 'article_nom': article['nom'],
+                        'quantite': qty, 'quantite_apres': apres})
+
+    if mouvements:
+        db.executemany('''
+            INSERT INTO stock_mouvements
+            (article_id, type, quantite, quantite_avant, quantite_apres, source, notes)
+            VALUES (?, 'sortie', ?, ?, ?, 'consommation', ?)
+        ''', mouvements)
+        db.executemany(
+            "UPDATE stock_articles SET quantite_actuelle=?, date_modification=datetime('now','localtime') WHERE id=?",
+            [(apres, article_id) for article_id, apres in touched.items()]
+        )
+    return results
 
-    db.execute('''
-        INSERT INTO stock_mouvements
-        (article_id, type, quantite, quantite_avant, quantite_apres, source, notes)
-        VALUES (?, 'sortie', ?, ?, ?, 'consommation', ?)
-    ''', (article['id'], qty, avant, apres, note))
 
-    db.execute(
-        "UPDATE stock_articles SET quantite_actuelle=?, date_modification=datetime('now','localtime') WHERE id=?",
-        (apres, article['id'])
-    )
-    return True
+# ── CRUD Consommations ──
 
+def _encode_cursor(row):
+    """Jeton opaque de pagination par curseur : (date_saisie, id) de la dernière ligne."""
+    raw = json.dumps([row['date_saisie'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    """Décode un jeton ``after`` ; lève ValueError s'il est invalide."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        date_saisie, row_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+        return str(date_saisie), int(row_id)
+    except Exception:
+        raise ValueError('Curseur invalide')
 
-# ── CRUD Consommations ──
 
 @bp.route('/api/consommations', methods=['GET'])
 def api_get_consommations():
+    """Liste paginée des consommations.
+
+    Deux modes :
+      - ``page``/``per_page`` (historique) : LIMIT/OFFSET + total exact ;
+      - curseur (``cursor=1`` pour la première page, puis ``after=<next_cursor>``) :
+        parcours par (date_saisie, id) via l'index idx_conso_date_id, coût constant
+        quelle que soit la profondeur. Le total n'est calculé que si ``with_total=1``.
+    """
     db = get_db()
     try:
         date_debut = request.args.get('date_debut','')
@@ -124,6 +206,9 @@ def api_get_consommations():
         referent_id= request.args.get('referent_id','')
         page     = max(1, int(request.args.get('page',1) or 1))
         per_page = min(max(1, int(request.args.get('per_page',50) or 50)), 10000)
+        after    = request.args.get('after', '')
+        cursor_mode = bool(after) or request.args.get('cursor', '') in ('1', 'true')
+        with_total  = request.args.get('with_total', '') in ('1', 'true')
 
         query = '''
             SELECT c.*,
@@ -159,6 +244,28 @@ def api_get_consommations():
                 query += f' AND {col} ?'; params.append(cast(val))
                 count_q += f' AND {col} ?'; cp.append(cast(val))
 
+        if cursor_mode:
+            if after:
+                try:
+                    after_date, after_id = _decode_cursor(after)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                query += ' AND (c.date_saisie, c.id) < (?, ?)'
+                params.extend([after_date, after_id])
+            query += ' ORDER BY c.date_saisie DESC, c.id DESC LIMIT ?'
+            params.append(per_page + 1)
+            rows = db.execute(query, params).fetchall()
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            result = {
+                'data': rows_to_list(rows),
+                'per_page': per_page,
+                'next_cursor': _encode_cursor(rows[-1]) if has_more else None,
+            }
+            if with_total:
+                result['total'] = db.execute(count_q, cp).fetchone()['total']
+            return jsonify(result)
+
         total = db.execute(count_q, cp).fetchone()['total']
         query += ' ORDER BY c.date_saisie DESC, c.created_at DESC LIMIT ? OFFSET ?'
         params.extend([per_page, (page-1)*per_page])
@@ -188,6 +295,7 @@ def api_create_consommation():
         nom_ref  = _resolve_nom(db, 'referents', data.get('referent_id'))
         nom_mat  = _resolve_nom(db, 'materiaux', data.get('materiau_id'))
 
+        begin_immediate(db)
         cur = db.execute('''
             INSERT INTO consommations (
                 date_saisie, preparateur_id, type_activite_id, machine_id,
@@ -219,10 +327,13 @@ def api_create_consommation():
         ))
 
         # Synchronisation stock non bloquante (on autorise les stocks négatifs).
+        db.execute('SAVEPOINT stock_conso')
         try:
             _decrease_stock_from_action(db, cur.lastrowid, data)
+            db.execute('RELEASE stock_conso')
         except Exception:
-            pass
+            db.execute('ROLLBACK TO stock_conso')
+            db.execute('RELEASE stock_conso')
 
         db.commit()
         return jsonify({'success':True,'id':cur.lastrowid}), 201
@@ -235,7 +346,13 @@ def api_create_consommation():
 
 @bp.route('/api/consommations/batch', methods=['POST'])
 def api_create_consommation_batch():
-    """Crée plusieurs consommations en une seule requête (multi-action saisie)."""
+    """Crée plusieurs consommations en une seule requête (multi-action saisie).
+
+    Traitement ensembliste : noms résolus par le cache des référentiels
+    (models.reference_names), un executemany pour les consommations, puis le stock du
+    lot (voir _decrease_stock_batch). ``results`` donne, par action et dans
+    l'ordre, l'id créé et la sortie de stock éventuelle.
+    """
     data = request.get_json()
     actions = data.get('actions', [])
     if not actions:
@@ -250,39 +367,40 @@ def api_create_consommation_batch():
     }
 
     db = get_db()
-    ids = []
     try:
-        nom_prep = _resolve_nom(db, 'preparateurs', common['preparateur_id'])
-        nom_cls  = _resolve_nom(db, 'classes', common['classe_id'])
-        nom_ref  = _resolve_nom(db, 'referents', common['referent_id'])
-
+        noms = {
+            table: _resolve_noms(db, table, ids) for table, ids in (
+                ('preparateurs', [common['preparateur_id']]),
+                ('classes', [common['classe_id']]),
+                ('referents', [common['referent_id']]),
+                ('types_activite', [a.get('type_activite_id') for a in actions]),
+                ('machines', [a.get('machine_id') for a in actions]),
+                ('materiaux', [a.get('materiau_id') for a in actions]),
+            )
+        }
+
+        def nom(table, id_val):
+            return noms[table].get(_int_or_none(id_val), '')
+
+        nom_prep = nom('preparateurs', common['preparateur_id'])
+        nom_cls  = nom('classes', common['classe_id'])
+        nom_ref  = nom('referents', common['referent_id'])
+
+        rows = []
         for action in actions:
             surface = None
             if action.get('longueur_mm') and action.get('largeur_mm'):
                 try: surface = (float(action['longueur_mm']) * float(action['largeur_mm'])) / 1e6
                 except (ValueError, TypeError): pass
 
-            nom_type = _resolve_nom(db, 'types_activite', action.get('type_activite_id'))
-            nom_mach = _resolve_nom(db, 'machines', action.get('machine_id'))
-            nom_mat  = _resolve_nom(db, 'materiaux', action.get('materiau_id'))
-
-            cur = db.execute('''
-                INSERT INTO consommations (
-                    date_saisie, preparateur_id, type_activite_id, machine_id,
-                    classe_id, referent_id, materiau_id,
-                    nom_preparateur, nom_type_activite, nom_machine, nom_classe, nom_referent, nom_materiau,
-                    quantite, unite,
-                    poids_grammes, longueur_mm, largeur_mm, surface_m2, epaisseur,
-                    nb_feuilles, format_papier,
-                    nb_feuilles_plastique, type_feuille, commentaire,
-                    impression_couleur, projet_nom
-                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            ''', (
+            rows.append((
                 common['date_saisie'], common['preparateur_id'],
                 action.get('type_activite_id'), action.get('machine_id') or None,
                 common.get('classe_id') or None, common.get('referent_id') or None,
                 action.get('materiau_id') or None,
-                nom_prep, nom_type, nom_mach, nom_cls, nom_ref, nom_mat,
+                nom_prep, nom('types_activite', action.get('type_activite_id')),
+                nom('machines', action.get('machine_id')), nom_cls, nom_ref,
+                nom('materiaux', action.get('materiau_id')),
                 action.get('quantite') or 0, action.get('unite', ''),
                 action.get('poids_grammes') or None,
                 action.get('longueur_mm') or None, action.get('largeur_mm') or None,
@@ -293,17 +411,38 @@ def api_create_consommation_batch():
                 action.get('type_feuille') or None, action.get('commentaire', ''),
                 action.get('impression_couleur', ''), common['projet_nom'],
             ))
-            conso_id = cur.lastrowid
-            ids.append(conso_id)
 
-            # Synchronisation stock non bloquante (on autorise les stocks négatifs).
-            try:
-                _decrease_stock_from_action(db, conso_id, action)
-            except Exception:
-                pass
+        begin_immediate(db)
+        db.executemany('''
+            INSERT INTO consommations (
+                date_saisie, preparateur_id, type_activite_id, machine_id,
+                classe_id, referent_id, materiau_id,
+                nom_preparateur, nom_type_activite, nom_machine, nom_classe, nom_referent, nom_materiau,
+                quantite, unite,
+                poids_grammes, longueur_mm, largeur_mm, surface_m2, epaisseur,
+                nb_feuilles, format_papier,
+                nb_feuilles_plastique, type_feuille, commentaire,
+                impression_couleur, projet_nom
+            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        ''', rows)
+        # La transaction détient le verrou d'écriture depuis BEGIN IMMEDIATE :
+        # les ids AUTOINCREMENT du lot sont consécutifs et finissent au dernier inséré.
+        last_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+        ids = list(range(last_id - len(rows) + 1, last_id + 1))
+
+        # Synchronisation stock non bloquante (on autorise les stocks négatifs).
+        db.execute('SAVEPOINT stock_batch')
+        try:
+            stock = _decrease_stock_batch(db, ids, actions)
+            db.execute('RELEASE stock_batch')
+        except Exception:
+            db.execute('ROLLBACK TO stock_batch')
+            db.execute('RELEASE stock_batch')
+            stock = [None] * len(ids)
 
         db.commit()
-        return jsonify({'success': True, 'ids': ids, 'count': len(ids)}), 201
+        results = [{'index': i, 'id': conso_id, 'stock': s} for i, (conso_id, s) in enumerate(zip(ids, stock))]
+        return jsonify({'success': True, 'ids': ids, 'count': len(ids), 'results': results}), 201
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -377,100 +516,112 @@ def api_update_consommation(id):
 
 
 # ── Statistiques ──
+# Toutes les statistiques lisent consommations_daily_agg (agrégat maintenu par
+# triggers, cf. models._migration_003_daily_agg) au lieu de re-parcourir
+# consommations. Les bornes de dates sont donc à la journée.
+
+def _stats_where(dd, df):
+    """Filtre de période sur l'agrégat (bornes incluses, au jour près)."""
+    w = '1=1'; p = []
+    if dd: w += ' AND a.jour >= ?'; p.append(dd[:10])
+    if df: w += ' AND a.jour <= ?'; p.append(df[:10])
+    return w, p
+
 
 @bp.route('/api/stats/summary')
+@result_cache.cached_view
 def api_stats_summary():
+    """Synthèse de la période en un seul parcours de l'agrégat.
+
+    Une unique requête regroupe l'agrégat par (type, préparateur) et calcule
+    toutes les mesures par agrégation conditionnelle ; les totaux et les
+    ventilations par type / par préparateur sont ensuite repliés en Python.
+    """
     db = get_db()
     try:
-        dd = request.args.get('date_debut','')
-        df = request.args.get('date_fin','')
-        w = '1=1'; p = []
-        if dd: w+=' AND c.date_saisie >= ?'; p.append(dd)
-        if df: w+=' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59' if df and len(df) == 10 else df)
-
-        total = db.execute(f'SELECT COUNT(*) as n FROM consommations c WHERE {w}', p).fetchone()['n']
-
-        by_type = rows_to_list(db.execute(f'''
-            SELECT t.nom,t.icone,t.couleur,t.badge_class,COUNT(*) as count
-            FROM consommations c JOIN types_activite t ON c.type_activite_id=t.id
-            WHERE {w} GROUP BY t.id ORDER BY count DESC''', p).fetchall())
-
-        by_prep = rows_to_list(db.execute(f'''
-            SELECT p.nom,COUNT(*) as count FROM consommations c
-            JOIN preparateurs p ON c.preparateur_id=p.id
-            WHERE {w} GROUP BY p.id ORDER BY count DESC''', p).fetchall())
-
-        total_3d = db.execute(f'''
-            SELECT COALESCE(SUM(c.poids_grammes),0) as t FROM consommations c
-            JOIN types_activite t ON c.type_activite_id=t.id
-            WHERE t.unite_defaut='g' AND {w}''', p).fetchone()['t']
-
-        total_decoupe = db.execute(f'''
-            SELECT COALESCE(SUM(c.surface_m2),0) as t FROM consommations c
-            JOIN types_activite t ON c.type_activite_id=t.id
-            WHERE t.unite_defaut='m²' AND {w}''', p).fetchone()['t']
-
-        total_papier = db.execute(f'''
-            SELECT COALESCE(SUM(c.nb_feuilles),0) as t FROM consommations c
-            JOIN types_activite t ON c.type_activite_id=t.id
-            WHERE t.unite_defaut='feuilles' AND {w}''', p).fetchone()['t']
-
-        papier_detail = db.execute(f'''
-            SELECT
-                COALESCE(SUM(CASE WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%Couleur%' THEN c.nb_feuilles ELSE 0 END),0) as couleur,
-                COALESCE(SUM(CASE WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%N&B%' THEN c.nb_feuilles ELSE 0 END),0) as nb
-            FROM consommations c
-            JOIN types_activite t ON c.type_activite_id=t.id
-            LEFT JOIN materiaux mat ON c.materiau_id=mat.id
-            WHERE t.unite_defaut='feuilles' AND {w}''', p).fetchone()
+        w, p = _stats_where(request.args.get('date_debut',''), request.args.get('date_fin',''))
+        groups = db.execute(f'''
+            SELECT t.id as tid, t.nom as t_nom, t.icone, t.couleur, t.badge_class,
+                   pr.id as pid, pr.nom as p_nom,
+                   SUM(a.nb) as n,
+                   SUM(CASE WHEN t.unite_defaut='g' THEN a.poids_grammes ELSE 0 END) as grammes,
+                   SUM(CASE WHEN t.unite_defaut='m²' THEN a.surface_m2 ELSE 0 END) as m2,
+                   SUM(CASE WHEN t.unite_defaut='feuilles' THEN a.nb_feuilles ELSE 0 END) as feuilles,
+                   SUM(CASE WHEN t.unite_defaut='feuilles' AND a.impression='Couleur' THEN a.nb_feuilles ELSE 0 END) as feuilles_couleur,
+                   SUM(CASE WHEN t.unite_defaut='feuilles' AND a.impression='N&B' THEN a.nb_feuilles ELSE 0 END) as feuilles_nb
+            FROM consommations_daily_agg a
+            LEFT JOIN types_activite t ON a.type_activite_id=t.id
+            LEFT JOIN preparateurs pr ON a.preparateur_id=pr.id
+            WHERE {w} GROUP BY a.type_activite_id, a.preparateur_id
+            ORDER BY a.type_activite_id, a.preparateur_id''', p).fetchall()
+
+        total = 0
+        total_3d = total_decoupe = total_papier = couleur = noir_blanc = 0
+        by_type, by_prep = {}, {}
+        for g in groups:
+            total += g['n']
+            total_3d += g['grammes'] or 0
+            total_decoupe += g['m2'] or 0
+            total_papier += g['feuilles'] or 0
+            couleur += g['feuilles_couleur'] or 0
+            noir_blanc += g['feuilles_nb'] or 0
+            if g['tid'] is not None:
+                entry = by_type.setdefault(g['tid'], {
+                    'nom': g['t_nom'], 'icone': g['icone'], 'couleur': g['couleur'],
+                    'badge_class': g['badge_class'], 'count': 0})
+                entry['count'] += g['n']
+            if g['pid'] is not None:
+                by_prep.setdefault(g['pid'], {'nom': g['p_nom'], 'count': 0})['count'] += g['n']
 
         return jsonify({
             'total_interventions': total,
-            'by_type': by_type, 'by_preparateur': by_prep,
+            'by_type': _sorted_by_count(by_type), 'by_preparateur': _sorted_by_count(by_prep),
             'total_3d_grammes': round(total_3d, 1),
             'total_decoupe_m2': round(total_decoupe, 3),
             'total_papier_feuilles': int(total_papier),
-            'total_papier_couleur': int(papier_detail['couleur']),
-            'total_papier_nb': int(papier_detail['nb']),
+            'total_papier_couleur': int(couleur),
+            'total_papier_nb': int(noir_blanc),
         })
     finally:
         db.close()
 
 
+def _sorted_by_count(groups):
+    """Ventilation triée par nombre décroissant (à égalité : ordre des identifiants)."""
+    return sorted((groups[k] for k in sorted(groups)), key=lambda e: -e['count'])
+
+
 @bp.route('/api/stats/activity')
+@result_cache.cached_view
 def api_stats_activity():
     """Statistiques d'activité journalière : répartition par heure, par jour de semaine, filtrable."""
     db = get_db()
     try:
-        dd = request.args.get('date_debut', '')
-        df = request.args.get('date_fin', '')
         prep_id = request.args.get('preparateur_id', '')
         machine_id = request.args.get('machine_id', '')
-        w = '1=1'; p = []
-        if dd: w += ' AND c.date_saisie >= ?'; p.append(dd)
-        if df: w += ' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59' if df and len(df) == 10 else df)
-        if prep_id: w += ' AND c.preparateur_id = ?'; p.append(int(prep_id))
-        if machine_id: w += ' AND c.machine_id = ?'; p.append(int(machine_id))
+        w, p = _stats_where(request.args.get('date_debut', ''), request.args.get('date_fin', ''))
+        if prep_id: w += ' AND a.preparateur_id = ?'; p.append(int(prep_id))
+        if machine_id: w += ' AND a.machine_id = ?'; p.append(int(machine_id))
 
         by_hour = rows_to_list(db.execute(f'''
-            SELECT CAST(strftime('%H', c.date_saisie) AS INTEGER) as hour, COUNT(*) as count
-            FROM consommations c WHERE {w}
-            GROUP BY hour ORDER BY hour
+            SELECT NULLIF(a.heure, -1) as hour, SUM(a.nb) as count
+            FROM consommations_daily_agg a WHERE {w}
+            GROUP BY a.heure ORDER BY a.heure
         ''', p).fetchall())
 
         by_dow = rows_to_list(db.execute(f'''
-            SELECT CAST(strftime('%w', c.date_saisie) AS INTEGER) as dow, COUNT(*) as count
-            FROM consommations c WHERE {w}
-            GROUP BY dow ORDER BY dow
+            SELECT a.dow as dow, SUM(a.nb) as count
+            FROM consommations_daily_agg a WHERE {w}
+            GROUP BY a.dow ORDER BY a.dow
         ''', p).fetchall())
 
         by_hour_prep = rows_to_list(db.execute(f'''
-            SELECT CAST(strftime('%H', c.date_saisie) AS INTEGER) as hour,
-                   pr.nom as preparateur, COUNT(*) as count
-            FROM consommations c
-            JOIN preparateurs pr ON c.preparateur_id=pr.id
+            SELECT NULLIF(a.heure, -1) as hour,
+                   pr.nom as preparateur, SUM(a.nb) as count
+            FROM consommations_daily_agg a
+            JOIN preparateurs pr ON a.preparateur_id=pr.id
             WHERE {w}
-            GROUP BY hour, pr.id ORDER BY hour
+            GROUP BY a.heure, a.preparateur_id ORDER BY a.heure
         ''', p).fetchall())
 
         return jsonify({
@@ -483,62 +634,63 @@ def api_stats_activity():
 
 
 @bp.route('/api/stats/timeline')
+@result_cache.cached_view
 def api_stats_timeline():
     db = get_db()
     try:
-        dd = request.args.get('date_debut','')
-        df = request.args.get('date_fin','')
         gb = request.args.get('group_by','month')
-        w = '1=1'; p = []
-        if dd: w+=' AND c.date_saisie >= ?'; p.append(dd)
-        if df: w+=' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59' if df and len(df) == 10 else df)
-
-        dex = {"day":"strftime('%Y-%m-%d',c.date_saisie)","week":"strftime('%Y-W%W',c.date_saisie)","month":"strftime('%Y-%m',c.date_saisie)"}.get(gb,"strftime('%Y-%m',c.date_saisie)")
+        w, p = _stats_where(request.args.get('date_debut',''), request.args.get('date_fin',''))
+
+        dex, fmt = {"day": ("a.jour", None), "week": ("a.semaine", '%Y-W%W')}.get(gb, ("a.mois", '%Y-%m'))
+        if fmt:
+            # Bornes redondantes sur la colonne de regroupement : la requête
+            # parcourt alors l'index de la période (déjà trié) plutôt que la table.
+            for arg, op in (('date_debut', '>='), ('date_fin', '<=')):
+                try:
+                    bound = datetime.strptime(request.args.get(arg, '')[:10], '%Y-%m-%d').strftime(fmt)
+                except ValueError:
+                    continue
+                w += f' AND {dex} {op} ?'; p.append(bound)
 
         timeline = rows_to_list(db.execute(f'''
-            SELECT {dex} as period,t.nom as type_nom,t.couleur,COUNT(*) as count
-            FROM consommations c JOIN types_activite t ON c.type_activite_id=t.id
-            WHERE {w} GROUP BY period,t.id ORDER BY period''', p).fetchall())
+            SELECT {dex} as period,t.nom as type_nom,t.couleur,SUM(a.nb) as count
+            FROM consommations_daily_agg a JOIN types_activite t ON a.type_activite_id=t.id
+            WHERE {w} GROUP BY period,a.type_activite_id ORDER BY period,a.type_activite_id''', p).fetchall())
 
         timeline_3d = rows_to_list(db.execute(f'''
             SELECT {dex} as period, mat.nom as materiau,
-                   COALESCE(SUM(c.poids_grammes),0) as total_g
-            FROM consommations c JOIN types_activite t ON c.type_activite_id=t.id
-            LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+                   COALESCE(SUM(a.poids_grammes),0) as total_g
+            FROM consommations_daily_agg a JOIN types_activite t ON a.type_activite_id=t.id
+            LEFT JOIN materiaux mat ON a.materiau_id=mat.id
             WHERE t.unite_defaut='g' AND {w}
             GROUP BY period,mat.nom ORDER BY period''', p).fetchall())
 
         timeline_decoupe = rows_to_list(db.execute(f'''
             SELECT {dex} as period, mat.nom as materiau,
-                   COALESCE(SUM(c.surface_m2),0) as total_m2
-            FROM consommations c JOIN types_activite t ON c.type_activite_id=t.id
-            LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+                   COALESCE(SUM(a.surface_m2),0) as total_m2
+            FROM consommations_daily_agg a JOIN types_activite t ON a.type_activite_id=t.id
+            LEFT JOIN materiaux mat ON a.materiau_id=mat.id
             WHERE t.unite_defaut='m²' AND {w}
             GROUP BY period,mat.nom ORDER BY period''', p).fetchall())
 
         timeline_papier = rows_to_list(db.execute(f'''
             SELECT {dex} as period,
-                   CASE
-                       WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%Couleur%' THEN 'Couleur'
-                       WHEN COALESCE(mat.nom, c.nom_materiau) LIKE '%N&B%' THEN 'N&B'
-                       ELSE 'Autre'
-                   END as type_impression,
-                   COALESCE(SUM(c.nb_feuilles),0) as total_feuilles
-            FROM consommations c
-            JOIN types_activite t ON c.type_activite_id=t.id
-            LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+                   CASE WHEN a.impression = '' THEN 'Autre' ELSE a.impression END as type_impression,
+                   COALESCE(SUM(a.nb_feuilles),0) as total_feuilles
+            FROM consommations_daily_agg a
+            JOIN types_activite t ON a.type_activite_id=t.id
             WHERE t.unite_defaut='feuilles' AND {w}
             GROUP BY period, type_impression ORDER BY period''', p).fetchall())
 
         top_machines = rows_to_list(db.execute(f'''
-            SELECT m.nom,t.nom as type_nom,t.couleur,COUNT(*) as count
-            FROM consommations c JOIN machines m ON c.machine_id=m.id
-            JOIN types_activite t ON c.type_activite_id=t.id
+            SELECT m.nom,t.nom as type_nom,t.couleur,SUM(a.nb) as count
+            FROM consommations_daily_agg a JOIN machines m ON a.machine_id=m.id
+            JOIN types_activite t ON a.type_activite_id=t.id
             WHERE {w} GROUP BY m.id ORDER BY count DESC LIMIT 10''', p).fetchall())
 
         top_classes = rows_to_list(db.execute(f'''
-            SELECT cl.nom,COUNT(*) as count FROM consommations c
-            JOIN classes cl ON c.classe_id=cl.id
+            SELECT cl.nom,SUM(a.nb) as count FROM consommations_daily_agg a
+            JOIN classes cl ON a.classe_id=cl.id
             WHERE {w} GROUP BY cl.id ORDER BY count DESC LIMIT 10''', p).fetchall())
 
         return jsonify({
@@ -553,58 +705,74 @@ def api_stats_timeline():
 
 # ── Export CSV ──
 
-@bp.route('/api/export/csv')
-def api_export_csv():
+EXPORT_CSV_CHUNK = 500  # lignes lues par fetchmany() puis envoyées au client
+
+EXPORT_CSV_HEADER = ['Date','Préparateur','Type activité','Machine','Classe',
+                     'Référent','Catégorie réf.','Matériau',
+                     'Poids (g)','Surface (m²)','Longueur (mm)','Largeur (mm)',
+                     'Épaisseur','Nb feuilles','Format papier','Impression couleur',
+                     'Nb feuilles plastique','Type feuille','Projet','Commentaire']
+
+
+def _iter_export_csv(query, params):
+    """Génère l'export CSV par paquets : mémoire constante quelle que soit la période."""
+    buf = io.StringIO()
+    wr = csv.writer(buf, delimiter=';')
+    buf.write('\ufeff')
+    wr.writerow(EXPORT_CSV_HEADER)
+    yield buf.getvalue()
+
     db = get_db()
     try:
-        dd = request.args.get('date_debut','')
-        df = request.args.get('date_fin','')
-        ta = request.args.get('type_activite_id','')
-        w = '1=1'; p = []
-        if dd: w+=' AND c.date_saisie >= ?'; p.append(dd)
-        if df: w+=' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59' if df and len(df) == 10 else df)
-        if ta: w+=' AND c.type_activite_id = ?'; p.append(int(ta))
-
-        rows = db.execute(f'''
-            SELECT c.date_saisie,
-                   COALESCE(p.nom, c.nom_preparateur) as preparateur,
-                   COALESCE(t.nom, c.nom_type_activite) as type_activite,
-                   COALESCE(m.nom, c.nom_machine) as machine,
-                   COALESCE(cl.nom, c.nom_classe) as classe,
-                   COALESCE(r.nom, c.nom_referent) as referent,
-                   r.categorie as ref_categorie,
-                   COALESCE(mat.nom, c.nom_materiau) as materiau,
-                   c.poids_grammes,c.surface_m2,c.longueur_mm,c.largeur_mm,
-                   c.epaisseur,c.nb_feuilles,c.format_papier,c.impression_couleur,
-                   c.nb_feuilles_plastique,c.type_feuille,c.projet_nom,c.commentaire
-            FROM consommations c
-            LEFT JOIN preparateurs p ON c.preparateur_id=p.id
-            LEFT JOIN types_activite t ON c.type_activite_id=t.id
-            LEFT JOIN machines m ON c.machine_id=m.id
-            LEFT JOIN classes cl ON c.classe_id=cl.id
-            LEFT JOIN referents r ON c.referent_id=r.id
-            LEFT JOIN materiaux mat ON c.materiau_id=mat.id
-            WHERE {w} ORDER BY c.date_saisie DESC
-        ''', p).fetchall()
-
-        out = io.StringIO()
-        out.write('\ufeff')
-        wr = csv.writer(out, delimiter=';')
-        wr.writerow(['Date','Préparateur','Type activité','Machine','Classe',
-                      'Référent','Catégorie réf.','Matériau',
-                      'Poids (g)','Surface (m²)','Longueur (mm)','Largeur (mm)',
-                      'Épaisseur','Nb feuilles','Format papier','Impression couleur',
-                      'Nb feuilles plastique','Type feuille','Projet','Commentaire'])
-        for row in rows:
-            wr.writerow([row[k] or '' for k in row.keys()])
-
-        out.seek(0)
-        return Response(out.getvalue(), mimetype='text/csv',
-                        headers={'Content-Disposition':f'attachment; filename=fabtrack_export_{datetime.now().strftime("%Y%m%d")}.csv'})
+        cur = db.execute(query, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_CSV_CHUNK)
+            if not rows:
+                break
+            buf.seek(0); buf.truncate()
+            for row in rows:
+                wr.writerow([v or '' for v in row])
+            yield buf.getvalue()
     finally:
         db.close()
 
 
+@bp.route('/api/export/csv')
+def api_export_csv():
+    dd = request.args.get('date_debut','')
+    df = request.args.get('date_fin','')
+    ta = request.args.get('type_activite_id','')
+    w = '1=1'; p = []
+    if dd: w+=' AND c.date_saisie >= ?'; p.append(dd)
+    if df: w+=' AND c.date_saisie <= ?'; p.append(df + ' 23:59:59' if df and len(df) == 10 else df)
+    if ta: w+=' AND c.type_activite_id = ?'; p.append(int(ta))
+
+    query = f'''
+        SELECT c.date_saisie,
+               COALESCE(p.nom, c.nom_preparateur) as preparateur,
+               COALESCE(t.nom, c.nom_type_activite) as type_activite,
+               COALESCE(m.nom, c.nom_machine) as machine,
+               COALESCE(cl.nom, c.nom_classe) as classe,
+               COALESCE(r.nom, c.nom_referent) as referent,
+               r.categorie as ref_categorie,
+               COALESCE(mat.nom, c.nom_materiau) as materiau,
+               c.poids_grammes,c.surface_m2,c.longueur_mm,c.largeur_mm,
+               c.epaisseur,c.nb_feuilles,c.format_papier,c.impression_couleur,
+               c.nb_feuilles_plastique,c.type_feuille,c.projet_nom,c.commentaire
+        FROM consommations c
+        LEFT JOIN preparateurs p ON c.preparateur_id=p.id
+        LEFT JOIN types_activite t ON c.type_activite_id=t.id
+        LEFT JOIN machines m ON c.machine_id=m.id
+        LEFT JOIN classes cl ON c.classe_id=cl.id
+        LEFT JOIN referents r ON c.referent_id=r.id
+        LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+        WHERE {w} ORDER BY c.date_saisie DESC
+    '''
+
+    return Response(stream_with_context(_iter_export_csv(query, p)), mimetype='text/csv',
+                    headers={'Content-Disposition':f'attachment; filename=fabtrack_export_{datetime.now().strftime("%Y%m%d")}.csv'})
+
+
 # ── Gabarits CSV ──
 
 CSV_TEMPLATES = {
@@ -1,19 +1,53 @@
-"""Route API Raise3D — statut temps-réel des imprimantes."""
+"""Route API Raise3D — statut temps-réel des imprimantes et historique télémétrie."""
 
-from flask import Blueprint, jsonify
+from datetime import datetime, timedelta
+from flask import Blueprint, jsonify, request
 import raise3d
+import telemetry
 import logging
 
 bp = Blueprint('api_raise3d', __name__)
 logger = logging.getLogger(__name__)
 
+# Au-delà de la rétention du niveau le plus grossier, l'historique est vide
+TELEMETRY_MAX_HOURS = max(telemetry.RETENTION.values()) // 3600
+
 
 @bp.route('/api/raise3d/status')
 def api_raise3d_status():
-    """Retourne le statut temps-réel de toutes les imprimantes Raise3D."""
+    """Retourne le dernier relevé des imprimantes Raise3D et son ancienneté."""
     try:
-        statuses = raise3d.get_all_status(timeout=5)
-        return jsonify({"printers": statuses})
+        return jsonify(raise3d.get_status_snapshot())
     except Exception as e:
         logger.error(f"Raise3D status error: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/raise3d/telemetry')
+def api_raise3d_telemetry():
+    """Historique sous-échantillonné (températures, progression, statut).
+
+    Paramètres : printer_id (défaut : toutes), date_debut / date_fin (ISO)
+    ou hours (défaut 24), points (nombre max de points par imprimante, défaut 720).
+    """
+    try:
+        fin = datetime.fromisoformat(request.args['date_fin']) if request.args.get('date_fin') else datetime.now()
+        if request.args.get('date_debut'):
+            debut = datetime.fromisoformat(request.args['date_debut'])
+        else:
+            hours = min(max(0.0, float(request.args.get('hours', 24))), TELEMETRY_MAX_HOURS)
+            debut = fin - timedelta(hours=hours)
+        points = min(max(1, int(request.args.get('points', 720))), 5000)
+    except (ValueError, OverflowError):
+        return jsonify({"error": "Paramètres de période invalides"}), 400
+
+    # Le relevé de fond alimente l'historique : s'assurer qu'il tourne.
+    raise3d.get_status_snapshot()
+    printer_id = request.args.get('printer_id', '')
+    ids = [printer_id] if printer_id else [p["id"] for p in raise3d.RAISE3D_PRINTERS]
+    start, end = int(debut.timestamp()), int(fin.timestamp())
+    return jsonify({
+        "date_debut": debut.isoformat(timespec="seconds"),
+        "date_fin": fin.isoformat(timespec="seconds"),
+        "printers": [telemetry.store.query(pid, start, end, points) for pid in ids],
+    })
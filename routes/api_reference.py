@@ -2,8 +2,9 @@
 
 import sqlite3
 
-from flask import Blueprint, request, jsonify
-from models import get_db, init_db
+from flask import Blueprint, Response, request, jsonify
+from models import (get_db, init_db, result_cache, reference_names, REFERENCE_TABLES,
+                    REFERENCE_SYNC_TABLES)
 
 bp = Blueprint('api_reference', __name__)
 
@@ -12,55 +13,162 @@ def rows_to_list(rows):
     return [dict(r) for r in rows]
 
 
+def _ref_id(id_val):
+    try:
+        return int(id_val)
+    except (ValueError, TypeError):
+        return None
+
+
 def _resolve_nom(db, table, id_val):
-    """Résout un nom à partir d'un ID dans une table de référence."""
-    ALLOWED = {'preparateurs', 'types_activite', 'machines', 'classes', 'referents', 'materiaux'}
-    if not id_val or table not in ALLOWED:
+    """Résout un nom à partir d'un ID dans une table de référence (cache en mémoire)."""
+    if not id_val or table not in REFERENCE_TABLES:
         return ''
-    row = db.execute(f'SELECT nom FROM {table} WHERE id=?', (id_val,)).fetchone()
-    return row['nom'] if row else ''
+    return reference_names.names(db, table).get(_ref_id(id_val), '')
+
+
+def _resolve_noms(db, table, id_vals):
+    """Noms de plusieurs IDs d'une table de référence : {id (int): nom}.
+
+    Les IDs vides ou non numériques sont ignorés (nom '' côté appelant).
+    """
+    if table not in REFERENCE_TABLES:
+        return {}
+    names = reference_names.names(db, table)
+    ids = {_ref_id(v) for v in id_vals if v}
+    return {i: names[i] for i in ids if i in names}
 
 
 # ── Données de référence ──
 
-@bp.route('/api/reference')
-def api_reference():
+# Listes servies par /api/reference : (table, filtre, tri). Une ligne désactivée
+# (actif=0) sort de la liste : en mode ``since`` elle est signalée dans ``removed``.
+_REFERENCE_LISTS = (
+    ('preparateurs', 'actif=1', 'nom'),
+    ('types_activite', 'actif=1', 'id'),
+    ('machines', 'actif=1', 'type_activite_id, nom'),
+    ('materiaux', 'actif=1', 'nom'),
+    ('materiau_machine', '1=1', 'materiau_id, machine_id'),
+    ('classes', 'actif=1', 'nom'),
+    ('referents', 'actif=1', 'categorie, nom'),
+)
+
+
+def _reference_version(db):
+    """Jeton de version des données de référence : ``<epoch>.<version>``."""
+    row = db.execute('SELECT epoch, version FROM reference_sync WHERE id = 1').fetchone()
+    return f"{row['epoch']}.{row['version']}"
+
+
+def _read_reference_version():
+    db = get_db()
+    try:
+        return _reference_version(db)
+    except sqlite3.OperationalError:
+        return None  # base à réparer : la lecture complète s'en charge
+    finally:
+        db.close()
+
+
+def _since_version(token, current):
+    """Version numérique d'un jeton ``since`` du même historique, sinon None."""
+    epoch, _, version = (token or '').partition('.')
+    current_epoch, _, current_version = current.partition('.')
+    try:
+        version = int(version)
+    except ValueError:
+        return None
+    if epoch != current_epoch or version > int(current_version):
+        return None
+    return version
+
+
+def _row_key(table, row):
+    if table == 'materiau_machine':
+        return f"{row['materiau_id']}:{row['machine_id']}"
+    return row['id']
+
+
+def _reference_payload(db, since):
+    db.execute('BEGIN')  # version et lignes lues dans le même instantané
+    try:
+        version = _reference_version(db)
+        since_version = _since_version(since, version) if since else None
+        payload = {'version': version, 'full': since_version is None}
+        if since_version is None:
+            for table, where, order in _REFERENCE_LISTS:
+                payload[table] = rows_to_list(db.execute(
+                    f'SELECT * FROM {table} WHERE {where} ORDER BY {order}').fetchall())
+            return payload
+
+        changed = {}
+        for r in db.execute('SELECT tbl, row_key FROM reference_changes WHERE version > ?', (since_version,)):
+            changed.setdefault(r['tbl'], []).append(r['row_key'])
+        payload['removed'] = {}
+        for table, where, order in _REFERENCE_LISTS:
+            keys = changed.get(table)
+            if not keys:
+                payload[table] = []
+                continue
+            key_sql = REFERENCE_SYNC_TABLES[table].format(row=table)
+            rows = db.execute(f'''
+                SELECT * FROM {table}
+                WHERE {where} AND {key_sql} IN (
+                    SELECT row_key FROM reference_changes WHERE tbl = ? AND version > ?)
+                ORDER BY {order}
+            ''', (table, since_version)).fetchall()
+            payload[table] = rows_to_list(rows)
+            present = {_row_key(table, r) for r in rows}
+            removed = [k for k in keys if k not in present]
+            if table == 'materiau_machine':
+                removed = [[int(x) for x in k.split(':')] for k in removed]
+            if removed:
+                payload['removed'][table] = removed
+        return payload
+    finally:
+        db.commit()
+
+
+def _reference_body(since):
     db = get_db()
     try:
         try:
-            return jsonify({
-                'preparateurs':  rows_to_list(db.execute('SELECT * FROM preparateurs WHERE actif=1 ORDER BY nom').fetchall()),
-                'types_activite':rows_to_list(db.execute('SELECT * FROM types_activite WHERE actif=1 ORDER BY id').fetchall()),
-                'machines':      rows_to_list(db.execute('SELECT * FROM machines WHERE actif=1 ORDER BY type_activite_id, nom').fetchall()),
-                'materiaux':     rows_to_list(db.execute('SELECT * FROM materiaux WHERE actif=1 ORDER BY nom').fetchall()),
-                'materiau_machine': rows_to_list(db.execute('SELECT * FROM materiau_machine').fetchall()),
-                'classes':       rows_to_list(db.execute('SELECT * FROM classes WHERE actif=1 ORDER BY nom').fetchall()),
-                'referents':     rows_to_list(db.execute('SELECT * FROM referents WHERE actif=1 ORDER BY categorie, nom').fetchall()),
-            })
+            payload = _reference_payload(db, since)
         except sqlite3.OperationalError as e:
             # Auto-répare les cas "no such table" observés après certaines réinitialisations.
             if 'no such table' not in str(e).lower():
                 raise
             db.close()
-            init_db()
-            db2 = get_db()
-            try:
-                return jsonify({
-                    'preparateurs':  rows_to_list(db2.execute('SELECT * FROM preparateurs WHERE actif=1 ORDER BY nom').fetchall()),
-                    'types_activite':rows_to_list(db2.execute('SELECT * FROM types_activite WHERE actif=1 ORDER BY id').fetchall()),
-                    'machines':      rows_to_list(db2.execute('SELECT * FROM machines WHERE actif=1 ORDER BY type_activite_id, nom').fetchall()),
-                    'materiaux':     rows_to_list(db2.execute('SELECT * FROM materiaux WHERE actif=1 ORDER BY nom').fetchall()),
-                    'materiau_machine': rows_to_list(db2.execute('SELECT * FROM materiau_machine').fetchall()),
-                    'classes':       rows_to_list(db2.execute('SELECT * FROM classes WHERE actif=1 ORDER BY nom').fetchall()),
-                    'referents':     rows_to_list(db2.execute('SELECT * FROM referents WHERE actif=1 ORDER BY categorie, nom').fetchall()),
-                })
-            finally:
-                db2.close()
+            init_db(force=True)
+            db = get_db()
+            payload = _reference_payload(db, since)
     finally:
-        try:
-            db.close()
-        except Exception:
-            pass
+        db.close()
+    return payload['version'], jsonify(payload).get_data()
+
+
+def _reference_headers(resp, version):
+    resp.set_etag(version)
+    resp.headers['Cache-Control'] = 'no-cache'  # toujours revalider (If-None-Match)
+    return resp
+
+
+@bp.route('/api/reference')
+def api_reference():
+    """Données de référence actives, versionnées.
+
+    L'ETag (fort) est le jeton de version : un client à jour reçoit 304.
+    ``?since=<version>`` ne renvoie que les lignes modifiées depuis cette
+    version, et dans ``removed`` les clés supprimées ou désactivées. Un jeton
+    d'un autre historique (base réinitialisée, sauvegarde importée) ou
+    invalide donne la réponse complète (``full`` à true).
+    """
+    since = request.args.get('since', '')
+    version = result_cache.get_or_compute(('reference-version',), _read_reference_version)
+    if version is not None and request.if_none_match.contains(version):
+        return _reference_headers(Response(status=304), version)
+    version, body = result_cache.get_or_compute(('reference', since), lambda: _reference_body(since))
+    return _reference_headers(Response(body, mimetype='application/json'), version)
 
 
 # ── Types d'activité ──
@@ -1,7 +1,7 @@
 """Routes du module Stock — CRUD articles, mouvements, catégories, fournisseurs, inventaire."""
 
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
-from models import get_db, init_db
+from models import get_db, init_db, begin_immediate
 from datetime import datetime
 
 bp = Blueprint('stock', __name__, url_prefix='/stock')
@@ -11,6 +11,36 @@ def _rows_to_list(rows):
     return [dict(r) for r in rows]
 
 
+def _apply_stock_mouvement(db, article_id, type_mvt, quantite, source, utilisateur='', notes=''):
+    """Applique une entrée / sortie au stock d'un article actif et l'inscrit au journal.
+
+    La quantité est modifiée par la base elle-même (``quantite_actuelle ± ?``,
+    RETURNING) : deux mouvements simultanés ne peuvent pas s'écraser. Appelée
+    après begin_immediate(), la quantité « avant » lue ici est exactement celle
+    que l'UPDATE modifie : le journal s'enchaîne (avant = après du mouvement précédent).
+    Retourne (avant, après), ou None si l'article est introuvable ou inactif.
+    """
+    article = db.execute(
+        'SELECT quantite_actuelle FROM stock_articles WHERE id=? AND actif=1', (article_id,)
+    ).fetchone()
+    if not article:
+        return None
+    delta = -quantite if type_mvt == 'sortie' else quantite
+    apres = db.execute('''
+        UPDATE stock_articles
+        SET quantite_actuelle = quantite_actuelle + ?, date_modification = datetime('now','localtime')
+        WHERE id = ?
+        RETURNING quantite_actuelle
+    ''', (delta, article_id)).fetchall()[0]['quantite_actuelle']
+    avant = article['quantite_actuelle']
+    db.execute('''
+        INSERT INTO stock_mouvements
+        (article_id, type, quantite, quantite_avant, quantite_apres, source, utilisateur, notes)
+        VALUES (?,?,?,?,?,?,?,?)
+    ''', (article_id, type_mvt, quantite, avant, apres, source, utilisateur, notes))
+    return avant, apres
+
+
 def _parse_materiau_ids(data, is_json):
     """Normalise une liste d'IDs matériaux depuis JSON ou formulaire."""
     raw_values = []
@@ -389,7 +419,7 @@ def stock_categories():
         # Auto-répare les installations où les catégories seraient vides après reset.
         if not categories:
             db.close()
-            init_db()
+            init_db(force=True)
             db = get_db()
             categories = db.execute('''
                 SELECT t.*, COUNT(a.id) AS nb_articles
@@ -583,33 +613,17 @@ def api_stock_add_mouvement():
         if quantite <= 0:
             return jsonify({'success': False, 'error': 'Quantité invalide'}), 400
 
-        article = db.execute(
-            'SELECT quantite_actuelle FROM stock_articles WHERE id=? AND actif=1',
-            (article_id,)
-        ).fetchone()
-        if not article:
-            return jsonify({'success': False, 'error': 'Article introuvable'}), 404
-
-        avant = article['quantite_actuelle']
-        if type_mvt == 'sortie':
-            apres = avant - quantite
-        else:
-            apres = avant + quantite
-
-        db.execute('''
-            INSERT INTO stock_mouvements
-            (article_id, type, quantite, quantite_avant, quantite_apres, source, utilisateur, notes)
-            VALUES (?,?,?,?,?,?,?,?)
-        ''', (
-            article_id, type_mvt, quantite, avant, apres,
+        begin_immediate(db)
+        applied = _apply_stock_mouvement(
+            db, article_id, type_mvt, quantite,
             data.get('source', 'manuel'),
             (data.get('utilisateur') or '').strip(),
             (data.get('notes') or '').strip(),
-        ))
-        db.execute(
-            'UPDATE stock_articles SET quantite_actuelle=?, date_modification=? WHERE id=?',
-            (apres, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), article_id)
         )
+        if applied is None:
+            db.rollback()
+            return jsonify({'success': False, 'error': 'Article introuvable'}), 404
+        avant, apres = applied
         db.commit()
 
         if request.is_json:
@@ -640,6 +654,8 @@ def api_stock_validate_inventaire():
     db = get_db()
     try:
         data = request.get_json() if request.is_json else request.form
+        # Écart calculé et appliqué sous le même verrou d'écriture
+        begin_immediate(db)
         articles = db.execute(
             'SELECT id, nom, quantite_actuelle FROM stock_articles WHERE actif=1'
         ).fetchall()
@@ -691,7 +707,7 @@ def api_stock_categories():
         rows = db.execute('SELECT * FROM types_activite WHERE actif = 1 ORDER BY nom').fetchall()
         if not rows:
             db.close()
-            init_db()
+            init_db(force=True)
             db = get_db()
             rows = db.execute('SELECT * FROM types_activite WHERE actif = 1 ORDER BY nom').fetchall()
         # Si aucune catégorie active, renvoyer aussi les inactives pour éviter une UI vide.
@@ -0,0 +1,193 @@
+"""
+scheduler.py — Tâches de fond planifiées (sauvegardes automatiques…)
+Un thread unique, à priorité réduite, vérifie périodiquement si une tâche est
+due et l'exécute hors du chemin des requêtes. Chaque exécution prend un bail
+dans la table ``jobs`` (migration 6) : une seule exécution à la fois, y compris
+entre plusieurs processus servant la même base, et un état consultable
+(dernier début/fin, durée, résultat, erreur) qui survit aux redémarrages.
+Un bail expiré (processus tué en pleine tâche) est repris. Une tâche planifiée
+en échec n'est retentée qu'après ``retry_delay`` (ex. partage de sauvegarde
+injoignable : pas un instantané complet par minute tant que dure la panne).
+"""
+
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import get_db
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de vérification des tâches dues (secondes)
+CHECK_INTERVAL = float(os.environ.get("FABTRACK_SCHEDULER_INTERVAL", "60"))
+# Durée max d'une exécution avant que son bail soit considéré abandonné
+LEASE_SECONDS = 3600
+# Délai avant de relancer une tâche planifiée dont la dernière exécution a échoué (secondes)
+RETRY_DELAY = float(os.environ.get("FABTRACK_SCHEDULER_RETRY_DELAY", "900"))
+# Gentillesse (nice) des threads de fond ; sous Linux elle abaisse aussi leur priorité d'E/S
+BACKGROUND_NICE = 10
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobBusy(Exception):
+    """La tâche est déjà en cours (ici ou dans un autre processus)."""
+
+
+def _lower_priority():
+    """Abaisse la priorité CPU/E-S du thread courant (Linux : nice par thread)."""
+    if sys.platform.startswith("linux") and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), BACKGROUND_NICE)
+        except OSError:
+            pass
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobScheduler:
+    """Registre de tâches + thread de planification (démarrage paresseux)."""
+
+    def __init__(self, interval: float = CHECK_INTERVAL):
+        self.interval = interval
+        self._jobs = {}
+        self._retry_delays = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register(self, name, fn, due_fn=None, retry_delay=RETRY_DELAY):
+        """Déclare une tâche : ``fn(**kwargs)`` retourne un résultat (str) ;
+        ``due_fn()`` dit si l'exécution planifiée est due (None = à la demande seulement) ;
+        après un échec, l'exécution planifiée attend ``retry_delay`` secondes."""
+        self._jobs[name] = (fn, due_fn)
+        self._retry_delays[name] = retry_delay
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=self._loop, name="fabtrack-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Arrêt définitif du thread de planification."""
+        self._stop.set()
+
+    def _loop(self):
+        _lower_priority()
+        while not self._stop.is_set():
+            for name, (_, due_fn) in list(self._jobs.items()):
+                try:
+                    if due_fn and due_fn() and not self._backing_off(name):
+                        self.run(name)
+                except JobBusy:
+                    pass
+                except Exception as e:
+                    logger.error(f"Tâche planifiée '{name}' en échec : {e}")
+            self._stop.wait(self.interval)
+
+    def trigger(self, name, **kwargs):
+        """Lance la tâche en arrière-plan ; JobBusy si elle tourne déjà.
+
+        Le bail est pris avant de rendre la main : un appel à status() juste
+        après voit déjà la tâche « running ».
+        """
+        if not self._acquire(name):
+            raise JobBusy(name)
+
+        def background():
+            _lower_priority()
+            try:
+                self._execute(name, kwargs)
+            except Exception as e:
+                logger.error(f"Tâche '{name}' en échec : {e}")
+        threading.Thread(target=background, name=f"fabtrack-job-{name}", daemon=True).start()
+
+    def run(self, name, wait=0.0, **kwargs):
+        """Exécute la tâche dans le thread courant, sous bail.
+
+        ``wait`` : secondes d'attente max si elle tourne déjà ailleurs (sinon JobBusy).
+        """
+        deadline = time.monotonic() + wait
+        while not self._acquire(name):
+            if time.monotonic() >= deadline:
+                raise JobBusy(name)
+            time.sleep(0.5)
+        return self._execute(name, kwargs)
+
+    def _backing_off(self, name):
+        """Vrai si la dernière exécution a échoué il y a moins de ``retry_delay``."""
+        db = get_db()
+        try:
+            row = db.execute("SELECT status, last_finished_at FROM jobs WHERE name = ?",
+                             (name,)).fetchone()
+        finally:
+            db.close()
+        if row is None or row["status"] != "error" or not row["last_finished_at"]:
+            return False
+        try:
+            finished = datetime.fromisoformat(row["last_finished_at"])
+        except ValueError:
+            return False
+        return datetime.now() < finished + timedelta(seconds=self._retry_delays.get(name, RETRY_DELAY))
+
+    def _execute(self, name, kwargs):
+        fn, _ = self._jobs[name]
+        t0 = time.monotonic()
+        try:
+            result = fn(**kwargs)
+        except Exception as e:
+            self._finish(name, t0, error=str(e) or e.__class__.__name__)
+            raise
+        self._finish(name, t0, result=result)
+        return result
+
+    def _acquire(self, name):
+        now = datetime.now()
+        db = get_db()
+        try:
+            db.execute("INSERT OR IGNORE INTO jobs (name) VALUES (?)", (name,))
+            cur = db.execute('''
+                UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, last_started_at = ?
+                WHERE name = ? AND (status != 'running' OR lease_until < ?)
+            ''', (_OWNER, (now + timedelta(seconds=LEASE_SECONDS)).isoformat(timespec="seconds"),
+                  now.isoformat(timespec="seconds"), name, now.isoformat(timespec="seconds")))
+            db.commit()
+            return cur.rowcount == 1
+        finally:
+            db.close()
+
+    def _finish(self, name, t0, result=None, error=None):
+        db = get_db()
+        try:
+            db.execute('''
+                UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL,
+                    last_finished_at = ?, last_duration_ms = ?, last_result = ?, last_error = ?,
+                    runs = runs + 1, failures = failures + ?
+                WHERE name = ? AND owner = ?
+            ''', ("error" if error else "ok", _now(), int((time.monotonic() - t0) * 1000),
+                  result, error, 1 if error else 0, name, _OWNER))
+            db.commit()
+        finally:
+            db.close()
+
+    def status(self, name):
+        """État persistant de la tâche (dict), ``status`` = idle si jamais exécutée."""
+        db = get_db()
+        try:
+            row = db.execute("SELECT * FROM jobs WHERE name = ?", (name,)).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            return {"name": name, "status": "idle", "runs": 0, "failures": 0}
+        return dict(row)
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,200 @@
+"""
+telemetry.py — Historique des relevés Raise3D (séries temporelles)
+Températures (plateau, buses), progression et running_status de chaque
+imprimante, alimentés par le thread de relevé de raise3d.py.
+
+Stockage : base SQLite dédiée (data/raise3d_telemetry.db) pour que ces
+écritures fréquentes ne touchent ni la base principale (sauvegardes, cache
+de résultats) ni ses connexions. Trois niveaux de résolution :
+  tier 0   — relevés bruts          (rétention 24 h par défaut)
+  tier 60  — moyennes à la minute   (7 jours)
+  tier 900 — moyennes au 1/4 d'heure (90 jours)
+Chaque ligne stocke des sommes et un effectif ``n`` : un niveau se met à
+jour par UPSERT et se ré-agrège à n'importe quel pas à la lecture.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import models
+import raise3d
+
+logger = logging.getLogger(__name__)
+
+TIERS = (0, 60, 900)
+RETENTION = {
+    0:   int(os.environ.get("FABTRACK_TELEMETRY_RAW_HOURS", "24")) * 3600,
+    60:  int(os.environ.get("FABTRACK_TELEMETRY_MINUTE_DAYS", "7")) * 86400,
+    900: int(os.environ.get("FABTRACK_TELEMETRY_QUARTER_DAYS", "90")) * 86400,
+}
+# Écritures groupées : vidage du tampon toutes les FLUSH_EVERY secondes ou à BATCH_MAX relevés
+FLUSH_EVERY = float(os.environ.get("FABTRACK_TELEMETRY_FLUSH_EVERY", "60"))
+BATCH_MAX = int(os.environ.get("FABTRACK_TELEMETRY_BATCH_MAX", "200"))
+# Purge des données expirées au plus une fois par EXPIRE_EVERY secondes
+EXPIRE_EVERY = 3600
+
+_FIELDS = ("heatbed", "nozzle1", "nozzle2", "progress")
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS raise3d_telemetry (
+        printer_id TEXT NOT NULL,
+        tier INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        heatbed REAL NOT NULL,
+        nozzle1 REAL NOT NULL,
+        nozzle2 REAL NOT NULL,
+        progress REAL NOT NULL,
+        running_status TEXT,
+        PRIMARY KEY (printer_id, tier, ts)
+    ) WITHOUT ROWID;
+'''
+
+_UPSERT = '''
+    INSERT INTO raise3d_telemetry
+        (printer_id, tier, ts, n, heatbed, nozzle1, nozzle2, progress, running_status)
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT(printer_id, tier, ts) DO UPDATE SET
+        n = n + 1,
+        heatbed = heatbed + excluded.heatbed,
+        nozzle1 = nozzle1 + excluded.nozzle1,
+        nozzle2 = nozzle2 + excluded.nozzle2,
+        progress = progress + excluded.progress,
+        running_status = excluded.running_status
+'''
+
+
+class TelemetryStore:
+    """Tampon d'écriture + base de séries temporelles (thread-safe)."""
+
+    def __init__(self, path: str | None = None, poll_interval: float = 15):
+        self._path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._buffer: list = []
+        self._last_flush = time.monotonic()
+        self._last_expire = 0.0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            path = self._path or os.path.join(models.DATA_DIR, "raise3d_telemetry.db")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, timeout=models.DB_BUSY_TIMEOUT_MS / 1000,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record(self, printers: list, updated_at: float | None = None) -> None:
+        """Met en tampon un relevé (imprimantes en ligne seulement) ; vide si dû."""
+        ts = int(updated_at or time.time())
+        with self._lock:
+            for p in printers:
+                if not p.get("online"):
+                    continue
+                self._buffer.append((p["id"], ts, float(p.get("heatbed_cur") or 0),
+                                     float(p.get("nozzle1_cur") or 0), float(p.get("nozzle2_cur") or 0),
+                                     float(p.get("print_progress") or 0), p.get("running_status")))
+            due = (len(self._buffer) >= BATCH_MAX
+                   or time.monotonic() - self._last_flush >= FLUSH_EVERY)
+        if due:
+            self.flush()
+
+    def flush(self) -> int:
+        """Écrit le tampon dans les trois niveaux en une transaction ; retourne le nombre de relevés."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not batch:
+                return 0
+            rows = [
+                (pid, tier, ts - ts % tier if tier else ts, *values)
+                for tier in TIERS
+                for pid, ts, *values in sorted(batch, key=lambda b: b[1])
+            ]
+            conn = self._db()
+            try:
+                conn.executemany(_UPSERT, rows)
+                if time.monotonic() - self._last_expire >= EXPIRE_EVERY:
+                    self._expire(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Telemetry flush error: {e}")
+                return 0
+            return len(batch)
+
+    def _expire(self, conn, now: float | None = None) -> None:
+        now = now or time.time()
+        for tier, keep in RETENTION.items():
+            conn.execute("DELETE FROM raise3d_telemetry WHERE tier = ? AND ts < ?",
+                         (tier, int(now - keep)))
+        self._last_expire = time.monotonic()
+
+    def expire(self, now: float | None = None) -> None:
+        """Supprime les points au-delà de la rétention de chaque niveau."""
+        with self._lock:
+            conn = self._db()
+            self._expire(conn, now)
+            conn.commit()
+
+    def _pick_tier(self, start: int, end: int, max_points: int, now: float) -> int:
+        """Niveau le plus fin qui couvre ``start`` et tient en ``max_points`` points."""
+        for tier in TIERS:
+            step = tier or self.poll_interval
+            if start >= now - RETENTION[tier] and (end - start) / step <= max_points:
+                return tier
+        return TIERS[-1]
+
+    def query(self, printer_id: str, start: int, end: int, max_points: int = 720) -> dict:
+        """Points moyennés entre ``start`` et ``end`` (epoch s), au plus ``max_points``.
+
+        Retourne : {"printer_id", "tier", "step", "points": [{"t", "heatbed",
+                    "nozzle1", "nozzle2", "progress", "running_status"}]}
+        """
+        self.flush()
+        max_points = max(1, max_points)
+        tier = self._pick_tier(start, end, max_points, time.time())
+        step = max(tier or 1, -(-(end - start) // max_points))
+        with self._lock:
+            rows = self._db().execute('''
+                SELECT ts, n, heatbed, nozzle1, nozzle2, progress, running_status
+                FROM raise3d_telemetry
+                WHERE printer_id = ? AND tier = ? AND ts >= ? AND ts <= ?
+                ORDER BY ts''', (printer_id, tier, start, end)).fetchall()
+
+        points, bucket = [], None
+        for ts, n, *values in rows:
+            b = start + (ts - start) // step * step
+            if bucket is None or bucket[0] != b:
+                bucket = [b, 0, [0.0] * len(_FIELDS), None]
+                points.append(bucket)
+            bucket[1] += n
+            bucket[2] = [acc + v for acc, v in zip(bucket[2], values[:-1])]
+            bucket[3] = values[-1]
+        return {
+            "printer_id": printer_id,
+            "tier": tier,
+            "step": step,
+            "points": [
+                {"t": datetime.fromtimestamp(b).isoformat(timespec="seconds"),
+                 **{f: round(s / n, 1) for f, s in zip(_FIELDS, sums)},
+                 "running_status": status}
+                for b, n, sums, status in points
+            ],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+store = TelemetryStore(poll_interval=raise3d.POLL_INTERVAL)
@@ -0,0 +1,78 @@
+"""Fausse imprimante Raise3D (API Remote Access v1) pour les tests hors ligne.
+
+Chaque instance écoute sur 127.0.0.1:<port libre> et répond après ``latency``
+secondes, ce qui permet de mesurer le gain du parallélisme sans matériel :
+
+    with FakePrinter(latency=0.1) as fp:
+        raise3d.get_all_status(printers=[fp.printer_config("p1")])
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+_RESPONSES = {
+    "/v1/login": {"status": 1, "data": {"token": "fake-token"}},
+    "/v1/printer/runningstatus": {"status": 1, "data": {"running_status": "running"}},
+    "/v1/printer/basic": {"status": 1, "data": {"heatbed_cur_temp": 60.2, "heatbed_tar_temp": 60}},
+    "/v1/printer/nozzle1": {"status": 1, "data": {"nozzle_cur_temp": 210.4, "nozzle_tar_temp": 210}},
+    "/v1/printer/nozzle2": {"status": 1, "data": {"nozzle_cur_temp": 25.0, "nozzle_tar_temp": 0}},
+    "/v1/job/currentjob": {"status": 1, "data": {
+        "job_status": "running", "file_name": "/sd/piece.gcode", "print_progress": 0.42,
+        "printed_layer": 42, "total_layer": 100, "printed_time": 1200, "total_time": 3000}},
+}
+
+
+class FakePrinter:
+    def __init__(self, latency=0.0, drop_idle=False):
+        self.latency = latency
+        # drop_idle : ferme la connexion après chaque réponse sans l'annoncer,
+        # comme une imprimante qui coupe les connexions keep-alive inactives.
+        self.drop_idle = drop_idle
+        self.requests = []
+        self.connections = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # En-têtes et corps partent en deux écritures : sans TCP_NODELAY,
+            # Nagle + ACK retardé ajoutent ~40 ms par réponse en keep-alive.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                fake.connections += 1
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                fake.requests.append(path)
+                time.sleep(fake.latency)
+                body = json.dumps(_RESPONSES.get(path, {"status": 0})).encode()
+                self.send_response(200 if path in _RESPONSES else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                if fake.drop_idle:
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.address = f"127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def printer_config(self, printer_id):
+        return {"id": printer_id, "name": f"Fake {printer_id}", "ip": self.address, "password": "x"}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
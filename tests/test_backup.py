@@ -0,0 +1,190 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import app as app_module
+import backups
+import models
+
+
+class OnlineBackupTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH, models.BACKUP_PAGES_PER_STEP
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-backup-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.BACKUP_PAGES_PER_STEP = 4
+        models.init_db()
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH, models.BACKUP_PAGES_PER_STEP = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_snapshot_includes_wal_content(self):
+        db = models.get_db()
+        try:
+            db.execute("INSERT INTO classes (nom) VALUES ('Sauvegarde WAL')")
+            db.commit()
+            # Écriture encore dans le -wal : une copie du seul fichier la perdrait
+            self.assertGreater(os.path.getsize(models.DB_PATH + "-wal"), 0)
+        finally:
+            db.close()
+
+        steps = []
+        dest = os.path.join(self._tmpdir, "snap.fabtrack")
+        models.backup_database(dest, progress=lambda done, total: steps.append((done, total)))
+
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(steps[-1][0], steps[-1][1])
+        self.assertFalse(os.path.exists(dest + ".part"))
+        conn = sqlite3.connect(dest)
+        try:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM classes WHERE nom = 'Sauvegarde WAL'").fetchone()[0], 1)
+        finally:
+            conn.close()
+
+    def test_backup_restarted_by_writers_falls_back_to_one_step(self):
+        self._insert_classes(2000, "Classe")
+        writer = sqlite3.connect(models.DB_PATH)
+        calls = []
+
+        def busy_writer(done, total):
+            # Une écriture d'une autre connexion à chaque étape : la copie par
+            # étapes repartirait de zéro indéfiniment
+            calls.append(done)
+            writer.execute("INSERT INTO classes (nom) VALUES (?)", (f"Concurrente {len(calls)}",))
+            writer.commit()
+
+        dest = os.path.join(self._tmpdir, "snap.fabtrack")
+        try:
+            with self.assertLogs("models", level="WARNING"):
+                models.backup_database(dest, progress=busy_writer)
+        finally:
+            writer.close()
+
+        self.assertLessEqual(len(calls), models.BACKUP_MAX_RESTARTS + 2)
+        conn = sqlite3.connect(dest)
+        try:
+            self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            self.assertGreaterEqual(conn.execute("SELECT COUNT(*) FROM classes WHERE nom LIKE 'Classe %'")
+                                    .fetchone()[0], 2000)
+        finally:
+            conn.close()
+
+    def _insert_classes(self, n, prefix):
+        db = models.get_db()
+        try:
+            db.executemany("INSERT INTO classes (nom) VALUES (?)", [(f"{prefix} {i}",) for i in range(n)])
+            db.commit()
+        finally:
+            db.close()
+
+    def test_incremental_chain_restores_exact_snapshot(self):
+        self._insert_classes(2000, "Classe")
+        folder = os.path.join(self._tmpdir, "backups")
+        os.makedirs(folder)
+        snap1, snap2 = (os.path.join(self._tmpdir, f"snap{i}.db") for i in (1, 2))
+
+        models.backup_database(snap1)
+        full = backups.write_backup(snap1, os.path.join(folder, "full.fabtrack"), "gzip")
+        self._insert_classes(3, "Nouvelle")
+        models.backup_database(snap2)
+        delta = backups.write_backup(snap2, os.path.join(folder, "delta.fabtrack"), "lzma",
+                                     base="full.fabtrack", previous=full)
+
+        self.assertLess(delta["pages_written"], full["pages_written"] / 4)
+        self.assertEqual(backups.read_header(os.path.join(folder, "delta.fabtrack"))["base"], "full.fabtrack")
+        restored = os.path.join(self._tmpdir, "restored.db")
+        backups.restore(os.path.join(folder, "delta.fabtrack"), folder, restored)
+        with open(restored, "rb") as a, open(snap2, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+
+        self.assertEqual(backups.dependents(folder, "full.fabtrack"), ["delta.fabtrack"])
+        os.remove(os.path.join(folder, "full.fabtrack"))
+        with self.assertRaises(backups.BackupChainError):
+            backups.restore(os.path.join(folder, "delta.fabtrack"), folder, restored)
+
+    def test_prune_removes_whole_chains(self):
+        folder = os.path.join(self._tmpdir, "backups")
+        os.makedirs(folder)
+        snap = os.path.join(self._tmpdir, "snap.db")
+        models.backup_database(snap)
+        names, state = [], None
+        for i in range(5):
+            name = f"b{i}.fabtrack"
+            base = None if i in (0, 3) else names[-1]
+            state = backups.write_backup(snap, os.path.join(folder, name), "gzip",
+                                         base=base, previous=state if base else None)
+            os.utime(os.path.join(folder, name), (1000 + i, 1000 + i))
+            names.append(name)
+        backups.prune(folder, 3, keep="b4.fabtrack")
+        self.assertEqual(sorted(os.listdir(folder)), ["b3.fabtrack", "b4.fabtrack"])
+
+
+class ExportCurrentTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-export-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _snapshots(self):
+        return [n for n in os.listdir(self._tmpdir) if n.endswith(".fabtrack")]
+
+    def test_snapshot_is_streamed_from_disk_and_removed_on_close(self):
+        db = models.get_db()
+        try:
+            db.execute("INSERT INTO classes (nom) VALUES ('Export direct')")
+            db.commit()
+        finally:
+            db.close()
+
+        response = self.client.get("/api/backup/export-current", buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response.headers["Content-Disposition"])
+        # Envoyé depuis le fichier temporaire : il existe tant que la réponse est ouverte
+        self.assertEqual(len(self._snapshots()), 1)
+
+        body = b"".join(response.response)
+        self.assertEqual(len(body), response.content_length)
+        response.close()
+        self.assertEqual(self._snapshots(), [])
+
+        dest = os.path.join(self._tmpdir, "download.db")
+        with open(dest, "wb") as f:
+            f.write(body)
+        conn = sqlite3.connect(dest)
+        try:
+            self.assertEqual(conn.execute(
+                "SELECT COUNT(*) FROM classes WHERE nom = 'Export direct'").fetchone()[0], 1)
+        finally:
+            conn.close()
+
+    def test_snapshot_is_removed_when_only_the_iterable_is_closed(self):
+        from routes.api_admin import api_backup_export_current
+        # Comme waitress : le serveur ferme l'itérable transmis tel quel
+        # (direct_passthrough), jamais la réponse Flask elle-même
+        with app_module.app.test_request_context("/api/backup/export-current"):
+            response = api_backup_export_current()
+        self.assertTrue(response.direct_passthrough)
+        self.assertEqual(len(self._snapshots()), 1)
+        for _ in response.response:
+            pass
+        response.response.close()
+        self.assertEqual(self._snapshots(), [])
+
+if __name__ == "__main__":
+    unittest.main()
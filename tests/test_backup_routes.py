@@ -0,0 +1,156 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import app as app_module
+import backups
+import models
+from routes import api_admin
+
+
+class BackupRoutesTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-backup-routes-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        self.folder = os.path.join(self._tmpdir, "backups")
+        os.makedirs(self.folder)
+        for attr, value in (("BACKUP_FOLDER", self.folder),
+                            ("BACKUP_STATE_PATH", os.path.join(self._tmpdir, "backup_state.json")),
+                            ("BACKUP_CONFIG_PATH", os.path.join(self._tmpdir, "backup_config.json"))):
+            patcher = mock.patch.object(api_admin, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        api_admin._save_backup_config({"incremental": True, "full_every": 3, "compression": "lzma"})
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.app.config.pop("_DB_NEEDS_REINIT", None)
+        app_module._db_initialized = True
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _add_class(self, nom):
+        db = models.get_db()
+        try:
+            db.execute("INSERT INTO classes (nom) VALUES (?)", (nom,))
+            db.commit()
+        finally:
+            db.close()
+
+    def _header(self, filename):
+        return backups.read_header(os.path.join(self.folder, filename))
+
+    def test_incremental_or_full_choice(self):
+        first = api_admin._create_backup("auto_1")
+        self.assertEqual(self._header(first)["kind"], "full")
+
+        # full_every=3 : une complète puis deux incrémentales chaînées
+        self._add_class("Delta 1")
+        second = api_admin._create_backup("auto_2")
+        self._add_class("Delta 2")
+        third = api_admin._create_backup("auto_3")
+        self.assertEqual((self._header(second)["kind"], self._header(second)["base"]), ("delta", first))
+        self.assertEqual((self._header(third)["kind"], self._header(third)["base"]), ("delta", second))
+        self.assertEqual(api_admin._load_backup_state()["deltas"], 2)
+        fourth = api_admin._create_backup("auto_4")
+        self.assertEqual(self._header(fourth)["kind"], "full")
+
+        # Une sauvegarde manuelle est complète et redémarre la chaîne
+        manual = api_admin._create_backup("manuel")
+        self.assertEqual(self._header(manual)["kind"], "full")
+        self.assertEqual(api_admin._load_backup_state()["deltas"], 0)
+        after_manual = api_admin._create_backup("auto_5")
+        self.assertEqual(self._header(after_manual)["base"], manual)
+
+        # Dernière sauvegarde disparue : pas de delta sans base, complète
+        os.remove(os.path.join(self.folder, after_manual))
+        self.assertEqual(self._header(api_admin._create_backup("auto_6"))["kind"], "full")
+
+    def test_incremental_disabled_always_full(self):
+        api_admin._save_backup_config({"incremental": False, "compression": "gzip"})
+        api_admin._create_backup("auto_1")
+        second = api_admin._create_backup("auto_2")
+        self.assertEqual(self._header(second), {"kind": "full", "compression": "gzip", "base": None})
+
+    def test_backup_state_round_trip(self):
+        state = {"last": "fabtrack_auto_1.fabtrack", "page_size": 4096,
+                 "hashes": bytes(range(256)) * 2, "deltas": 2}
+        api_admin._save_backup_state(state)
+        with open(api_admin.BACKUP_STATE_PATH, encoding="utf-8") as f:
+            self.assertIsInstance(json.load(f)["hashes"], str)  # base64 dans le JSON
+        self.assertEqual(api_admin._load_backup_state(), state)
+
+        with open(api_admin.BACKUP_STATE_PATH, "w", encoding="utf-8") as f:
+            f.write("{pas du json")
+        self.assertIsNone(api_admin._load_backup_state())
+
+    def test_import_replays_compressed_delta_chain(self):
+        self._add_class("Avant sauvegarde")
+        full = api_admin._create_backup("auto_1")
+        self._add_class("Dans le delta")
+        delta = api_admin._create_backup("auto_2")
+        self.assertEqual(self._header(delta)["kind"], "delta")
+        self.assertEqual(self._header(delta)["compression"], "lzma")
+        self._add_class("Après sauvegarde")
+
+        with open(os.path.join(self.folder, delta), "rb") as f:
+            payload = f.read()
+        response = self.client.post("/api/backup/import", data={"file": (io.BytesIO(payload), delta)},
+                                    content_type="multipart/form-data")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(response.get_json()["success"])
+
+        db = models.get_db()
+        try:
+            noms = {r[0] for r in db.execute("SELECT nom FROM classes")}
+        finally:
+            db.close()
+        self.assertIn("Avant sauvegarde", noms)
+        self.assertIn("Dans le delta", noms)
+        self.assertNotIn("Après sauvegarde", noms)
+        # Copie de sécurité de la base remplacée, la chaîne importée est intacte
+        self.assertTrue(any("avant_import" in n for n in os.listdir(self.folder)))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, full)))
+
+    def test_import_of_delta_without_its_base_is_rejected(self):
+        full = api_admin._create_backup("auto_1")
+        self._add_class("Dans le delta")
+        delta = api_admin._create_backup("auto_2")
+        with open(os.path.join(self.folder, delta), "rb") as f:
+            payload = f.read()
+        os.remove(os.path.join(self.folder, full))
+
+        response = self.client.post("/api/backup/import", data={"file": (io.BytesIO(payload), delta)},
+                                    content_type="multipart/form-data")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()["success"])
+
+    def test_delete_refuses_base_still_needed(self):
+        full = api_admin._create_backup("auto_1")
+        self._add_class("Dans le delta")
+        delta = api_admin._create_backup("auto_2")
+
+        response = self.client.delete(f"/api/backup/delete/{full}")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(delta, response.get_json()["error"])
+        self.assertTrue(os.path.exists(os.path.join(self.folder, full)))
+
+        self.assertEqual(self.client.delete(f"/api/backup/delete/{delta}").status_code, 200)
+        self.assertEqual(self.client.delete(f"/api/backup/delete/{full}").status_code, 200)
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import app as app_module
+import models
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-pool-tests-")
+        self.path = os.path.join(self._tmpdir, "pool.db")
+        self.pool = models.ConnectionPool(max_idle=2)
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_released_connection_is_reused(self):
+        conn = self.pool.acquire(self.path)
+        conn.close()
+        self.assertIs(self.pool.acquire(self.path), conn)
+
+    def test_dead_connection_is_replaced_by_health_check(self):
+        conn = self.pool.acquire(self.path)
+        conn.close()
+        # Fermeture « dans le dos » du pool : SELECT 1 échoue au prochain emprunt
+        sqlite3.Connection.close(conn)
+
+        fresh = self.pool.acquire(self.path)
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(fresh.execute("SELECT 1").fetchone()[0], 1)
+        self.assertIsNone(conn._pool)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        conn = self.pool.acquire(self.path)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+        self.assertTrue(conn.in_transaction)
+        conn.close()
+
+        again = self.pool.acquire(self.path)
+        self.assertIs(again, conn)
+        self.assertFalse(again.in_transaction)
+        self.assertEqual(again.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+    def test_close_all_invalidates_checked_out_connections(self):
+        idle = self.pool.acquire(self.path)
+        borrowed = self.pool.acquire(self.path)
+        idle.close()
+
+        self.pool.close_all()
+        borrowed.close()  # rendue après le changement d'époque : fermée, pas remise en pool
+
+        fresh = self.pool.acquire(self.path)
+        self.assertIsNot(fresh, idle)
+        self.assertIsNot(fresh, borrowed)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            idle.execute("SELECT 1")
+        with self.assertRaises(sqlite3.ProgrammingError):
+            borrowed.execute("SELECT 1")
+
+    def test_idle_connections_are_bounded(self):
+        conns = [self.pool.acquire(self.path) for _ in range(4)]
+        for conn in conns:
+            conn.close()
+        self.assertEqual(len(self.pool._idle), 2)
+
+
+class AppTeardownReleasesConnectionsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-pool-app-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def test_connection_is_reused_across_requests(self):
+        models.close_all_connections()
+        self.assertEqual(self.client.get("/api/consommations").status_code, 200)
+        first = list(models._pool._idle)
+        self.assertEqual(len(first), 1)
+
+        self.assertEqual(self.client.get("/api/consommations").status_code, 200)
+        self.assertEqual(len(models._pool._idle), 1)
+        self.assertIs(models._pool._idle[0], first[0])
+
+    def test_teardown_returns_unclosed_connections(self):
+        with app_module.app.app_context():
+            leaked = models.get_db()
+            leaked.execute("INSERT INTO preparateurs (nom) VALUES ('Jamais validé')")
+            self.assertIn(leaked, models._pool._checked_out())
+
+        # release_thread_connections() appelé par teardown_appcontext
+        self.assertIsNone(leaked._owner)
+        self.assertNotIn(leaked, models._pool._checked_out())
+        self.assertIn(leaked, models._pool._idle)
+        db = models.get_db()
+        try:
+            self.assertIsNone(db.execute(
+                "SELECT id FROM preparateurs WHERE nom='Jamais validé'").fetchone())
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
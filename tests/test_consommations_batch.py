@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import app as app_module
+import models
+
+
+class ConsommationBatchApiTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-batch-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def test_batch_resolves_names_and_spreads_stock_like_per_action_loop(self):
+        db = models.get_db()
+        try:
+            prep_id = db.execute("INSERT INTO preparateurs (nom) VALUES ('Batch Prep')").lastrowid
+            mat = db.execute("SELECT id, nom FROM materiaux ORDER BY id LIMIT 1").fetchone()
+            type_row = db.execute("SELECT id, nom FROM types_activite ORDER BY id LIMIT 1").fetchone()
+            a = db.execute("INSERT INTO stock_articles (nom, unite, quantite_actuelle, materiau_id) "
+                           "VALUES ('Bobine A', 'g', 10, ?)", (mat["id"],)).lastrowid
+            b = db.execute("INSERT INTO stock_articles (nom, unite, quantite_actuelle, materiau_id) "
+                           "VALUES ('Bobine B', 'g', 9, ?)", (mat["id"],)).lastrowid
+            db.commit()
+        finally:
+            db.close()
+
+        action = {"type_activite_id": type_row["id"], "materiau_id": str(mat["id"]), "poids_grammes": 3}
+        response = self.client.post("/api/consommations/batch", json={
+            "preparateur_id": prep_id,
+            "actions": [action, action, dict(action, materiau_id=None), action],
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        body = response.get_json()
+        self.assertEqual(body["count"], 4)
+        self.assertEqual([r["id"] for r in body["results"]], body["ids"])
+        # Même choix d'article que la boucle historique : A(10) -> B(9) -> A(7)
+        self.assertEqual([r["stock"] and r["stock"]["article_id"] for r in body["results"]], [a, b, None, a])
+
+        db = models.get_db()
+        try:
+            rows = db.execute(
+                f"SELECT id, nom_preparateur, nom_type_activite, nom_materiau FROM consommations "
+                f"WHERE id IN ({','.join('?' * 4)}) ORDER BY id", body["ids"]).fetchall()
+            stock = dict(db.execute("SELECT id, quantite_actuelle FROM stock_articles WHERE id IN (?, ?)", (a, b)))
+            notes = [r[0] for r in db.execute(
+                "SELECT notes FROM stock_mouvements WHERE article_id IN (?, ?) ORDER BY id", (a, b))]
+        finally:
+            db.close()
+        self.assertEqual([r["id"] for r in rows], body["ids"])
+        self.assertEqual({r["nom_preparateur"] for r in rows}, {"Batch Prep"})
+        self.assertEqual({r["nom_type_activite"] for r in rows}, {type_row["nom"]})
+        self.assertEqual([r["nom_materiau"] for r in rows], [mat["nom"], mat["nom"], "", mat["nom"]])
+        self.assertEqual(stock, {a: 4.0, b: 6.0})
+        self.assertEqual(notes, [f"Consommation #{body['ids'][i]}" for i in (0, 1, 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
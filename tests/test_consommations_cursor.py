@@ -0,0 +1,102 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import app as app_module
+import models
+
+
+class ConsommationCursorPaginationTests(unittest.TestCase):
+    TOTAL = 23
+
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-cursor-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        db = models.get_db()
+        try:
+            db.executemany(
+                "INSERT INTO consommations (date_saisie, nom_preparateur) VALUES (?, ?)",
+                [(f"2024-03-{1 + i // 2:02d} {10 + i % 2}:00:00", f"P{i}") for i in range(cls.TOTAL)],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def _get(self, **params):
+        return self.client.get("/api/consommations", query_string=params)
+
+    def test_walking_cursor_pages_matches_offset_listing(self):
+        offset = self._get(per_page=1000).get_json()
+        expected = [row["id"] for row in offset["data"]]
+        self.assertEqual(len(expected), self.TOTAL)
+
+        seen, pages = [], 0
+        body = self._get(cursor=1, per_page=5).get_json()
+        while True:
+            pages += 1
+            self.assertLessEqual(len(body["data"]), 5)
+            seen.extend(row["id"] for row in body["data"])
+            if body["next_cursor"] is None:
+                break
+            body = self._get(after=body["next_cursor"], per_page=5).get_json()
+
+        # Ni doublon ni trou, même ordre que la pagination par OFFSET
+        self.assertEqual(pages, 5)
+        self.assertEqual(seen, expected)
+
+    def test_next_cursor_is_null_on_last_page(self):
+        body = self._get(cursor=1, per_page=self.TOTAL).get_json()
+        self.assertEqual(len(body["data"]), self.TOTAL)
+        self.assertIsNone(body["next_cursor"])
+
+        body = self._get(cursor=1, per_page=self.TOTAL - 1).get_json()
+        self.assertIsNotNone(body["next_cursor"])
+        last = self._get(after=body["next_cursor"], per_page=self.TOTAL - 1).get_json()
+        self.assertEqual(len(last["data"]), 1)
+        self.assertIsNone(last["next_cursor"])
+
+    def test_with_total_is_opt_in(self):
+        body = self._get(cursor=1, per_page=5).get_json()
+        self.assertNotIn("total", body)
+
+        body = self._get(cursor=1, per_page=5, with_total=1).get_json()
+        self.assertEqual(body["total"], self.TOTAL)
+
+        filtered = self._get(cursor=1, per_page=5, with_total=1,
+                             date_debut="2024-03-10").get_json()
+        self.assertEqual(filtered["total"], 5)
+        self.assertTrue(all(row["date_saisie"] >= "2024-03-10" for row in filtered["data"]))
+
+    def test_malformed_or_tampered_cursor_returns_400(self):
+        tampered = base64.urlsafe_b64encode(
+            json.dumps(["2024-03-05 10:00:00", "pas-un-id"]).encode("utf-8")
+        ).decode("ascii").rstrip("=")
+        for token in ("!!!", "bm9uLWpzb24", tampered):
+            response = self._get(after=token)
+            self.assertEqual(response.status_code, 400, token)
+            self.assertEqual(response.get_json()["error"], "Curseur invalide")
+
+
+if __name__ == "__main__":
+    unittest.main()
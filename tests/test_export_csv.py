@@ -0,0 +1,115 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import app as app_module
+import models
+from routes import api_consommations
+
+
+class StreamedCsvExportTests(unittest.TestCase):
+    TOTAL = 23
+
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-csv-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        db = models.get_db()
+        try:
+            type_id = db.execute("SELECT id FROM types_activite ORDER BY id LIMIT 1").fetchone()["id"]
+            db.executemany(
+                "INSERT INTO consommations (date_saisie, type_activite_id, nom_preparateur, "
+                "poids_grammes, nb_feuilles, commentaire) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"2024-05-{1 + i:02d} 09:30:00", type_id, f"Prép. {i}",
+                  i * 1.5 or None, i % 3 or None, 'Texte ; "guillemets"' if i % 4 == 0 else None)
+                 for i in range(cls.TOTAL)],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def _legacy_export(self):
+        """Sortie de l'ancienne implémentation : fetchall() puis un seul StringIO."""
+        db = models.get_db()
+        try:
+            rows = db.execute('''
+                SELECT c.date_saisie,
+                       COALESCE(p.nom, c.nom_preparateur) as preparateur,
+                       COALESCE(t.nom, c.nom_type_activite) as type_activite,
+                       COALESCE(m.nom, c.nom_machine) as machine,
+                       COALESCE(cl.nom, c.nom_classe) as classe,
+                       COALESCE(r.nom, c.nom_referent) as referent,
+                       r.categorie as ref_categorie,
+                       COALESCE(mat.nom, c.nom_materiau) as materiau,
+                       c.poids_grammes,c.surface_m2,c.longueur_mm,c.largeur_mm,
+                       c.epaisseur,c.nb_feuilles,c.format_papier,c.impression_couleur,
+                       c.nb_feuilles_plastique,c.type_feuille,c.projet_nom,c.commentaire
+                FROM consommations c
+                LEFT JOIN preparateurs p ON c.preparateur_id=p.id
+                LEFT JOIN types_activite t ON c.type_activite_id=t.id
+                LEFT JOIN machines m ON c.machine_id=m.id
+                LEFT JOIN classes cl ON c.classe_id=cl.id
+                LEFT JOIN referents r ON c.referent_id=r.id
+                LEFT JOIN materiaux mat ON c.materiau_id=mat.id
+                WHERE 1=1 ORDER BY c.date_saisie DESC
+            ''').fetchall()
+        finally:
+            db.close()
+        out = io.StringIO()
+        out.write('\ufeff')
+        wr = csv.writer(out, delimiter=';')
+        wr.writerow(api_consommations.EXPORT_CSV_HEADER)
+        for row in rows:
+            wr.writerow([row[k] or '' for k in row.keys()])
+        return out.getvalue()
+
+    def test_stream_matches_legacy_output_across_chunks(self):
+        with mock.patch.object(api_consommations, "EXPORT_CSV_CHUNK", 5):
+            response = self.client.get("/api/export/csv", buffered=False)
+            self.assertEqual(response.status_code, 200)
+            chunks = [c.decode("utf-8") for c in response.response]
+            response.close()
+
+        # En-tête seul, puis ceil(23 / 5) paquets de lignes
+        self.assertEqual(len(chunks), 1 + 5)
+        body = "".join(chunks)
+        self.assertTrue(body.startswith("\ufeffDate;Préparateur;Type activité;"))
+        self.assertEqual(body, self._legacy_export())
+
+        rows = list(csv.reader(io.StringIO(body.lstrip("\ufeff")), delimiter=";"))
+        self.assertEqual(rows[0], api_consommations.EXPORT_CSV_HEADER)
+        self.assertEqual(len(rows), 1 + self.TOTAL)
+        self.assertEqual(rows[1][0], "2024-05-23 09:30:00")
+        self.assertEqual(rows[-1][-1], 'Texte ; "guillemets"')
+
+    def test_filters_apply_to_streamed_rows(self):
+        response = self.client.get("/api/export/csv?date_debut=2024-05-20&date_fin=2024-05-21")
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip("\ufeff")),
+                               delimiter=";"))
+        self.assertEqual([r[0] for r in rows[1:]], ["2024-05-21 09:30:00", "2024-05-20 09:30:00"])
+        self.assertIn("attachment; filename=fabtrack_export_", response.headers["Content-Disposition"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import unittest
+
+from flask import Flask
+
+from fabsuite_core.manifest import create_fabsuite_blueprint
+
+
+def _read_events(response, count):
+    """Lit ``count`` événements (hors commentaires) du flux : [(id, event, data)]."""
+    events, chunks = [], iter(response.response)
+    while len(events) < count:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(("retry:", ":")):
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class StreamTests(unittest.TestCase):
+    def setUp(self):
+        self.state = {"value": 1, "slow": 0, "alerts": []}
+        self.bp = create_fabsuite_blueprint(
+            app_id="test", name="Test", version="1.0.0", description="",
+            widgets=[
+                {"id": "count", "label": "Count", "type": "counter", "refresh_interval": 0.1,
+                 "fn": lambda: {"value": self.state["value"]}},
+                {"id": "slow", "label": "Slow", "type": "counter", "refresh_interval": 300,
+                 "fn": lambda: {"value": self.state["slow"]}},
+            ],
+            notifications_fn=lambda: list(self.state["alerts"]),
+            stream_heartbeat=0.2,
+            stream_max_subscribers=2,
+        )
+        app = Flask(__name__)
+        app.register_blueprint(self.bp)
+        self.client = app.test_client()
+        self.opened = []
+
+    def tearDown(self):
+        for response in self.opened:
+            response.close()
+
+    def _open(self, **headers):
+        response = self.client.get("/api/fabsuite/stream", headers=headers, buffered=False)
+        self.opened.append(response)
+        return response
+
+    def test_snapshot_then_only_changed_widgets(self):
+        stream = self._open()
+        self.assertEqual(stream.mimetype, "text/event-stream")
+        snapshot = _read_events(stream, 3)
+        self.assertEqual({(e, d.get("id")) for _, e, d in snapshot},
+                         {("widget", "count"), ("widget", "slow"), ("notifications", None)})
+
+        self.state["value"] = 2
+        self.state["alerts"] = [{"type": "warning", "title": "Stock bas"}]
+        self.bp.notify_change()
+        deltas = {event: (event_id, data) for event_id, event, data in _read_events(stream, 2)}
+        self.assertEqual(deltas["widget"][1], {"id": "count", "data": {"value": 2}})
+        self.assertEqual(deltas["notifications"][1], {"notifications": self.state["alerts"]})
+        self.assertGreater(min(i for i, _ in deltas.values()), snapshot[-1][0])
+
+    def test_resume_sends_missed_events_only(self):
+        first = self._open()
+        last_id = _read_events(first, 3)[-1][0]
+        first.close()
+
+        self.state["value"] = 5
+        self.bp.notify_change()
+        resumed = self._open(**{"Last-Event-ID": str(last_id)})
+        (event_id, event, data), = _read_events(resumed, 1)
+        self.assertEqual((event, data), ("widget", {"id": "count", "data": {"value": 5}}))
+        self.assertGreater(event_id, last_id)
+
+    def test_change_signal_pushes_before_widget_ttl(self):
+        stream = self._open()
+        _read_events(stream, 3)
+        self.assertEqual(self.client.get("/api/fabsuite/widget/slow").get_json(), {"value": 0})
+
+        # Écriture juste après : poussée immédiate malgré le TTL de 300 s
+        self.state["slow"] = 7
+        self.bp.notify_change()
+        (_, event, data), = _read_events(stream, 1)
+        self.assertEqual((event, data), ("widget", {"id": "slow", "data": {"value": 7}}))
+        # Le cache HTTP du widget est rafraîchi par la même occasion
+        self.assertEqual(self.client.get("/api/fabsuite/widget/slow").get_json(), {"value": 7})
+
+    def test_heartbeat_when_idle(self):
+        stream = self._open()
+        _read_events(stream, 3)
+        self.assertEqual(next(iter(stream.response)), b": heartbeat\n\n")
+
+    def test_subscriber_limit(self):
+        self._open()
+        self._open()
+        refused = self.client.get("/api/fabsuite/stream")
+        self.assertEqual(refused.status_code, 503)
+        self.assertIn("Retry-After", refused.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
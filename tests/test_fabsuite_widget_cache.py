@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from fabsuite_core.manifest import create_fabsuite_blueprint
+
+
+class WidgetCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+        def slow_counter():
+            with self.lock:
+                self.calls += 1
+            time.sleep(0.1)
+            return {"value": self.calls, "label": "x", "unit": ""}
+
+        app = Flask(__name__)
+        app.register_blueprint(create_fabsuite_blueprint(
+            app_id="test", name="Test", version="1.0.0", description="",
+            widgets=[
+                {"id": "slow", "label": "Slow", "type": "counter", "refresh_interval": 1, "fn": slow_counter},
+                {"id": "broken", "label": "Broken", "type": "counter", "fn": lambda: 1 / 0},
+            ],
+        ))
+        self.app = app
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+
+        def hit():
+            with self.app.test_client() as client:
+                results.append(client.get("/api/fabsuite/widget/slow"))
+
+        threads = [threading.Thread(target=hit) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({r.get_json()["value"] for r in results}, {1})
+        self.assertEqual(results[0].headers["Cache-Control"], "public, max-age=1")
+        self.assertIn("Age", results[0].headers)
+
+    def test_entry_expires_after_refresh_interval(self):
+        client = self.app.test_client()
+        client.get("/api/fabsuite/widget/slow")
+        client.get("/api/fabsuite/widget/slow")
+        self.assertEqual(self.calls, 1)
+        time.sleep(1.05)
+        self.assertEqual(client.get("/api/fabsuite/widget/slow").get_json()["value"], 2)
+
+    def test_errors_are_not_cached(self):
+        client = self.app.test_client()
+        response = client.get("/api/fabsuite/widget/broken")
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn("Cache-Control", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
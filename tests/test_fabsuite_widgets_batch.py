@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+import models
+from fabsuite_core.manifest import WIDGET_IO_WORKERS, create_fabsuite_blueprint
+
+
+class WidgetBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.io_threads = set()
+
+        def slow_io():
+            self.io_threads.add(threading.current_thread().name)
+            time.sleep(0.2)
+            return {"online": True}
+
+        app = Flask(__name__)
+        app.register_blueprint(create_fabsuite_blueprint(
+            app_id="test", name="Test", version="1.0.0", description="",
+            widgets=[
+                {"id": "count", "label": "Count", "type": "counter", "fn": lambda: {"value": 3}},
+                {"id": "broken", "label": "Broken", "type": "counter", "fn": lambda: 1 / 0},
+                {"id": "io-a", "label": "A", "type": "status", "io_bound": True, "fn": slow_io},
+                {"id": "io-b", "label": "B", "type": "status", "io_bound": True, "fn": slow_io},
+            ],
+        ))
+        self.client = app.test_client()
+
+    def test_results_keyed_by_id_with_isolated_errors(self):
+        body = self.client.get("/api/fabsuite/widgets?ids=count,broken,nope").get_json()["widgets"]
+        self.assertEqual(set(body), {"count", "broken", "nope"})
+        self.assertEqual(body["count"]["data"], {"value": 3})
+        self.assertIn("duration_ms", body["count"])
+        self.assertEqual(body["broken"]["error"], "Widget error")
+        self.assertIn("not found", body["nope"]["error"])
+
+    def test_io_bound_widgets_run_in_parallel(self):
+        t0 = time.perf_counter()
+        body = self.client.get("/api/fabsuite/widgets").get_json()["widgets"]
+        elapsed = time.perf_counter() - t0
+        self.assertEqual(set(body), {"count", "broken", "io-a", "io-b"})
+        self.assertEqual(body["io-b"]["data"], {"online": True})
+        self.assertLess(elapsed, 0.35)
+
+    def test_io_bound_widgets_share_one_executor(self):
+        for _ in range(3):
+            self.client.get("/api/fabsuite/widgets?ids=io-a,io-b")
+        # Mêmes threads d'une requête à l'autre, jamais plus que le pool du module
+        self.assertLessEqual(len(self.io_threads), WIDGET_IO_WORKERS)
+        self.assertTrue(all(n.startswith("fabsuite-widget") for n in self.io_threads))
+
+
+class SharedConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-shared-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_one_checkout_for_the_whole_block(self):
+        with models.shared_connection():
+            first = models.get_db()
+            first.close()
+            second = models.get_db()
+            self.assertIs(first, second)
+            second.execute("SELECT 1").fetchone()
+            second.close()
+        self.assertFalse(first._shared)
+        self.assertIs(models.get_db(), first)  # rendue au pool, donc réutilisée
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify
+
+import instrumentation
+import models
+from fabsuite_core.manifest import create_fabsuite_blueprint
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH, instrumentation.ENABLED, instrumentation.SLOW_QUERY_MS
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-metrics-tests-")
+        models.close_all_connections()
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        instrumentation.ENABLED = True
+        instrumentation.registry.reset()
+        models.init_db()
+
+        app = Flask(__name__)
+
+        @app.route("/machines")
+        def machines():
+            db = models.get_db()
+            try:
+                rows = db.execute("SELECT id FROM machines").fetchall()
+                db.execute("SELECT COUNT(*) FROM materiaux").fetchone()
+                return jsonify(len(rows))
+            finally:
+                db.close()
+
+        app.register_blueprint(create_fabsuite_blueprint(
+            app_id="test", name="Test", version="1.0.0", description="",
+            metrics_fn=instrumentation.registry.render,
+        ))
+        instrumentation.init_app(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH, instrumentation.ENABLED, instrumentation.SLOW_QUERY_MS = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_request_and_sql_metrics_exposed(self):
+        self.client.get("/machines")
+        response = self.client.get("/api/fabsuite/metrics")
+        self.assertTrue(response.mimetype.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('fabtrack_http_request_duration_seconds_count{endpoint="machines",method="GET",status="200"} 1', text)
+        self.assertIn('fabtrack_http_request_sql_statements_count{endpoint="machines"} 1', text)
+        self.assertIn('fabtrack_sql_statements_total{statement="SELECT id FROM machines"} 1', text)
+        self.assertIn('statement="SELECT COUNT(*) FROM materiaux"', text)
+
+    def test_slow_queries_are_logged(self):
+        instrumentation.SLOW_QUERY_MS = 0.000001
+        with self.assertLogs("instrumentation", level="WARNING") as logs:
+            self.client.get("/machines")
+        self.assertTrue(any("SELECT id FROM machines" in line and "machines" in line for line in logs.output))
+
+    def test_statement_labels_have_bounded_cardinality(self):
+        instrumentation.registry.reset()
+        db = models.get_db()
+        try:
+            for ids in ((1,), (1, 2), (1, 2, 3, 4)):
+                marks = ",".join("?" * len(ids))
+                db.execute(f"SELECT id FROM machines WHERE id IN ({marks})", ids).fetchall()
+            db.executescript("CREATE TABLE IF NOT EXISTS tmp_script (x INTEGER); DROP TABLE tmp_script;")
+        finally:
+            db.close()
+        text = instrumentation.registry.render()
+        self.assertIn('fabtrack_sql_statements_total{statement="SELECT id FROM machines WHERE id IN (?)"} 3', text)
+        self.assertNotIn("IN (?,?", text)
+        self.assertIn('fabtrack_sql_statements_total{statement="executescript"} 1', text)
+        self.assertNotIn("tmp_script", text)
+
+    def test_fetchone_and_fetchmany_are_timed(self):
+        db = models.get_db()
+        try:
+            with mock.patch.object(instrumentation, "_record", wraps=instrumentation._record) as record:
+                db.execute("SELECT COUNT(*) FROM materiaux").fetchone()
+                db.execute("SELECT id FROM machines").fetchmany(2)
+        finally:
+            db.close()
+        reads = [c.args[0] for c in record.call_args_list if c.kwargs.get("executed") is False]
+        self.assertEqual(reads, ["SELECT COUNT(*) FROM materiaux", "SELECT id FROM machines"])
+
+    def test_direct_iteration_is_timed(self):
+        db = models.get_db()
+        try:
+            count = db.execute("SELECT COUNT(*) FROM machines").fetchone()[0]
+            with mock.patch.object(instrumentation, "_record", wraps=instrumentation._record) as record:
+                rows = [r["id"] for r in db.execute("SELECT id FROM machines")]
+                db.execute("SELECT id FROM machines").fetchall()
+        finally:
+            db.close()
+        self.assertEqual(len(rows), count)
+        reads = [c.args[0] for c in record.call_args_list if c.kwargs.get("executed") is False]
+        # Une mesure par ligne lue, plus la fin de l'itération ; fetchall() reste une seule mesure
+        self.assertEqual(reads, ["SELECT id FROM machines"] * (count + 2))
+
+    def test_disabled_keeps_plain_connections(self):
+        instrumentation.ENABLED = False
+        models.close_all_connections()
+        db = models.get_db()
+        try:
+            self.assertIs(type(db), models.PooledConnection)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
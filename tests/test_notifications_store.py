@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import models
+from notifications import NotificationStore
+from routes import _notifs_machines
+
+
+class NotificationStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-notif-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        self.builds = 0
+
+        def machines(db):
+            self.builds += 1
+            return _notifs_machines(db)
+
+        self.store = NotificationStore()
+        self.store.register('machines', machines)
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _set_status(self, machine_id, statut):
+        db = models.get_db()
+        try:
+            db.execute("UPDATE machines SET statut = ?, date_reparation = '' WHERE id = ?", (statut, machine_id))
+            db.commit()
+        finally:
+            db.close()
+
+    def test_rebuilds_only_after_source_change(self):
+        self.store.active()
+        self.store.active()
+        self.assertEqual(self.builds, 1)
+        db = models.get_db()
+        try:
+            db.execute("UPDATE machines SET description = 'x'")  # colonne non observée
+            db.commit()
+        finally:
+            db.close()
+        self.store.active()
+        self.assertEqual(self.builds, 1)
+        self._set_status(1, 'en_reparation')
+        self.assertEqual(len(self.store.active()), 1)
+        self.assertEqual(self.builds, 2)
+
+    def test_stable_ids_and_since_cursor(self):
+        self._set_status(1, 'en_reparation')
+        (first,), cursor = self.store.since(None)
+        self.assertEqual(first['id'], 'machine-1-en_reparation')
+
+        self._set_status(2, 'hors_service')
+        changes, cursor2 = self.store.since(cursor)
+        self.assertEqual([n['id'] for n in changes], ['machine-2-hors_service'])
+        self.assertEqual(self.store.active()[0]['created_at'], first['created_at'])
+
+        self._set_status(1, 'disponible')
+        changes, cursor3 = self.store.since(cursor2)
+        self.assertEqual([(n['id'], n['resolved_at'] is not None) for n in changes],
+                         [('machine-1-en_reparation', True)])
+        self.assertEqual(self.store.since(cursor3), ([], cursor3))
+
+    def test_unchanged_reads_do_not_bump_write_generation(self):
+        self._set_status(1, 'en_reparation')
+        self.store.active()
+        generation = models.data_generation()
+        for _ in range(3):
+            self.store.active()
+        self.store.mark_dirty('machines')  # recalcul sans changement : aucun commit
+        self.store.active()
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(models.data_generation(), generation)
+
+        # Une notification qui change est écrite, toujours sans nouvelle génération
+        self._set_status(2, 'hors_service')
+        generation = models.data_generation()
+        self.assertEqual(len(self.store.active()), 2)
+        self.assertEqual(models.data_generation(), generation)
+
+    def test_database_replaced_resyncs_daily_sources(self):
+        days = []
+        self.store.register('missions', lambda db: days.append(1) or [], daily=True)
+        models.on_database_replaced(self.store.invalidate)
+        self.addCleanup(models._replaced_hooks.remove, self.store.invalidate)
+        self.store.active()
+        self.store.active()
+        self.assertEqual((len(days), self.builds), (1, 1))
+
+        models.close_all_connections()  # comme après /api/backup/import
+        self.store.active()
+        self.assertEqual((len(days), self.builds), (2, 2))
+
+        models.reset_db()
+        self.store.active()
+        self.assertEqual(len(days), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import socket
+import unittest
+from unittest import mock
+
+import raise3d
+from fake_raise3d import FakePrinter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_open_half_open_closed_cycle_with_backoff(self):
+        clock = FakeClock()
+        breaker = raise3d.CircuitBreaker(threshold=2, base=10, max_backoff=40, clock=clock)
+
+        breaker.record_failure("Timeout")
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure("Timeout")
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertTrue(7.5 <= breaker.snapshot()["retry_in"] <= 12.5)
+
+        clock.now += 13
+        self.assertTrue(breaker.allow())           # sonde unique
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow())
+        breaker.record_failure("Timeout")          # attente doublée
+        self.assertTrue(15 <= breaker.snapshot()["retry_in"] <= 25)
+
+        clock.now += 26
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.snapshot(), {"state": "closed", "failures": 0, "retry_in": None})
+
+    def test_backoff_is_capped(self):
+        clock = FakeClock()
+        breaker = raise3d.CircuitBreaker(threshold=1, base=10, max_backoff=40, clock=clock)
+        for _ in range(6):
+            breaker.record_failure("Timeout")
+            clock.now += 100
+            breaker.allow()
+        breaker.record_failure("Timeout")
+        self.assertLessEqual(breaker.snapshot()["retry_in"], 50)
+
+
+class PrinterBreakerTests(unittest.TestCase):
+    def setUp(self):
+        raise3d._TOKEN_CACHE.clear()
+        raise3d._BREAKERS.clear()
+
+    def tearDown(self):
+        raise3d.close_connections()
+        raise3d._BREAKERS.clear()
+
+    def test_offline_printer_costs_nothing_while_open(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            dead = f"127.0.0.1:{s.getsockname()[1]}"   # port fermé : connexion refusée
+        for _ in range(raise3d.BREAKER_THRESHOLD):
+            raise3d.get_printer_status(dead, "x", timeout=1)
+
+        with mock.patch.object(raise3d, "_http_get_json") as http_get:
+            status = raise3d.get_printer_status(dead, "x", timeout=1)
+        http_get.assert_not_called()
+        self.assertFalse(status["online"])
+        self.assertEqual(status["circuit"]["state"], "open")
+
+    def test_printer_back_online_closes_the_circuit(self):
+        with FakePrinter() as fp:
+            breaker = raise3d._breaker(fp.address)
+            breaker.state, breaker.failures = "open", 3     # sonde due immédiatement
+            status = raise3d.get_printer_status(fp.address, "x", timeout=1)
+        self.assertTrue(status["online"])
+        self.assertEqual(status["circuit"]["state"], "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import time
+import unittest
+
+import raise3d
+from fake_raise3d import FakePrinter
+
+LATENCY = 0.1
+
+
+class Raise3DFanOutTests(unittest.TestCase):
+    def setUp(self):
+        raise3d._TOKEN_CACHE.clear()
+
+    def tearDown(self):
+        raise3d.close_connections()
+
+    def test_concurrent_status_costs_about_one_round_trip_per_phase(self):
+        with FakePrinter(LATENCY) as a, FakePrinter(LATENCY) as b, FakePrinter(LATENCY) as c:
+            printers = [a.printer_config("a"), b.printer_config("b"), c.printer_config("c")]
+            t0 = time.monotonic()
+            statuses = raise3d.get_all_status(timeout=2, printers=printers)
+            elapsed = time.monotonic() - t0
+
+        # Login + lecture parallèle : ~2 allers-retours, contre 3 × 6 en série.
+        self.assertLess(elapsed, 6 * LATENCY)
+        self.assertEqual([s["id"] for s in statuses], ["a", "b", "c"])
+        for s in statuses:
+            self.assertTrue(s["online"], s)
+            self.assertEqual(s["running_status"], "running")
+            self.assertEqual(s["print_progress"], 42.0)
+            self.assertEqual(s["job_file"], "piece.gcode")
+
+    def test_slow_printer_is_reported_when_budget_runs_out(self):
+        with FakePrinter(0.0) as fast, FakePrinter(3.0) as slow:
+            printers = [fast.printer_config("fast"), slow.printer_config("slow")]
+            t0 = time.monotonic()
+            statuses = raise3d.get_all_status(timeout=5, budget=0.5, printers=printers)
+            elapsed = time.monotonic() - t0
+
+        self.assertLess(elapsed, 1.5)
+        self.assertTrue(statuses[0]["online"])
+        self.assertFalse(statuses[1]["online"])
+        self.assertEqual(statuses[1]["error"], "Timeout")
+
+    def test_connections_are_kept_alive_between_polls(self):
+        with FakePrinter(0.0) as fp:
+            printers = [fp.printer_config("p")]
+            for _ in range(6):
+                statuses = raise3d.get_all_status(timeout=2, printers=printers)
+            self.assertTrue(statuses[0]["online"])
+            # 1 login + 6 × 5 lectures, sur au plus une connexion par lecture simultanée
+            self.assertEqual(len(fp.requests), 31)
+            self.assertLessEqual(fp.connections, raise3d.CONN_PER_PRINTER)
+
+    def test_connection_dropped_by_printer_is_reopened(self):
+        with FakePrinter(0.0, drop_idle=True) as fp:
+            printers = [fp.printer_config("p")]
+            for _ in range(3):
+                statuses = raise3d.get_all_status(timeout=2, printers=printers)
+                self.assertTrue(statuses[0]["online"], statuses[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import raise3d
+
+
+class StatusPollerTests(unittest.TestCase):
+    def test_snapshot_does_not_wait_for_slow_printers(self):
+        release = threading.Event()
+
+        def slow_status(timeout=5):
+            release.wait(5)
+            return [{"id": "p1", "name": "P1", "ip": "10.0.0.1", "online": False, "error": "Timeout"}]
+
+        poller = raise3d.StatusPoller(interval=60, timeout=1, stale_after=30)
+        with mock.patch.object(raise3d, "get_all_status", side_effect=slow_status):
+            t0 = time.monotonic()
+            snap = poller.snapshot()
+            self.assertLess(time.monotonic() - t0, 0.5)
+            self.assertEqual(snap["printers"], [])
+            self.assertIsNone(snap["updated_at"])
+            self.assertTrue(snap["stale"])
+
+            release.set()
+            deadline = time.monotonic() + 5
+            while poller.snapshot()["updated_at"] is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            poller.stop()
+
+        snap = poller.snapshot()
+        self.assertEqual(snap["printers"][0]["id"], "p1")
+        self.assertFalse(snap["stale"])
+        self.assertLess(snap["age_seconds"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
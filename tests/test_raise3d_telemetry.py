@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import app as app_module
+import raise3d
+import telemetry
+from routes import api_raise3d
+
+
+def _printer(ts_offset, bed):
+    return [
+        {"id": "p1", "online": True, "heatbed_cur": bed, "nozzle1_cur": 200.0,
+         "nozzle2_cur": 25.0, "print_progress": 50.0, "running_status": "running"},
+        {"id": "p2", "online": False, "error": "Timeout"},
+    ]
+
+
+class TelemetryStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-telemetry-tests-")
+        self.store = telemetry.TelemetryStore(os.path.join(self._tmpdir, "t.db"), poll_interval=15)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def test_week_of_history_is_downsampled_to_max_points(self):
+        now = int(time.time())
+        week = 7 * 86400
+        for ts in range(now - week, now, 60):
+            self.store.record(_printer(ts, 60.0 if (ts // 60) % 2 else 62.0), ts)
+        self.store.flush()
+
+        result = self.store.query("p1", now - week, now, max_points=700)
+        self.assertEqual(result["tier"], 900)
+        self.assertLessEqual(len(result["points"]), 700)
+        self.assertGreater(len(result["points"]), 600)
+        point = result["points"][len(result["points"]) // 2]
+        self.assertAlmostEqual(point["heatbed"], 61.0, delta=0.2)
+        self.assertEqual(point["running_status"], "running")
+        self.assertEqual(self.store.query("p2", now - week, now)["points"], [])
+
+    def test_recent_window_uses_raw_points(self):
+        now = int(time.time())
+        for ts in range(now - 600, now, 15):
+            self.store.record(_printer(ts, 60.0), ts)
+        result = self.store.query("p1", now - 600, now, max_points=720)
+        self.assertEqual(result["tier"], 0)
+        self.assertEqual(len(result["points"]), 40)
+
+    def test_expired_points_are_purged_per_tier(self):
+        now = int(time.time())
+        old = now - telemetry.RETENTION[0] - 3600
+        self.store.record(_printer(old, 60.0), old)
+        self.store.record(_printer(now, 60.0), now)
+        self.store.flush()
+        self.store.expire(now)
+
+        conn = self.store._db()
+        tiers = dict(conn.execute(
+            "SELECT tier, COUNT(*) FROM raise3d_telemetry WHERE ts < ? GROUP BY tier", (now - 7200,)).fetchall())
+        self.assertNotIn(0, tiers)
+        self.assertEqual(tiers.get(60), 1)
+        self.assertEqual(tiers.get(900), 1)
+
+
+class TelemetryRouteTests(unittest.TestCase):
+    def setUp(self):
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        self.client = app_module.app.test_client()
+        self.windows = []
+
+        def query(printer_id, start, end, points):
+            self.windows.append(end - start)
+            return {"printer_id": printer_id, "points": []}
+
+        for target, attr, value in ((raise3d, "get_status_snapshot", lambda: {}),
+                                    (raise3d, "RAISE3D_PRINTERS", [{"id": "p1"}]),
+                                    (telemetry.store, "query", query)):
+            patcher = mock.patch.object(target, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_huge_hours_is_clamped_to_retention(self):
+        for hours in ("1e20", "inf"):
+            response = self.client.get("/api/raise3d/telemetry", query_string={"hours": hours})
+            self.assertEqual(response.status_code, 200, hours)
+        self.assertEqual(self.windows, [api_raise3d.TELEMETRY_MAX_HOURS * 3600] * 2)
+
+    def test_invalid_hours_returns_400(self):
+        for hours in ("abc", ""):
+            response = self.client.get("/api/raise3d/telemetry", query_string={"hours": hours})
+            self.assertEqual(response.status_code, 400, hours)
+        self.assertEqual(self.windows, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
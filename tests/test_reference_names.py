@@ -0,0 +1,68 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import models
+
+
+class ReferenceNameCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-refnames-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        self.db = models.get_db()
+        self.machine_id, self.nom = self.db.execute("SELECT id, nom FROM machines ORDER BY id LIMIT 1").fetchone()
+
+    def tearDown(self):
+        self.db.close()
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _lookup(self):
+        statements = []
+        self.db.set_trace_callback(statements.append)
+        try:
+            return models.reference_names.names(self.db, "machines").get(self.machine_id), statements
+        finally:
+            self.db.set_trace_callback(None)
+
+    def test_cached_until_reference_write(self):
+        self.assertEqual(self._lookup()[0], self.nom)
+        self.assertEqual(self._lookup(), (self.nom, []))
+
+        # Écriture sans rapport : contrôle des versions, pas de rechargement
+        self.db.execute("INSERT INTO consommations (date_saisie) VALUES ('2026-01-01')")
+        self.db.commit()
+        nom, statements = self._lookup()
+        self.assertEqual((nom, len(statements)), (self.nom, 1))
+
+        self.db.execute("UPDATE machines SET nom = 'Renommée' WHERE id = ?", (self.machine_id,))
+        self.db.commit()
+        self.assertEqual(self._lookup()[0], "Renommée")
+
+    def test_rename_from_other_process_is_seen(self):
+        self._lookup()
+        other = sqlite3.connect(models.DB_PATH)
+        other.execute("UPDATE machines SET nom = 'Ailleurs' WHERE id = ?", (self.machine_id,))
+        other.commit()
+        other.close()
+        # La garde locale ne bouge qu'à la prochaine écriture validée ici
+        self.db.execute("INSERT INTO consommations (date_saisie) VALUES ('2026-01-01')")
+        self.db.commit()
+        self.assertEqual(self._lookup()[0], "Ailleurs")
+
+    def test_uncommitted_rename_does_not_leak(self):
+        self._lookup()
+        self.db.execute("UPDATE machines SET nom = 'Provisoire' WHERE id = ?", (self.machine_id,))
+        self.assertEqual(self._lookup()[0], "Provisoire")
+        self.db.rollback()
+        self.assertEqual(self._lookup()[0], self.nom)
+
+
+if __name__ == "__main__":
+    unittest.main()
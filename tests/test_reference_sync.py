@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import app as app_module
+import models
+
+
+class ReferenceSyncApiTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-refsync-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        models.result_cache.clear()
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        models.result_cache.clear()
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _write(self, *statements):
+        db = models.get_db()
+        try:
+            for sql, params in statements:
+                db.execute(sql, params)
+            db.commit()
+        finally:
+            db.close()
+
+    def test_etag_and_not_modified(self):
+        first = self.client.get("/api/reference")
+        self.assertEqual(first.status_code, 200)
+        body = first.get_json()
+        self.assertTrue(body["full"])
+        self.assertEqual(first.headers["ETag"], f'"{body["version"]}"')
+        self.assertEqual(first.headers["Cache-Control"], "no-cache")
+
+        again = self.client.get("/api/reference", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual((again.status_code, again.data), (304, b""))
+
+        self._write(("INSERT INTO classes (nom) VALUES ('Nouvelle')", ()))
+        changed = self.client.get("/api/reference", headers={"If-None-Match": first.headers["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], first.headers["ETag"])
+
+    def test_since_returns_only_changes_and_removals(self):
+        full = self.client.get("/api/reference").get_json()
+        renamed, disabled = full["machines"][0]["id"], full["machines"][1]["id"]
+        pair = full["materiau_machine"][0]
+        self._write(
+            ("UPDATE machines SET nom = 'Renommée' WHERE id = ?", (renamed,)),
+            ("UPDATE machines SET actif = 0 WHERE id = ?", (disabled,)),
+            ("DELETE FROM materiau_machine WHERE materiau_id = ? AND machine_id = ?",
+             (pair["materiau_id"], pair["machine_id"])),
+        )
+
+        delta = self.client.get(f"/api/reference?since={full['version']}").get_json()
+        self.assertFalse(delta["full"])
+        self.assertEqual([m["id"] for m in delta["machines"]], [renamed])
+        self.assertEqual(delta["machines"][0]["nom"], "Renommée")
+        self.assertEqual(delta["materiaux"], [])
+        self.assertEqual(delta["removed"], {
+            "machines": [disabled],
+            "materiau_machine": [[pair["materiau_id"], pair["machine_id"]]],
+        })
+
+        empty = self.client.get(f"/api/reference?since={delta['version']}").get_json()
+        self.assertEqual((empty["full"], empty["machines"], empty["removed"]), (False, [], {}))
+
+    def test_foreign_or_invalid_version_gets_full_payload(self):
+        version = self.client.get("/api/reference").get_json()["version"]
+        for token in ("autrebase." + version.split(".")[1], version.split(".")[0] + ".999999", "n'importe quoi"):
+            body = self.client.get("/api/reference", query_string={"since": token}).get_json()
+            self.assertTrue(body["full"], token)
+            self.assertTrue(body["machines"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, jsonify
+
+import app as app_module
+import models
+from fabsuite_core.cache import ResultCache
+
+
+class ResultCacheTests(unittest.TestCase):
+    def test_lru_eviction_and_counters(self):
+        version = [0]
+        cache = ResultCache(max_entries=2, version_fn=lambda: version[0])
+        calls = []
+
+        def compute(k):
+            return lambda: calls.append(k) or k
+
+        cache.get_or_compute("a", compute("a"))
+        cache.get_or_compute("b", compute("b"))
+        cache.get_or_compute("a", compute("a"))      # hit, "a" devient le plus récent
+        cache.get_or_compute("c", compute("c"))      # évince "b"
+        cache.get_or_compute("b", compute("b"))
+        self.assertEqual(calls, ["a", "b", "c", "b"])
+
+        version[0] += 1
+        cache.get_or_compute("b", compute("b"))      # périmé après changement de version
+        self.assertEqual(calls[-1], "b")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 5, 2))
+        self.assertEqual(stats["evictions"], 2)
+
+    def test_cached_view_keeps_status_and_headers(self):
+        cache = ResultCache(max_entries=8)
+        app = Flask(__name__)
+        calls = []
+
+        @app.route("/ok")
+        @cache.cached_view
+        def ok():
+            calls.append("ok")
+            resp = jsonify(valeur=1)
+            resp.headers["ETag"] = '"v1"'
+            resp.headers["Cache-Control"] = "private, max-age=30"
+            return resp
+
+        @app.route("/absent")
+        @cache.cached_view
+        def absent():
+            calls.append("absent")
+            return jsonify(error="introuvable"), 404
+
+        @app.route("/cookie")
+        @cache.cached_view
+        def cookie():
+            calls.append("cookie")
+            resp = jsonify(valeur=2)
+            resp.set_cookie("session", "x")
+            return resp
+
+        client = app.test_client()
+        first, second = client.get("/ok"), client.get("/ok")
+        self.assertEqual(calls, ["ok"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.get_json(), {"valeur": 1})
+        for name in ("Content-Type", "Content-Length", "ETag", "Cache-Control"):
+            self.assertEqual(second.headers[name], first.headers[name], name)
+
+        for url in ("/absent", "/absent", "/cookie", "/cookie"):
+            client.get(url)
+        self.assertEqual(calls, ["ok", "absent", "absent", "cookie", "cookie"])
+        self.assertEqual(client.get("/absent").status_code, 404)
+
+
+class ResultCacheApiTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-cache-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        models.close_all_connections()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def test_repeat_load_skips_sqlite_until_next_write(self):
+        first = self.client.get("/api/stats/summary?date_debut=2020-01-01").get_json()
+
+        statements = []
+        db = models.get_db()
+        db.set_trace_callback(statements.append)
+        db.close()
+        try:
+            again = self.client.get("/api/stats/summary?date_debut=2020-01-01").get_json()
+        finally:
+            db.set_trace_callback(None)
+        self.assertEqual(first, again)
+        self.assertEqual(statements, [])
+
+        ref = self.client.get("/api/reference").get_json()
+        response = self.client.post("/api/consommations", json={
+            "date_saisie": "2024-05-02 10:00",
+            "type_activite_id": ref["types_activite"][0]["id"],
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+
+        after = self.client.get("/api/stats/summary?date_debut=2020-01-01").get_json()
+        self.assertEqual(after["total_interventions"], first["total_interventions"] + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
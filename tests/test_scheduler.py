@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import models
+from scheduler import JobBusy, JobScheduler
+
+
+class JobSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self._orig = models.DATA_DIR, models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-scheduler-tests-")
+        models.DATA_DIR = self._tmpdir
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        self.release = threading.Event()
+        self.scheduler = JobScheduler(interval=0.05)
+
+        def slow(label="x"):
+            self.release.wait(5)
+            return f"done {label}"
+
+        def broken():
+            raise RuntimeError("disque plein")
+
+        self.scheduler.register("slow", slow)
+        self.scheduler.register("broken", broken)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.release.set()
+        models.close_all_connections()
+        models.DATA_DIR, models.DB_PATH = self._orig
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _wait_finished(self, name):
+        for _ in range(100):
+            status = self.scheduler.status(name)
+            if status["status"] != "running":
+                return status
+            time.sleep(0.02)
+        self.fail(f"{name} toujours en cours")
+
+    def test_single_run_and_persisted_state(self):
+        self.scheduler.trigger("slow", label="manuel")
+        self.assertEqual(self.scheduler.status("slow")["status"], "running")
+        with self.assertRaises(JobBusy):
+            self.scheduler.trigger("slow")
+        with self.assertRaises(JobBusy):
+            self.scheduler.run("slow", wait=0.1)
+        self.release.set()
+        status = self._wait_finished("slow")
+        self.assertEqual((status["status"], status["last_result"], status["runs"]), ("ok", "done manuel", 1))
+        self.assertIsNone(status["lease_until"])
+
+    def test_failure_recorded(self):
+        with self.assertRaises(RuntimeError):
+            self.scheduler.run("broken")
+        status = self.scheduler.status("broken")
+        self.assertEqual((status["status"], status["last_error"], status["failures"]), ("error", "disque plein", 1))
+
+    def test_due_job_runs_in_background_thread(self):
+        ran = []
+        self.scheduler.register("due", lambda: ran.append(threading.current_thread().name) or "ok",
+                                due_fn=lambda: not ran)
+        self.scheduler.start()
+        for _ in range(100):
+            if ran:
+                break
+            time.sleep(0.02)
+        self.assertEqual(ran, ["fabtrack-scheduler"])
+        self.assertEqual(self._wait_finished("due")["status"], "ok")
+
+    def test_failed_scheduled_job_waits_retry_delay(self):
+        attempts = []
+
+        def unreachable():
+            attempts.append(1)
+            raise OSError("partage injoignable")
+
+        self.scheduler.register("flaky", unreachable, due_fn=lambda: True, retry_delay=60)
+        self.scheduler.start()
+        time.sleep(0.5)  # une dizaine de vérifications
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(self.scheduler.status("flaky")["status"], "error")
+
+        # Délai écoulé : nouvelle tentative
+        db = models.get_db()
+        try:
+            db.execute("UPDATE jobs SET last_finished_at = '2000-01-01T00:00:00' WHERE name = 'flaky'")
+            db.commit()
+        finally:
+            db.close()
+        for _ in range(100):
+            if len(attempts) > 1:
+                break
+            time.sleep(0.02)
+        self.assertEqual(len(attempts), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
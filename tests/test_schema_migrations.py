@@ -0,0 +1,69 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import models
+
+
+class SchemaMigrationTests(unittest.TestCase):
+    def setUp(self):
+        self._orig_db_path = models.DB_PATH
+        self._tmpdir = tempfile.mkdtemp(prefix="fabtrack-schema-tests-")
+        models.DB_PATH = os.path.join(self._tmpdir, "fabtrack_test.db")
+
+    def tearDown(self):
+        models.close_all_connections()
+        models.DB_PATH = self._orig_db_path
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def _user_version(self):
+        db = models.get_db()
+        try:
+            return db.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            db.close()
+
+    def test_fresh_database_reaches_current_version(self):
+        models.init_db()
+        self.assertEqual(self._user_version(), models.SCHEMA_VERSION)
+
+    def test_up_to_date_database_runs_no_statement(self):
+        models.init_db()
+        statements = []
+        db = models.get_db()
+        db.set_trace_callback(statements.append)
+        db.close()
+        try:
+            models.init_db()
+        finally:
+            db.set_trace_callback(None)
+        self.assertEqual(statements, ["SELECT 1", "PRAGMA user_version"])
+
+    def test_legacy_database_without_version_is_migrated(self):
+        conn = sqlite3.connect(models.DB_PATH)
+        conn.execute("CREATE TABLE preparateurs (id INTEGER PRIMARY KEY AUTOINCREMENT, nom TEXT NOT NULL UNIQUE)")
+        conn.execute("INSERT INTO preparateurs (nom) VALUES ('Ancien')")
+        conn.commit()
+        conn.close()
+
+        models.init_db()
+
+        db = models.get_db()
+        try:
+            cols = [r[1] for r in db.execute("PRAGMA table_info(preparateurs)").fetchall()]
+            self.assertIn("image_path", cols)
+            self.assertEqual(db.execute("SELECT nom FROM preparateurs").fetchone()[0], "Ancien")
+        finally:
+            db.close()
+        self.assertEqual(self._user_version(), models.SCHEMA_VERSION)
+
+    def test_reset_rebuilds_schema(self):
+        models.init_db()
+        models.reset_db()
+        self.assertEqual(self._user_version(), models.SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
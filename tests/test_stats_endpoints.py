@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import app as app_module
+import models
+from routes import api_consommations
+
+
+class StatsEndpointTests(unittest.TestCase):
+    """Timeline et activité sur un jeu de données connu, et plans d'exécution."""
+
+    # (date_saisie, type 'A' = impression 3D en grammes / 'B' = autre, poids)
+    SEED = [
+        ("2024-01-01 09:15:00", "A", 10),   # lundi, semaine 01
+        ("2024-01-01 09:45:00", "A", 5),    # lundi, semaine 01
+        ("2024-01-03 14:00:00", "B", None), # mercredi, semaine 01
+        ("2024-01-08 09:30:00", "B", None), # lundi, semaine 02
+        ("2024-02-15 10:00:00", "A", 7),    # jeudi, semaine 07
+        ("2024-02-18 16:00:00", "A", None), # dimanche, encore semaine 07 (%W)
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-stats-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+
+        db = models.get_db()
+        try:
+            a = db.execute("SELECT id, nom FROM types_activite WHERE unite_defaut='g' ORDER BY id").fetchone()
+            b = db.execute("SELECT id, nom FROM types_activite WHERE unite_defaut<>'g' "
+                           "ORDER BY id").fetchone()
+            cls.types = {"A": (a["id"], a["nom"]), "B": (b["id"], b["nom"])}
+            db.executemany(
+                "INSERT INTO consommations (date_saisie, type_activite_id, poids_grammes) VALUES (?, ?, ?)",
+                [(d, cls.types[t][0], g) for d, t, g in cls.SEED],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def setUp(self):
+        models.result_cache.clear()
+
+    def _timeline(self, **params):
+        body = self.client.get("/api/stats/timeline", query_string=params).get_json()
+        return body, [(r["period"], r["type_nom"], r["count"]) for r in body["timeline"]]
+
+    def test_timeline_buckets_by_day_week_month(self):
+        a, b = self.types["A"][1], self.types["B"][1]
+        first, second = sorted((self.types["A"], self.types["B"]))
+        order = {first[1]: 0, second[1]: 1}
+
+        def expected(rows):
+            return sorted(rows, key=lambda r: (r[0], order[r[1]]))
+
+        _, day = self._timeline(group_by="day")
+        self.assertEqual(day, expected([
+            ("2024-01-01", a, 2), ("2024-01-03", b, 1), ("2024-01-08", b, 1),
+            ("2024-02-15", a, 1), ("2024-02-18", a, 1),
+        ]))
+
+        _, week = self._timeline(group_by="week")
+        self.assertEqual(week, expected([
+            ("2024-W01", a, 2), ("2024-W01", b, 1), ("2024-W02", b, 1), ("2024-W07", a, 2),
+        ]))
+
+        body, month = self._timeline(group_by="month")
+        self.assertEqual(month, expected([("2024-01", a, 2), ("2024-01", b, 2), ("2024-02", a, 2)]))
+        self.assertEqual([(r["period"], r["total_g"]) for r in body["timeline_3d"]],
+                         [("2024-01", 15), ("2024-02", 7)])
+        self.assertEqual(sum(count for _, _, count in month), len(self.SEED))
+
+    def test_timeline_period_bounds(self):
+        a, b = self.types["A"][1], self.types["B"][1]
+        _, month = self._timeline(group_by="month", date_debut="2024-01-02", date_fin="2024-02-15")
+        self.assertEqual(month, [("2024-01", b, 2), ("2024-02", a, 1)])
+        _, week = self._timeline(group_by="week", date_debut="2024-01-02", date_fin="2024-01-31")
+        self.assertEqual(week, [("2024-W01", b, 1), ("2024-W02", b, 1)])
+
+    def test_activity_by_hour_and_day_of_week(self):
+        body = self.client.get("/api/stats/activity").get_json()
+        self.assertEqual([(r["hour"], r["count"]) for r in body["by_hour"]],
+                         [(9, 3), (10, 1), (14, 1), (16, 1)])
+        # strftime('%w') : 0 = dimanche
+        self.assertEqual([(r["dow"], r["count"]) for r in body["by_day_of_week"]],
+                         [(0, 1), (1, 3), (3, 1), (4, 1)])
+
+        body = self.client.get("/api/stats/activity?date_debut=2024-01-02&date_fin=2024-01-31").get_json()
+        self.assertEqual([(r["hour"], r["count"]) for r in body["by_hour"]], [(9, 1), (14, 1)])
+        self.assertEqual([(r["dow"], r["count"]) for r in body["by_day_of_week"]], [(1, 1), (3, 1)])
+
+    def _plans(self, url):
+        """Plan d'exécution de chaque requête sur l'agrégat émise par ``url``."""
+        statements = []
+
+        def traced_db():
+            db = models.get_db()
+            db.set_trace_callback(statements.append)
+            return db
+
+        models.result_cache.clear()
+        with mock.patch.object(api_consommations, "get_db", traced_db):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        db = models.get_db()
+        try:
+            db.set_trace_callback(None)
+            return {sql: " | ".join(r[3] for r in db.execute("EXPLAIN QUERY PLAN " + sql))
+                    for sql in statements if "consommations_daily_agg" in sql}
+        finally:
+            db.close()
+
+    def _plan_for(self, plans, fragment):
+        matches = [plan for sql, plan in plans.items() if fragment in " ".join(sql.split())]
+        self.assertEqual(len(matches), 1, fragment)
+        return matches[0]
+
+    def test_timeline_grouping_uses_covering_bucket_indexes(self):
+        for group_by, column, index in (("month", "a.mois", "idx_agg_mois"),
+                                        ("week", "a.semaine", "idx_agg_semaine")):
+            for bounds in ("", "&date_debut=2024-01-01&date_fin=2024-02-29"):
+                plans = self._plans(f"/api/stats/timeline?group_by={group_by}{bounds}")
+                plan = self._plan_for(plans, f"SELECT {column} as period,t.nom as type_nom")
+                self.assertIn(f"USING INDEX {index}", plan)
+                self.assertNotIn("USE TEMP B-TREE FOR GROUP BY", plan)
+
+    def test_activity_grouping_uses_hour_and_dow_indexes(self):
+        plans = self._plans("/api/stats/activity")
+        by_hour = self._plan_for(plans, "SELECT NULLIF(a.heure, -1) as hour, SUM(a.nb)")
+        self.assertIn("idx_agg_heure", by_hour)
+        self.assertNotIn("USE TEMP B-TREE FOR GROUP BY", by_hour)
+        by_dow = self._plan_for(plans, "SELECT a.dow as dow")
+        self.assertIn("idx_agg_dow", by_dow)
+        self.assertNotIn("USE TEMP B-TREE FOR GROUP BY", by_dow)
+
+
+if __name__ == "__main__":
+    unittest.main()
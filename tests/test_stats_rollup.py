@@ -0,0 +1,85 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import app as app_module
+import models
+
+
+class DailyAggregateTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-rollup-tests-")
+
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        random.seed(42)
+        models.generate_demo_data()
+
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+        cls.client = app_module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def _snapshot(self, db):
+        rows = db.execute(
+            "SELECT * FROM consommations_daily_agg ORDER BY jour, heure, type_activite_id, machine_id, "
+            "materiau_id, preparateur_id, classe_id, impression"
+        ).fetchall()
+        return [tuple(round(v, 6) if isinstance(v, float) else v for v in r) for r in rows]
+
+    def assertAggregateMatchesRebuild(self):
+        db = models.get_db()
+        try:
+            maintained = self._snapshot(db)
+            models.rebuild_daily_agg(db)
+            rebuilt = self._snapshot(db)
+            db.rollback()
+        finally:
+            db.close()
+        self.assertEqual(maintained, rebuilt)
+
+    def test_triggers_follow_insert_update_delete(self):
+        db = models.get_db()
+        try:
+            ids = [r[0] for r in db.execute("SELECT id FROM consommations ORDER BY id LIMIT 10")]
+            db.execute("UPDATE consommations SET poids_grammes = COALESCE(poids_grammes, 0) + 3, "
+                       "date_saisie = '2026-02-03 09:15' WHERE id IN (?, ?, ?)", ids[:3])
+            db.execute("DELETE FROM consommations WHERE id IN (?, ?)", ids[3:5])
+            db.commit()
+        finally:
+            db.close()
+        self.assertAggregateMatchesRebuild()
+
+    def test_material_rename_reclassifies_paper(self):
+        db = models.get_db()
+        try:
+            db.execute("UPDATE materiaux SET nom = 'Papier A3 Couleur (ex N&B)' WHERE nom = 'Papier A3 N&B'")
+            db.commit()
+        finally:
+            db.close()
+        self.assertAggregateMatchesRebuild()
+
+    def test_summary_total_matches_table(self):
+        db = models.get_db()
+        try:
+            expected = db.execute("SELECT COUNT(*) FROM consommations").fetchone()[0]
+        finally:
+            db.close()
+        body = self.client.get("/api/stats/summary").get_json()
+        self.assertEqual(body["total_interventions"], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
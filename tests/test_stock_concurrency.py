@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import app as app_module
+import models
+
+THREADS = 8
+ROUNDS = 15
+INITIAL = 10000.0
+
+
+class StockConcurrencyTests(unittest.TestCase):
+    """Mouvements et consommations simultanés sur un même article : ni perte
+    de mise à jour, ni journal incohérent."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._orig_data_dir = models.DATA_DIR
+        cls._orig_db_path = models.DB_PATH
+        cls._tmpdir = tempfile.mkdtemp(prefix="fabtrack-stock-concurrency-")
+        models.DATA_DIR = cls._tmpdir
+        models.DB_PATH = os.path.join(cls._tmpdir, "fabtrack_test.db")
+        models.init_db()
+        app_module.app.config.update(TESTING=True)
+        app_module._db_initialized = True
+
+    @classmethod
+    def tearDownClass(cls):
+        models.close_all_connections()
+        models.DATA_DIR = cls._orig_data_dir
+        models.DB_PATH = cls._orig_db_path
+        shutil.rmtree(cls._tmpdir, ignore_errors=True)
+
+    def test_concurrent_movements_keep_ledger_consistent(self):
+        db = models.get_db()
+        try:
+            materiau_id = db.execute("SELECT id FROM materiaux ORDER BY id LIMIT 1").fetchone()[0]
+            article_id = db.execute(
+                "INSERT INTO stock_articles (nom, unite, quantite_actuelle, materiau_id) "
+                "VALUES ('Filament partagé', 'g', ?, ?)", (INITIAL, materiau_id)).lastrowid
+            db.commit()
+        finally:
+            db.close()
+
+        barrier = threading.Barrier(THREADS)
+        errors = []
+
+        def worker(n):
+            client = app_module.app.test_client()
+            barrier.wait()
+            for i in range(ROUNDS):
+                if (n + i) % 3 == 0:
+                    resp = client.post("/api/consommations", json={
+                        "materiau_id": materiau_id, "poids_grammes": 7, "date_saisie": "2026-01-01 10:00"})
+                    expected = 201
+                else:
+                    resp = client.post("/stock/api/mouvements", json={
+                        "article_id": article_id, "type": "entree" if i % 2 else "sortie", "quantite": 5})
+                    expected = 200
+                if resp.status_code != expected:
+                    errors.append(resp.get_data(as_text=True))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        db = models.get_db()
+        try:
+            final = db.execute("SELECT quantite_actuelle FROM stock_articles WHERE id = ?",
+                               (article_id,)).fetchone()[0]
+            ledger = db.execute(
+                "SELECT type, quantite, quantite_avant, quantite_apres FROM stock_mouvements "
+                "WHERE article_id = ? ORDER BY id", (article_id,)).fetchall()
+        finally:
+            db.close()
+
+        self.assertEqual(len(ledger), THREADS * ROUNDS)
+        expected = INITIAL
+        for mvt in ledger:
+            self.assertEqual(mvt["quantite_avant"], expected)
+            sign = 1 if mvt["type"] == "entree" else -1
+            self.assertEqual(mvt["quantite_apres"], mvt["quantite_avant"] + sign * mvt["quantite"])
+            expected = mvt["quantite_apres"]
+        self.assertEqual(final, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()